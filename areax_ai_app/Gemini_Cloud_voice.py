@@ -1,5 +1,7 @@
 import os
 from google.cloud import texttospeech,speech
+from . import provider_endpoints
+from .metering import meter
 
 # Set the path to your service account key JSON file
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "/home/tricky-shivam/Desktop/AreaX_Folder/areax_ai_project/gen-lang-client-0238752775-21032a3a2bc7.json"
@@ -7,7 +9,7 @@ os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "/home/tricky-shivam/Desktop/Area
 def text_to_speech(text, output_filename="output.mp3"):
     """Convert text to speech and save as an audio file."""
     try:
-        client = texttospeech.TextToSpeechClient()
+        client = provider_endpoints.text_to_speech_client()
 
         input_text = texttospeech.SynthesisInput(text=text)
 
@@ -21,9 +23,11 @@ def text_to_speech(text, output_filename="output.mp3"):
             speaking_rate=1
         )
 
-        response = client.synthesize_speech(
-            request={"input": input_text, "voice": voice, "audio_config": audio_config}
-        )
+        with meter("google", "text-to-speech") as usage:
+            response = client.synthesize_speech(
+                request={"input": input_text, "voice": voice, "audio_config": audio_config}
+            )
+            usage.add(characters=len(text))
 
         with open(output_filename, "wb") as out:
             out.write(response.audio_content)
@@ -46,7 +50,7 @@ def speech_to_text(audio_path: str):
     try:
         # Initialize the Speech-to-Text client
 
-        client = speech.SpeechClient()
+        client = provider_endpoints.speech_client()
 
         # Read the audio file as binary
         with open(audio_path, "rb") as audio_file:
@@ -62,7 +66,9 @@ def speech_to_text(audio_path: str):
         )
 
         # Send the request to Google API
-        response = client.recognize(config=config, audio=audio)
+        with meter("google", "speech-to-text") as usage:
+            response = client.recognize(config=config, audio=audio)
+            usage.add(audio_seconds=response.total_billed_time.total_seconds() if response.total_billed_time else 0)
         print(response,"-----------response")
         # Process the response
         if not response.results:
@@ -0,0 +1,77 @@
+import logging
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save
+
+from .models import UserEmailIndex
+
+logger = logging.getLogger(__name__)
+
+##User lookups for registration and login. Emails are matched through
+##UserEmailIndex (normalised, unique) instead of filtering auth_user on a
+##case-folded OR, and a login fetches the user and their token in one query.
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def email_taken(email):
+    return UserEmailIndex.objects.filter(email=normalize_email(email)).exists()
+
+
+def find_login_user(identifier):
+    """
+    The user whose email or username is ``identifier`` (lowest id if both
+    match different users), with ``auth_token`` already loaded. One query:
+    the OR is over the primary key and the username index, so both sides
+    stay indexed.
+    """
+    if not identifier:
+        return None
+    email_owner = UserEmailIndex.objects.filter(email=normalize_email(identifier)).values("user_id")
+    users = list(
+        User.objects.select_related("auth_token").filter(Q(pk__in=email_owner) | Q(username=identifier))
+    )
+    return min(users, key=lambda user: user.pk) if users else None
+
+
+def create_anonymous_user():
+    """
+    A passwordless ``user_<id>`` account. The name comes from the primary key
+    after the insert, so concurrent requests can't collide the way a
+    ``count() + 1`` name can.
+    """
+    user = User(username=f"user_{uuid.uuid4().hex}")
+    user.set_unusable_password()
+    user.save()
+    try:
+        with transaction.atomic():
+            User.objects.filter(pk=user.pk).update(username=f"user_{user.pk}")
+        user.username = f"user_{user.pk}"
+    except IntegrityError:
+        pass  # Taken by an older count()-based account; keep the random name
+    return user
+
+
+def sync_email_index(sender, instance, created, update_fields=None, **kwargs):
+    # Saves that don't touch the email (last_login, password upgrades) cost nothing
+    if update_fields is not None and "email" not in update_fields:
+        return
+    email = normalize_email(instance.email)
+    if not email:
+        if not created:
+            UserEmailIndex.objects.filter(user=instance).delete()
+        return
+    try:
+        with transaction.atomic():
+            UserEmailIndex.objects.update_or_create(user=instance, defaults={"email": email})
+    except IntegrityError:
+        logger.warning("Email %s of user %s already belongs to another account; not indexed", email, instance.pk)
+
+
+def connect_signals():
+    post_save.connect(sync_email_index, sender=User, dispatch_uid="accounts_sync_email_index")
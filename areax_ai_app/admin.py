@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AIContentDb,UserInput,AIResponse,GeneratedImage,Feedback,OpenaAI_UsageDB,ImageGenerationSD_DB,ImageCaptionGeminiDB,VideoDB,UserLocation,UserPLMProfile,ChatHistory,SmartResponse,ChatSession,EnhancedSocialContent,GeminiImageEdit
+from .models import AIContentDb,UserInput,AIResponse,GeneratedImage,Feedback,OpenaAI_UsageDB,ImageGenerationSD_DB,ImageCaptionGeminiDB,VideoDB,UserLocation,UserPLMProfile,ChatHistory,SmartResponse,ChatSession,EnhancedSocialContent,GeminiImageEdit,DailyCostRollup,MonthlyCostRollup,UsageEvent,RunwayTask,ImageCacheEntry,ImageCacheStat,GooglePhotoItem,GooglePhotoSyncState,PrecomputedContent,ContentRequestStat
 
 # Register your models here.
 admin.site.register(AIContentDb)
@@ -18,5 +18,15 @@ admin.site.register(SmartResponse)
 admin.site.register(ChatSession)
 admin.site.register(EnhancedSocialContent)
 admin.site.register(GeminiImageEdit)
+admin.site.register(DailyCostRollup)
+admin.site.register(MonthlyCostRollup)
+admin.site.register(UsageEvent)
 
 
+admin.site.register(RunwayTask)
+admin.site.register(ImageCacheEntry)
+admin.site.register(ImageCacheStat)
+admin.site.register(GooglePhotoItem)
+admin.site.register(GooglePhotoSyncState)
+admin.site.register(PrecomputedContent)
+admin.site.register(ContentRequestStat)
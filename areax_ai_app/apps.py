@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class AreaxAiAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'areax_ai_app'
+
+    def ready(self):
+        from . import accounts, authentication, db_tuning, search_index, tracing
+        accounts.connect_signals()
+        authentication.connect_signals()
+        db_tuning.connect_signals()
+        search_index.connect_signals()
+        tracing.instrument_requests()
@@ -0,0 +1,157 @@
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from dotenv import load_dotenv
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+##DRF authenticators that remember successful lookups for a few seconds.
+##TokenAuthentication joins Token and User on every call, and
+##BasicAuthentication runs the full PBKDF2 password hash; both results are
+##reused for AUTH_CACHE_TTL. The caches are per process, so each entry also
+##records the user's auth generation, kept in Django's (shared) cache: a
+##logout, a deleted token or a saved user (new password, deactivation) gives
+##the user a new generation, and every worker's entries stop matching.
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+
+class _TTLCache:
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, predicate):
+        with self._lock:
+            for key in [key for key, (_expires, value) in self._entries.items() if predicate(key, value)]:
+                del self._entries[key]
+
+
+_tokens = _TTLCache(AUTH_CACHE_TTL, AUTH_CACHE_MAX_ENTRIES)  # token key -> (user, token)
+_basic = _TTLCache(AUTH_CACHE_TTL, AUTH_CACHE_MAX_ENTRIES)  # credential digest -> (user, None)
+_secret = secrets.token_bytes(32)  # Basic credentials are only kept as an HMAC under this
+
+
+def _generation_key(user_id):
+    return f"auth-generation:{user_id}"
+
+
+def _generations(user_ids):
+    """The users' current auth generations, or None when the shared cache can't be read."""
+    try:
+        return cache.get_many([_generation_key(user_id) for user_id in user_ids])
+    except Exception:
+        logger.exception("Could not read auth generations")
+        return None
+
+
+def _cached(entries, key):
+    cached = entries.get(key)
+    if cached is None:
+        return None
+    user, auth, generation = cached
+    current = _generations([user.pk])
+    if current is None or current.get(_generation_key(user.pk)) != generation:
+        return None
+    return user, auth
+
+
+def _remember(entries, key, user, auth, generation):
+    if generation is not None:
+        entries.set(key, (user, auth, generation.get(_generation_key(user.pk))))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cached = _cached(_tokens, key)
+        if cached is not None:
+            return cached
+        user_id = Token.objects.filter(key=key).values_list("user_id", flat=True).first()
+        # Read before the lookup, so a revocation racing it leaves the entry already stale
+        generation = _generations([user_id]) if user_id is not None else None
+        user, token = super().authenticate_credentials(key)
+        _remember(_tokens, key, user, token, generation)
+        return user, token
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    def authenticate_credentials(self, userid, password, request=None):
+        digest = hmac.new(_secret, f"{userid}\0{password}".encode("utf-8"), hashlib.sha256).digest()
+        cached = _cached(_basic, digest)
+        if cached is not None:
+            return cached
+        user_id = User.objects.filter(**{User.USERNAME_FIELD: userid}).values_list("pk", flat=True).first()
+        generation = _generations([user_id]) if user_id is not None else None
+        # Failures are not cached: every wrong password still pays the full hash
+        user, auth = super().authenticate_credentials(userid, password, request)
+        _remember(_basic, digest, user, auth, generation)
+        return user, auth
+
+
+def invalidate(user_id):
+    """Gives the user a new auth generation, so no worker reuses a cached authentication of theirs."""
+    try:
+        cache.set(_generation_key(user_id), uuid.uuid4().hex, timeout=None)
+    except Exception:
+        logger.exception("Could not publish the auth revocation of user %s", user_id)
+    _tokens.discard(lambda key, value: value[0].pk == user_id)
+    _basic.discard(lambda key, value: value[0].pk == user_id)
+
+
+def revoke(token):
+    """Deletes the token; the post_delete receiver invalidates its user's cached authentications."""
+    token.delete()
+
+
+def _user_saved(sender, instance, update_fields=None, **kwargs):
+    # last_login updates don't change who may authenticate
+    if update_fields is not None and not {"password", "is_active", "username"} & set(update_fields):
+        return
+    invalidate(instance.pk)
+
+
+def _user_deleted(sender, instance, **kwargs):
+    invalidate(instance.pk)
+
+
+def _token_deleted(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+
+def connect_signals():
+    post_save.connect(_user_saved, sender=User, dispatch_uid="authentication_user_saved")
+    post_delete.connect(_user_deleted, sender=User, dispatch_uid="authentication_user_deleted")
+    post_delete.connect(_token_deleted, sender=Token, dispatch_uid="authentication_token_deleted")
@@ -0,0 +1,103 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db import close_old_connections
+
+from . import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+# Shared worker pool for work that must not hold up the HTTP response
+# (thumbnail generation, uploads, ...). Size it with BACKGROUND_WORKERS.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("BACKGROUND_WORKERS", "4")),
+    thread_name_prefix="areax-bg",
+)
+metrics.QUEUE_DEPTH.set_function(lambda: _executor._work_queue.qsize(), "background_tasks")
+
+
+def _run(fn, args, kwargs):
+    # Worker threads open their own DB connections; make sure stale ones are
+    # dropped before and after each job so they don't leak across jobs.
+    close_old_connections()
+    try:
+        with tracing.task(f"task {getattr(fn, '__qualname__', fn)}"):
+            return fn(*args, **kwargs)
+    except Exception:
+        logger.exception("Background task %s failed", getattr(fn, "__name__", fn))
+        raise
+    finally:
+        close_old_connections()
+
+
+def run_in_background(fn, *args, **kwargs):
+    """
+    Schedule ``fn(*args, **kwargs)`` on the shared pool and return its Future.
+    The caller's context (trace, metering attribution) goes with it.
+    """
+    return _executor.submit(contextvars.copy_context().run, _run, fn, args, kwargs)
+
+
+def claim_due(queryset, field, now, limit, ttl=60):
+    """
+    Claims up to ``limit`` rows of ``queryset`` whose ``field`` (a next-run
+    timestamp) is due, by pushing it to a unique token time ``ttl`` seconds
+    ahead. Other processes polling the same table skip the claimed rows, and
+    rows whose worker died become due again after ``ttl``. Three queries
+    regardless of batch size.
+    """
+    due_ids = list(
+        queryset.filter(**{f"{field}__lte": now}).order_by(field).values_list("id", flat=True)[:limit]
+    )
+    if not due_ids:
+        return []
+    token = now + timedelta(seconds=ttl, microseconds=random.randrange(1, 1000000))
+    queryset.filter(id__in=due_ids, **{f"{field}__lte": now}).update(**{field: token})
+    return list(queryset.filter(id__in=due_ids, **{field: token}))
+
+
+class PeriodicWorker:
+    """
+    Runs ``tick()`` over and over on one daemon thread. ``tick`` returns how
+    many seconds to sleep before the next run (or None for ``idle_interval``);
+    ``wake()`` cuts the sleep short when new work arrives. Started lazily on
+    the first ``wake()`` so management commands and migrations never spawn it.
+    """
+
+    def __init__(self, name, tick, idle_interval=30):
+        self.name = name
+        self.tick = tick
+        self.idle_interval = idle_interval
+        self._event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        self.start()
+        self._event.set()
+
+    def _loop(self):
+        while True:
+            self._event.clear()
+            close_old_connections()
+            try:
+                delay = self.tick()
+            except Exception:
+                logger.exception("Periodic worker %s failed", self.name)
+                delay = None
+            finally:
+                close_old_connections()
+            self._event.wait(self.idle_interval if delay is None else max(0, delay))
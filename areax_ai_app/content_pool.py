@@ -0,0 +1,250 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from dotenv import load_dotenv
+from openai import OpenAI
+
+from . import metering
+from .background_tasks import run_in_background
+from .metering import meter
+from .models import ContentRequestStat, PrecomputedContent
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+##Pre-generated GPT-4 posts for the broadcast and survey-profile endpoints.
+##Their prompts only depend on a few parameters, so each requested
+##combination keeps a pool of POOL_SIZE variants. A request takes the least
+##served fresh variant; variants retire after MAX_SERVES uses or POOL_TTL,
+##and a pool running low is refilled in the background once its combination
+##has been asked for REFILL_MIN_REQUESTS times in POPULAR_DAYS (one-off
+##combinations just get their inline post). precompute_broadcast_content
+##(cron) fills the most requested pools ahead.
+POOL_SIZE = int(os.getenv("CONTENT_POOL_SIZE", "5"))
+MAX_SERVES = int(os.getenv("CONTENT_POOL_MAX_SERVES", "20"))
+POOL_TTL = int(os.getenv("CONTENT_POOL_TTL", str(6 * 3600)))
+REFILL_MIN_REQUESTS = int(os.getenv("CONTENT_POOL_REFILL_MIN_REQUESTS", "3"))
+POPULAR_DAYS = 7
+MODEL = "gpt-4"
+MAX_TOKENS = 1024
+
+KINDS = {
+    "broadcast": {
+        "defaults": {"favorite_topics": "travel"},
+        "system": "You are a highly skilled AI persona Agent Called PW_Broadcast Agent, reply based on user sentiment in complete sentences.",
+        "prompt": lambda p: (
+            f"Create a personalized, engaging, and visually appealing social media post for a user who is passionate about {p['favorite_topics']}. "
+            f"The post should feel authentic and resonate with their personality. Use a catchy caption, relevant emojis, and trending hashtags "
+            f"that fit their interests, and end with a call to action that sparks interaction."
+        ),
+    },
+    "profile": {
+        "defaults": {"age_group": "Gen Z", "favorite_topics": "travel", "platform": "Instagram"},
+        "system": "You are a highly skilled AI persona Agent Called ProjectW Agent, reply based on user sentiment in complete sentences.",
+        "prompt": lambda p: (
+            f"Create a personalized, engaging, and visually appealing social media post for a {p['age_group']} "
+            f"user who is passionate about {p['favorite_topics']}. The post should feel authentic and resonate "
+            f"with their personality, capturing attention on {p['platform']}. Use a catchy caption, relevant emojis, "
+            f"and trending hashtags that fit their interests, and end with a call to action that sparks interaction."
+        ),
+    },
+}
+
+_client = {"instance": None}
+_refilling = set()
+_lock = threading.Lock()
+
+
+def _openai():
+    if _client["instance"] is None:
+        _client["instance"] = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client["instance"]
+
+
+def request_params(kind, data):
+    """The kind's parameters from request data, with the endpoint's defaults."""
+    return {name: data.get(name, default) for name, default in KINDS[kind]["defaults"].items()}
+
+
+def build_prompt(kind, params):
+    return KINDS[kind]["prompt"](params)
+
+
+def params_key(kind, params):
+    # Case and spacing don't change the post, so "Gen Z" and "gen  z" share a pool
+    normalized = {name: " ".join(str(value).split()).casefold() for name, value in sorted(params.items())}
+    return hashlib.sha256(json.dumps([kind, normalized], separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def generate(kind, params, count=1):
+    """``count`` fresh variants from one GPT-4 call (``n`` choices share the prompt tokens)."""
+    with meter("openai", MODEL) as usage:
+        response = _openai().chat.completions.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": KINDS[kind]["system"]},
+                {"role": "user", "content": build_prompt(kind, params)},
+            ],
+            max_tokens=MAX_TOKENS,
+            n=count,
+        )
+        usage.from_openai(response)
+    return [choice.message.content.strip() for choice in response.choices if choice.message.content]
+
+
+def _count(kind, key, params, **increments):
+    """Adds to today's request counters of the combination, creating the row if needed."""
+    lookup = {"kind": kind, "params_key": key, "day": timezone.localdate()}
+    updates = {field: F(field) + amount for field, amount in increments.items()}
+    if ContentRequestStat.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            ContentRequestStat.objects.create(**lookup, params=params, **increments)
+    except IntegrityError:
+        ContentRequestStat.objects.filter(**lookup).update(**updates)
+
+
+def _available(kind, key, now):
+    return PrecomputedContent.objects.filter(
+        kind=kind, params_key=key, expires_at__gt=now, served_count__lt=MAX_SERVES,
+    )
+
+
+def _store(kind, key, params, contents, served=0):
+    now = timezone.now()
+    PrecomputedContent.objects.bulk_create([
+        PrecomputedContent(
+            kind=kind,
+            params_key=key,
+            params=params,
+            content=content,
+            served_count=served,
+            last_served_at=now if served else None,
+            expires_at=now + timedelta(seconds=POOL_TTL),
+        )
+        for content in contents
+    ])
+
+
+def _worth_pooling(kind, key):
+    """Whether the combination is asked for often enough to pre-generate variants for it."""
+    if key == params_key(kind, KINDS[kind]["defaults"]):
+        return True
+    since = timezone.localdate() - timedelta(days=POPULAR_DAYS)
+    requests = ContentRequestStat.objects.filter(
+        kind=kind, params_key=key, day__gte=since,
+    ).aggregate(total=Sum("requests"))["total"]
+    return (requests or 0) >= REFILL_MIN_REQUESTS
+
+
+def serve(kind, params):
+    """
+    A post for ``params``: ``(content, True)`` from the pool, or
+    ``(content, False)`` generated inline when the pool is empty (that post
+    seeds the pool, and a background refill fills the rest if the
+    combination is requested often enough).
+    """
+    key = params_key(kind, params)
+    now = timezone.now()
+    variant = _available(kind, key, now).order_by("served_count", "created_at").first()
+    if variant is not None:
+        PrecomputedContent.objects.filter(pk=variant.pk).update(
+            served_count=F("served_count") + 1, last_served_at=now,
+        )
+        _count(kind, key, params, requests=1, pool_hits=1)
+        # About to retire or go stale: top the pool up before it runs dry
+        if variant.served_count + 1 >= MAX_SERVES or variant.expires_at - now < timedelta(seconds=POOL_TTL / 4):
+            if _worth_pooling(kind, key):
+                schedule_refill(kind, params)
+        return variant.content, True
+
+    _count(kind, key, params, requests=1)
+    contents = generate(kind, params)
+    if not contents:
+        raise ValueError("Empty response from the model")
+    _store(kind, key, params, contents[:1], served=1)
+    if _worth_pooling(kind, key):
+        schedule_refill(kind, params)
+    return contents[0], False
+
+
+def refill(kind, params):
+    """Generates the variants missing from the combination's pool; returns how many were added."""
+    key = params_key(kind, params)
+    # Variants that will expire soon don't count, so a pool is renewed before it goes stale
+    fresh = _available(kind, key, timezone.now() + timedelta(seconds=POOL_TTL / 4)).count()
+    missing = POOL_SIZE - fresh
+    if missing <= 0:
+        return 0
+    metering.reset(endpoint=f"content_pool/{kind}")
+    contents = generate(kind, params, count=missing)
+    _store(kind, key, params, contents)
+    return len(contents)
+
+
+def _refill_once(kind, params, key):
+    try:
+        refill(kind, params)
+    finally:
+        with _lock:
+            _refilling.discard(key)
+
+
+def schedule_refill(kind, params):
+    """Queues a background refill, unless this process already has one running for the combination."""
+    key = params_key(kind, params)
+    with _lock:
+        if key in _refilling:
+            return
+        _refilling.add(key)
+    run_in_background(_refill_once, kind, params, key)
+
+
+def purge():
+    """Drops expired and fully served variants; returns how many."""
+    deleted, _ = PrecomputedContent.objects.filter(
+        Q(expires_at__lte=timezone.now()) | Q(served_count__gte=MAX_SERVES)
+    ).delete()
+    return deleted
+
+
+def popular(top=50, days=POPULAR_DAYS):
+    """
+    The ``top`` most requested ``(kind, params)`` combinations of the last
+    ``days`` days, always including each kind's defaults.
+    """
+    since = timezone.localdate() - timedelta(days=days)
+    ranked = list(
+        ContentRequestStat.objects.filter(day__gte=since)
+        .values("kind", "params_key").annotate(total=Sum("requests")).order_by("-total")[:top]
+    )
+    params_by_key = dict(
+        ContentRequestStat.objects.filter(params_key__in=[row["params_key"] for row in ranked])
+        .values_list("params_key", "params")
+    )
+    combinations = [(row["kind"], params_by_key[row["params_key"]]) for row in ranked if row["kind"] in KINDS]
+    seen = {params_key(kind, params) for kind, params in combinations}
+    for kind, spec in KINDS.items():
+        if params_key(kind, spec["defaults"]) not in seen:
+            combinations.append((kind, dict(spec["defaults"])))
+    return combinations
+
+
+def precompute(top=50, days=POPULAR_DAYS):
+    """Purges the pools, then refills the popular combinations inline. Yields ``(kind, params, added)``."""
+    purge()
+    for kind, params in popular(top, days):
+        try:
+            added = refill(kind, params)
+        except Exception:
+            logger.exception("Precomputing %s content for %s failed", kind, params)
+            added = None
+        yield kind, params, added
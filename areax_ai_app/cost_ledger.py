@@ -0,0 +1,182 @@
+import calendar
+import logging
+import os
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from dotenv import load_dotenv
+
+from .models import (AIResponse, DailyCostRollup, ImageCaptionGeminiDB, ImageGenerationSD_DB,
+                     MonthlyCostRollup, UsageEvent)
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+SERVICE_NAMES = {
+    "openai": "OpenAI_service",
+    "gemini": "Gemini_service",
+    "google": "GoogleCloud_service",
+    "huggingface": "HuggingFace_service",
+    "stability": "StabilityAI_service",
+    "runway": "RunwayML_service",
+    "modelslab": "ModelsLab_service",
+    "together": "TogetherAI_service",
+}
+
+# The ledger is fed by the metering layer (metering.UsageWriter). These are the
+# per-table sources used before metering existed; rebuild() reads them for
+# anything older than the metering cut-over.
+# provider -> (raw usage model, cost field, user email field or None)
+LEGACY_SOURCES = {
+    "openai": (AIResponse, "total_cost", "user_email"),
+    "gemini": (ImageCaptionGeminiDB, "total_cost", None),
+    "stability": (ImageGenerationSD_DB, "total_cost_in_dollar", None),
+}
+# ISO datetime metering went live; defaults to the first UsageEvent
+METERING_CUTOVER = os.getenv("METERING_CUTOVER", "")
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def _bump(model, lookup, amount, count):
+    """Adds ``count`` requests and ``amount`` to the rollup row, creating it if needed."""
+    updated = model.objects.filter(**lookup).update(
+        request_count=F("request_count") + count,
+        total_cost=F("total_cost") + amount,
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(request_count=count, total_cost=amount, **lookup)
+    except IntegrityError:
+        # Another worker created the row between our update and insert.
+        model.objects.filter(**lookup).update(
+            request_count=F("request_count") + count,
+            total_cost=F("total_cost") + amount,
+        )
+
+
+def record_cost(provider, amount, user_email=None, when=None, count=1):
+    """
+    Incrementally adds ``count`` priced requests to the daily and monthly
+    rollups. ``when`` may be a datetime or an already localised date.
+    """
+    when = when or timezone.now()
+    day = timezone.localdate(when) if isinstance(when, datetime) else when
+    amount = Decimal(str(amount or 0))
+    user_email = user_email or ""
+    with transaction.atomic():
+        _bump(DailyCostRollup, {"provider": provider, "user_email": user_email, "day": day}, amount, count)
+        _bump(MonthlyCostRollup, {"provider": provider, "user_email": user_email, "month": month_start(day)}, amount, count)
+
+
+def total_cost(provider, start, end, user_email=None):
+    """
+    Returns ``(total_cost, request_count)`` for ``provider`` between the dates
+    ``start`` and ``end`` (inclusive). Whole months inside the range are read
+    from the monthly rollup, the ragged edges from the daily one, so the
+    number of rows touched is bounded by the number of days, not requests.
+    """
+    filters = {"provider": provider}
+    if user_email is not None:
+        filters["user_email"] = user_email
+
+    first_full_month = start if start.day == 1 else month_end(start) + timedelta(days=1)
+    last_full_month = month_start(end) if end == month_end(end) else month_start(end) - timedelta(days=1)
+    last_full_month = month_start(last_full_month)
+
+    totals = {"cost": Decimal("0"), "count": 0}
+
+    def add(queryset):
+        agg = queryset.aggregate(cost=Coalesce(Sum("total_cost"), Decimal("0")), count=Coalesce(Sum("request_count"), 0))
+        totals["cost"] += agg["cost"]
+        totals["count"] += agg["count"]
+
+    if first_full_month <= last_full_month:
+        add(MonthlyCostRollup.objects.filter(month__range=(first_full_month, last_full_month), **filters))
+        if start < first_full_month:
+            add(DailyCostRollup.objects.filter(day__range=(start, first_full_month - timedelta(days=1)), **filters))
+        tail_start = month_end(last_full_month) + timedelta(days=1)
+        if tail_start <= end:
+            add(DailyCostRollup.objects.filter(day__range=(tail_start, end), **filters))
+    else:
+        add(DailyCostRollup.objects.filter(day__range=(start, end), **filters))
+
+    return totals["cost"], totals["count"]
+
+
+def metering_cutover():
+    """When the metering layer took over the ledger, or None if it has recorded nothing yet."""
+    if METERING_CUTOVER:
+        cutover = parse_datetime(METERING_CUTOVER)
+        if cutover is None:
+            raise ValueError(f"METERING_CUTOVER is not an ISO datetime: {METERING_CUTOVER!r}")
+        return timezone.make_aware(cutover) if timezone.is_naive(cutover) else cutover
+    return UsageEvent.objects.aggregate(first=Min("created_at"))["first"]
+
+
+def _add_daily(daily, source, cost_field, email_field, start, end):
+    tz = timezone.get_current_timezone()
+    rows = (
+        source
+        .filter(created_at__date__range=(start, end))
+        .annotate(day=TruncDate("created_at", tzinfo=tz))
+        .values("day", *([email_field] if email_field else []))
+        .annotate(cost=Coalesce(Sum(cost_field), Decimal("0")), count=Count("id"))
+    )
+    for row in rows:
+        key = (row[email_field] or "") if email_field else ""
+        bucket = daily.setdefault((key, row["day"]), [Decimal("0"), 0])
+        bucket[0] += row["cost"]
+        bucket[1] += row["count"]
+
+
+def rebuild(provider, start, end):
+    """
+    Periodic compactor: recomputes the rollups of ``provider`` for every month
+    touched by ``start``..``end`` straight from the raw usage rows. Rows from
+    before the metering cut-over come from the pre-metering tables, later ones
+    from UsageEvent, so months around the switch keep both halves.
+    """
+    start, end = month_start(start), month_end(end)
+    cutover = metering_cutover()
+
+    daily = {}
+    if provider in LEGACY_SOURCES:
+        model, cost_field, email_field = LEGACY_SOURCES[provider]
+        legacy = model.objects.all() if cutover is None else model.objects.filter(created_at__lt=cutover)
+        _add_daily(daily, legacy, cost_field, email_field, start, end)
+    if cutover is not None:
+        events = UsageEvent.objects.filter(provider=provider, created_at__gte=cutover)
+        _add_daily(daily, events, "total_cost", "user_email", start, end)
+
+    monthly = {}
+    for (user_email, day), (cost, count) in daily.items():
+        bucket = monthly.setdefault((user_email, month_start(day)), [Decimal("0"), 0])
+        bucket[0] += cost
+        bucket[1] += count
+
+    with transaction.atomic():
+        DailyCostRollup.objects.filter(provider=provider, day__range=(start, end)).delete()
+        MonthlyCostRollup.objects.filter(provider=provider, month__range=(start, end)).delete()
+        DailyCostRollup.objects.bulk_create([
+            DailyCostRollup(provider=provider, user_email=user_email, day=day, total_cost=cost, request_count=count)
+            for (user_email, day), (cost, count) in daily.items()
+        ])
+        MonthlyCostRollup.objects.bulk_create([
+            MonthlyCostRollup(provider=provider, user_email=user_email, month=month, total_cost=cost, request_count=count)
+            for (user_email, month), (cost, count) in monthly.items()
+        ])
+    return len(daily)
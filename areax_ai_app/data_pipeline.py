@@ -0,0 +1,267 @@
+import hashlib
+import json
+import multiprocessing
+import re
+import zlib
+from itertools import islice
+
+EXPORT_CHUNK_SIZE = 2000
+CLEAN_BATCH_SIZE = 5000
+
+# Compiled once at import. Rules work on a whole batch at a time: regexes run
+# over the batch joined into one newline-separated string, so the regex engine
+# makes a single C-level pass per batch instead of one call per row. Where a
+# str builtin is faster than a regex (whitespace, the '@' pre-check) it is
+# used per row instead.
+_SPECIAL_CHARS = re.compile(r'[^\w\s]')
+_EMAIL = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+_PHONE = re.compile(r'(?<!\w)\+?\d[\d ().-]{7,}\d(?!\w)')
+_URL = re.compile(r'https?://\S+')
+_LETTER = re.compile(r'[^\W\d_]')
+_LATIN_LETTER = re.compile(r'[A-Za-zÀ-ɏ]')
+_NON_LATIN_LETTER = re.compile(r'[^\W\d_A-Za-zÀ-ɏ]')
+_WORD = re.compile(r'\w+')
+
+
+def _join(batch):
+    # Rows never contain a raw newline once joined, so "\n" is a safe separator.
+    return "\n".join("" if text is None else text.replace("\n", " ") for text in batch)
+
+
+def _split(joined, batch):
+    return [None if original is None else line for line, original in zip(joined.split("\n"), batch)]
+
+
+##Rules: each takes a batch (list of str or None) and returns a batch of the
+##same length. None marks a dropped row.
+def scrub_pii(batch):
+    """Replaces e-mail addresses, URLs and phone numbers with placeholders."""
+    batch = [_EMAIL.sub(" EMAIL ", text) if text and "@" in text else text for text in batch]
+    joined = _URL.sub(" URL ", _join(batch))
+    joined = _PHONE.sub(" PHONE ", joined)
+    return _split(joined, batch)
+
+
+def strip_special_chars(batch):
+    """Removes every character that is neither a word character nor whitespace."""
+    return _split(_SPECIAL_CHARS.sub("", _join(batch)), batch)
+
+
+def collapse_whitespace(batch):
+    """Squeezes runs of whitespace into one space and trims the ends."""
+    return [None if text is None else " ".join(text.split()) for text in batch]
+
+
+class LengthFilter:
+    """Drops rows shorter than ``min_chars`` or longer than ``max_chars``."""
+
+    def __init__(self, min_chars=1, max_chars=None):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+
+    def __call__(self, batch):
+        return [
+            text if text is not None and len(text) >= self.min_chars
+            and (self.max_chars is None or len(text) <= self.max_chars) else None
+            for text in batch
+        ]
+
+
+class LanguageFilter:
+    """
+    Keeps rows written mostly in Latin script (English and the other languages
+    the apps are used in). This is a cheap script heuristic, not a language
+    model; ``min_ratio`` is the share of letters that must be Latin.
+    """
+
+    def __init__(self, min_ratio=0.8):
+        self.min_ratio = min_ratio
+
+    def __call__(self, batch):
+        if not _NON_LATIN_LETTER.search(_join(batch)):
+            return batch  # Common case: nothing outside Latin script at all.
+        kept = []
+        for text in batch:
+            if not text or not _NON_LATIN_LETTER.search(text):
+                kept.append(None if text is None else text)
+                continue
+            letters = len(_LETTER.findall(text))
+            latin = len(_LATIN_LETTER.findall(text))
+            kept.append(text if not letters or latin / letters >= self.min_ratio else None)
+        return kept
+
+
+DEFAULT_RULES = [strip_special_chars, collapse_whitespace]
+
+# Named rules the API can switch on; applied in this order.
+OPTIONAL_RULES = {
+    "pii": scrub_pii,
+    "lang": LanguageFilter(),
+    "length": LengthFilter(min_chars=3, max_chars=20000),
+}
+
+
+def build_rules(names=()):
+    """
+    Returns the rule list for the given optional rule names. PII scrubbing must
+    run before special characters (and so the '@' of e-mails) are stripped.
+    """
+    unknown = set(names) - set(OPTIONAL_RULES)
+    if unknown:
+        raise ValueError(f"Unknown cleaning rules: {', '.join(sorted(unknown))}")
+    rules = [OPTIONAL_RULES["pii"]] if "pii" in names else []
+    rules += DEFAULT_RULES
+    rules += [OPTIONAL_RULES[name] for name in ("lang", "length") if name in names]
+    return rules
+
+
+##De-duplication
+class HashDeduper:
+    """
+    Remembers 64-bit blake2b digests instead of the cleaned strings, so memory
+    stays flat per row no matter how long the texts are.
+    """
+
+    def __init__(self):
+        self._seen = set()
+
+    def is_new(self, text):
+        digest = int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+        if digest in self._seen:
+            return False
+        self._seen.add(digest)
+        return True
+
+
+class MinHashDeduper:
+    """
+    Near-duplicate detection with MinHash signatures over word 3-grams and
+    LSH banding. A row is a duplicate when any earlier row shares a band bucket
+    and their estimated Jaccard similarity reaches ``threshold``.
+    """
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, num_perm=64, bands=16, threshold=0.8, shingle_size=3):
+        import random
+        rng = random.Random(1)  # fixed seed: signatures must be stable across runs
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self._perms = [(rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME)) for _ in range(num_perm)]
+        self._buckets = {}
+        self._signatures = []
+
+    def _signature(self, text):
+        words = _WORD.findall(text.lower())
+        size = self.shingle_size
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingles]
+        prime = self._PRIME
+        return tuple(min((a * h + b) % prime for h in hashes) for a, b in self._perms)
+
+    def is_new(self, text):
+        signature = self._signature(text)
+        keys = [
+            (band, signature[band * self.rows_per_band:(band + 1) * self.rows_per_band])
+            for band in range(self.bands)
+        ]
+        candidates = {idx for key in keys for idx in self._buckets.get(key, ())}
+        for idx in candidates:
+            other = self._signatures[idx]
+            matches = sum(1 for x, y in zip(signature, other) if x == y)
+            if matches / self.num_perm >= self.threshold:
+                return False
+        idx = len(self._signatures)
+        self._signatures.append(signature)
+        for key in keys:
+            self._buckets.setdefault(key, []).append(idx)
+        return True
+
+
+##Engine
+class CleaningPipeline:
+    """
+    Applies a list of batch rules to a stream of texts, optionally fanning the
+    batches out over ``workers`` processes. De-duplication is stateful, so it
+    always runs in the calling process on the cleaned output.
+    """
+
+    def __init__(self, rules=None, near_dedup=False, batch_size=CLEAN_BATCH_SIZE, workers=1):
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        self.near_dedup = near_dedup
+        self.batch_size = batch_size
+        self.workers = max(1, workers)
+
+    def clean_batch(self, batch):
+        for rule in self.rules:
+            batch = rule(batch)
+        return batch
+
+    def _batches(self, texts):
+        iterator = iter(texts)
+        while True:
+            batch = list(islice(iterator, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def _cleaned_batches(self, texts):
+        if self.workers == 1:
+            for batch in self._batches(texts):
+                yield self.clean_batch(batch)
+            return
+        with multiprocessing.Pool(self.workers) as pool:
+            # imap keeps input order and only holds a few batches in flight.
+            yield from pool.imap(self.clean_batch, self._batches(texts), chunksize=1)
+
+    def run(self, texts):
+        exact = HashDeduper()
+        near = MinHashDeduper() if self.near_dedup else None
+        for batch in self._cleaned_batches(texts):
+            for text in batch:
+                if not text or not exact.is_new(text):
+                    continue
+                if near is not None and not near.is_new(text):
+                    continue
+                yield text
+
+
+def clean_text(item):
+    """
+    Removes special characters and redundant whitespace from one string.
+    """
+    return CleaningPipeline().clean_batch([item])[0]
+
+
+def iter_cleaned_rows(queryset, pipeline=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Streams ``response_text`` from the queryset through the cleaning pipeline
+    and yields the cleaned, de-duplicated texts one by one.
+    """
+    pipeline = pipeline or CleaningPipeline()
+    rows = queryset.values_list("response_text", flat=True).iterator(chunk_size=chunk_size)
+    yield from pipeline.run(rows)
+
+
+def iter_jsonl(texts, compress=False):
+    """
+    Encodes texts as JSONL lines, optionally gzip-compressed on the fly.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 -> gzip container
+    buffer = []
+    size = 0
+    for text in texts:
+        line = (json.dumps({"cleaned_text": text}) + "\n").encode("utf-8")
+        buffer.append(line)
+        size += len(line)
+        if size >= 64 * 1024:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            yield compressor.compress(chunk) if compressor else chunk
+    chunk = b"".join(buffer)
+    if compressor:
+        yield compressor.compress(chunk) + compressor.flush()
+    elif chunk:
+        yield chunk
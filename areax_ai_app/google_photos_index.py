@@ -0,0 +1,232 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import perceptual_hash, photo_retrieval
+from .background_tasks import run_in_background
+from .models import GooglePhotoItem, GooglePhotoSyncState
+
+logger = logging.getLogger(__name__)
+
+##Per-user index of Google Photos metadata. The first search lists the whole
+##library once; after that a stale index is refreshed in the background with
+##a date-filtered search from the newest photo we know, and a full listing
+##every FULL_SYNC_INTERVAL picks up deletions and back-dated uploads.
+SYNC_INTERVAL = int(os.getenv("GOOGLE_PHOTOS_SYNC_INTERVAL", "600"))
+FULL_SYNC_INTERVAL = int(os.getenv("GOOGLE_PHOTOS_FULL_SYNC_INTERVAL", str(24 * 3600)))
+SYNC_LEASE = 600  # A sync not finished after this long is assumed dead
+PAGE_SIZE = 100  # Library API maximum
+BASE_URL_TTL = 55 * 60  # baseUrls stop working 60 minutes after they were listed
+THUMBNAIL_SIZE = "=w128-h128"  # Enough pixels for a dHash
+HASH_BATCH_SIZE = 200
+REQUEST_TIMEOUT = 30
+
+_hash_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="areax-photos-hash")
+
+
+class GooglePhotosUnavailable(Exception):
+    pass
+
+
+def _date(value):
+    return {"year": value.year, "month": value.month, "day": value.day}
+
+
+def _pages(service, since=None):
+    """Yields mediaItems page by page: the whole library, or items created on/after ``since``."""
+    page_token = None
+    while True:
+        if since is None:
+            results = service.mediaItems().list(pageSize=PAGE_SIZE, pageToken=page_token).execute()
+        else:
+            body = {
+                "pageSize": PAGE_SIZE,
+                "filters": {"dateFilter": {"ranges": [
+                    {"startDate": _date(since), "endDate": _date(timezone.now() + timedelta(days=1))},
+                ]}},
+            }
+            if page_token:
+                body["pageToken"] = page_token
+            results = service.mediaItems().search(body=body).execute()
+        yield results.get("mediaItems") or []
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return
+
+
+def _upsert(email, items, synced_at):
+    GooglePhotoItem.objects.bulk_create(
+        [
+            GooglePhotoItem(
+                user_email=email,
+                media_item_id=item["id"],
+                filename=item.get("filename") or "",
+                mime_type=item.get("mimeType") or "",
+                creation_time=parse_datetime((item.get("mediaMetadata") or {}).get("creationTime") or ""),
+                metadata=item,
+                synced_at=synced_at,
+            )
+            for item in items
+        ],
+        update_conflicts=True,
+        unique_fields=["user_email", "media_item_id"],
+        update_fields=["filename", "mime_type", "creation_time", "metadata", "synced_at"],
+    )
+
+
+def _claim(email):
+    """Takes the user's sync lease; None if another process is syncing the library."""
+    state, _ = GooglePhotoSyncState.objects.get_or_create(user_email=email)
+    now = timezone.now()
+    claimed = GooglePhotoSyncState.objects.filter(pk=state.pk).filter(
+        Q(sync_started_at__isnull=True) | Q(sync_started_at__lt=now - timedelta(seconds=SYNC_LEASE))
+    ).update(sync_started_at=now)
+    return state if claimed else None
+
+
+def sync(email, service, full=None, follow_up=True):
+    """
+    Brings the user's index up to date and returns the number of items the
+    API returned (None if another process holds the sync). ``full`` forces or
+    skips a full listing; by default one runs every FULL_SYNC_INTERVAL.
+    Hashing and embedding the new items is queued unless ``follow_up`` is off.
+    """
+    state = _claim(email)
+    if state is None:
+        return None
+    started = timezone.now()
+    try:
+        if full is None:
+            full = state.last_full_sync_at is None or \
+                (started - state.last_full_sync_at).total_seconds() > FULL_SYNC_INTERVAL
+        seen = 0
+        for items in _pages(service, None if full else state.newest_creation_time):
+            _upsert(email, items, timezone.now())
+            seen += len(items)
+
+        indexed = GooglePhotoItem.objects.filter(user_email=email)
+        if full:
+            # Whatever a full listing didn't return is gone from the library
+            indexed.filter(synced_at__lt=started).delete()
+        fields = {
+            "item_count": indexed.count(),
+            "newest_creation_time": indexed.aggregate(at=Max("creation_time"))["at"],
+            "last_synced_at": timezone.now(),
+            "sync_started_at": None,
+            "error": None,
+        }
+        if full:
+            fields["last_full_sync_at"] = started
+        GooglePhotoSyncState.objects.filter(pk=state.pk).update(**fields)
+    except Exception as e:
+        GooglePhotoSyncState.objects.filter(pk=state.pk).update(sync_started_at=None, error=str(e)[:2000])
+        raise
+    if follow_up:
+        run_in_background(hash_pending, email)
+        run_in_background(photo_retrieval.index_pending, email)
+    return seen
+
+
+def _thumbnail_hash(item):
+    base_url = item.metadata.get("baseUrl")
+    if not base_url:
+        return None
+    try:
+        response = requests.get(base_url + THUMBNAIL_SIZE, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return perceptual_hash.dhash(response.content)
+    except Exception as e:
+        logger.warning("Could not hash Google Photos item %s: %s", item.media_item_id, e)
+        return None
+
+
+def hash_pending(email):
+    """Background step after a sync: dHashes every unhashed item whose baseUrl is still valid."""
+    pending = GooglePhotoItem.objects.filter(
+        user_email=email,
+        phash__isnull=True,
+        synced_at__gte=timezone.now() - timedelta(seconds=BASE_URL_TTL),
+    ).order_by("id")
+    last_id = 0
+    while True:
+        items = list(pending.filter(id__gt=last_id)[:HASH_BATCH_SIZE])
+        if not items:
+            return
+        last_id = items[-1].id
+        hashed = []
+        for item, value in zip(items, _hash_pool.map(_thumbnail_hash, items)):
+            if value is None:
+                continue
+            for field, field_value in perceptual_hash.hash_fields(value).items():
+                setattr(item, field, field_value)
+            hashed.append(item)
+        GooglePhotoItem.objects.bulk_update(
+            hashed, ["phash", "phash_band0", "phash_band1", "phash_band2", "phash_band3"],
+        )
+
+
+def _background_sync(email, get_service):
+    service = get_service()
+    if service is not None:
+        sync(email, service)
+
+
+def ensure_index(email, get_service):
+    """
+    Makes sure the user has an index to search. The first call builds it
+    inline; later calls refresh a stale index in the background.
+    ``get_service`` returns a Library API service, or None without credentials.
+    Returns False while another process is still building the first index.
+    """
+    state = GooglePhotoSyncState.objects.filter(user_email=email).first()
+    if state is None or state.last_synced_at is None:
+        service = get_service()
+        if service is None:
+            raise GooglePhotosUnavailable("Failed to fetch Google API credentials")
+        return sync(email, service) is not None
+    if (timezone.now() - state.last_synced_at).total_seconds() > SYNC_INTERVAL:
+        run_in_background(_background_sync, email, get_service)
+    return True
+
+
+def match(email, filename, image_file=None):
+    """
+    Finds the user's photo by filename (one indexed lookup), falling back to
+    the closest perceptual hash of ``image_file``. Returns ``(item, match_type)``
+    or ``(None, None)``.
+    """
+    photos = GooglePhotoItem.objects.filter(user_email=email)
+    item = photos.filter(filename=filename).order_by("-creation_time").first()
+    if item is not None:
+        return item, "filename"
+    if image_file is None:
+        return None, None
+    try:
+        image_file.seek(0)
+        value = perceptual_hash.dhash(image_file.read())
+    except Exception as e:
+        logger.warning("Could not hash uploaded image %s: %s", filename, e)
+        return None, None
+    best = perceptual_hash.nearest(photos, value)
+    if best is None:
+        return None, None
+    return photos.get(pk=best[0]), "content"
+
+
+def fresh_metadata(item, get_service):
+    """The item's mediaItem, re-read from the API when its baseUrl has expired."""
+    if (timezone.now() - item.synced_at).total_seconds() < BASE_URL_TTL:
+        return item.metadata
+    service = get_service()
+    if service is None:
+        return item.metadata
+    item.metadata = service.mediaItems().get(mediaItemId=item.media_item_id).execute()
+    item.synced_at = timezone.now()
+    GooglePhotoItem.objects.filter(pk=item.pk).update(metadata=item.metadata, synced_at=item.synced_at)
+    return item.metadata
@@ -1,7 +1,37 @@
+import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from google.auth.exceptions import RefreshError
+from google.auth.transport.requests import Request as GoogleAuthRequest
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
 import requests
 
+from .models import UserCredentials
+
+logger = logging.getLogger(__name__)
+
+PHOTOS_SCOPES = ["https://www.googleapis.com/auth/photoslibrary.readonly"]
+DISCOVERY_URL = "https://photoslibrary.googleapis.com/$discovery/rest?version=v1"
+# The discovery document is downloaded once and kept on disk; it is only
+# fetched again after DISCOVERY_MAX_AGE (and the old copy is kept if that fails).
+DISCOVERY_CACHE_PATH = os.getenv(
+    "GOOGLE_PHOTOS_DISCOVERY_PATH", os.path.join(settings.BASE_DIR, "discovery_cache", "photoslibrary.v1.json"),
+)
+DISCOVERY_MAX_AGE = 7 * 24 * 3600
+
+_discovery = {"document": None, "loaded_at": 0}
+_credentials = {}  # email -> google.oauth2 Credentials, refreshed in place
+_lock = threading.Lock()
+
+
 class GooglePhotosService:
     @staticmethod
     def get_google_api_credentials(email):
@@ -21,8 +51,8 @@ class GooglePhotosService:
             return None
 
     @staticmethod
-    def get_google_photos_service(credentials_info):
-        creds = Credentials(
+    def credentials_from_info(credentials_info):
+        return Credentials(
             token=credentials_info["token"],
             refresh_token=credentials_info["refresh_token"],
             token_uri=credentials_info["token_uri"],
@@ -31,9 +61,138 @@ class GooglePhotosService:
             scopes=credentials_info["scopes"]
         )
 
-        service = build('photoslibrary', 'v1', credentials=creds, static_discovery=False)
+    @staticmethod
+    def get_discovery_document():
+        """The Photos Library discovery document, from memory, then disk, then the network."""
+        if _discovery["document"] is not None and time.time() - _discovery["loaded_at"] < DISCOVERY_MAX_AGE:
+            return _discovery["document"]
+        with _lock:
+            if _discovery["document"] is not None and time.time() - _discovery["loaded_at"] < DISCOVERY_MAX_AGE:
+                return _discovery["document"]
+            document = None
+            try:
+                if time.time() - os.path.getmtime(DISCOVERY_CACHE_PATH) < DISCOVERY_MAX_AGE:
+                    with open(DISCOVERY_CACHE_PATH) as f:
+                        document = f.read()
+            except OSError:
+                pass
+            if document is None:
+                try:
+                    response = requests.get(DISCOVERY_URL, timeout=30)
+                    response.raise_for_status()
+                    document = response.text
+                    GooglePhotosService._write_discovery(document)
+                except (requests.RequestException, OSError) as e:
+                    if not os.path.exists(DISCOVERY_CACHE_PATH):
+                        raise
+                    logger.warning("Could not refresh the Photos discovery document, using the cached copy: %s", e)
+                    with open(DISCOVERY_CACHE_PATH) as f:
+                        document = f.read()
+            _discovery["document"] = json.loads(document)
+            _discovery["loaded_at"] = time.time()
+            return _discovery["document"]
+
+    @staticmethod
+    def _write_discovery(document):
+        directory = os.path.dirname(DISCOVERY_CACHE_PATH)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, "w") as f:
+            f.write(document)
+        os.replace(tmp_path, DISCOVERY_CACHE_PATH)
+
+    @staticmethod
+    def get_google_photos_service(credentials_info):
+        if isinstance(credentials_info, Credentials):
+            creds = credentials_info
+        else:
+            creds = GooglePhotosService.credentials_from_info(credentials_info)
+
+        # Built from the cached discovery document, so no extra request per call
+        service = build_from_document(GooglePhotosService.get_discovery_document(), credentials=creds)
         return service
 
+    @staticmethod
+    def _client_config():
+        """OAuth client settings from the project's credentials.json, if it is there."""
+        try:
+            with open(settings.GOOGLE_PHOTOS_CREDENTIALS_PATH) as f:
+                config = json.load(f)
+        except (OSError, ValueError, AttributeError):
+            return None
+        return config.get("web") or config.get("installed")
+
+    @staticmethod
+    def _stored_credentials(email):
+        """Credentials rebuilt from UserCredentials, for a cold process that has the client settings."""
+        client = GooglePhotosService._client_config()
+        if not client:
+            return None
+        stored = UserCredentials.objects.filter(user__email=email).first()
+        if stored is None:
+            return None
+        return Credentials(
+            token=stored.access_token,
+            refresh_token=stored.refresh_token,
+            token_uri=client.get("token_uri", "https://oauth2.googleapis.com/token"),
+            client_id=client["client_id"],
+            client_secret=client["client_secret"],
+            scopes=PHOTOS_SCOPES,
+            # google-auth compares against naive UTC
+            expiry=stored.token_expiry.astimezone(datetime.timezone.utc).replace(tzinfo=None),
+        )
+
+    @staticmethod
+    def _store_credentials(email, creds):
+        if not creds.expiry or len(creds.token or "") > 255 or len(creds.refresh_token or "") > 255:
+            return
+        user = User.objects.filter(email=email).first()
+        if user is None:
+            return
+        UserCredentials.objects.update_or_create(user=user, defaults={
+            "access_token": creds.token,
+            "refresh_token": creds.refresh_token,
+            "token_expiry": creds.expiry.replace(tzinfo=datetime.timezone.utc),
+        })
+
+    @staticmethod
+    def get_credentials(email):
+        """
+        The user's Photos credentials, cached per process and refreshed only
+        when the access token has expired. photo_service is asked only when
+        neither the cache nor UserCredentials have them. None if unavailable.
+        """
+        creds = _credentials.get(email) or GooglePhotosService._stored_credentials(email)
+        from_service = creds is None
+        if from_service:
+            credentials_info = GooglePhotosService.get_google_api_credentials(email)
+            if not credentials_info:
+                return None
+            creds = GooglePhotosService.credentials_from_info(credentials_info)
+        if not creds.valid and creds.refresh_token:
+            try:
+                creds.refresh(GoogleAuthRequest())
+            except RefreshError as e:
+                logger.warning("Refreshing Google Photos credentials for %s failed: %s", email, e)
+                _credentials.pop(email, None)
+                if from_service:
+                    return None
+                # Revoked or rotated: drop the stored copy, or it is rebuilt and fails on every call,
+                # and try again, which ends at photo_service once nothing stale is left
+                UserCredentials.objects.filter(user__email=email, refresh_token=creds.refresh_token).delete()
+                return GooglePhotosService.get_credentials(email)
+            GooglePhotosService._store_credentials(email, creds)
+        _credentials[email] = creds
+        return creds
+
+    @staticmethod
+    def get_service_for(email):
+        """Library API service for the user, or None without credentials."""
+        creds = GooglePhotosService.get_credentials(email)
+        if creds is None:
+            return None
+        return GooglePhotosService.get_google_photos_service(creds)
+
     @staticmethod
     def get_photos(service):
         try:
@@ -78,4 +237,4 @@ class GooglePhotosService:
         for photo in google_photos:
             if photo['filename'] == uploaded_image_filename:
                 return photo
-        return None
\ No newline at end of file
+        return None
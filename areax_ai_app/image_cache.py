@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import unicodedata
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from . import media_store, perceptual_hash
+from .background_tasks import PeriodicWorker, run_in_background
+from .metering import price
+from .models import ImageCacheEntry, ImageCacheStat
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+##Prompt-level cache for generated images. Opt-in per request ("use_cache"),
+##or for every request with IMAGE_CACHE_ENABLED. Entries only point at media
+##store objects, so evicting them never deletes an image somebody was given.
+CACHE_BY_DEFAULT = os.getenv("IMAGE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+CACHE_TTL = int(os.getenv("IMAGE_CACHE_TTL", str(7 * 24 * 3600)))
+MAX_ENTRIES = int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "20000"))
+EVICT_INTERVAL = 3600
+
+_PUNCTUATION = re.compile(r"^[\s\W_]+|[\s\W_]+$")
+
+
+def wants_cache(data):
+    """Reads the request's ``use_cache`` flag (bool or string), falling back to IMAGE_CACHE_ENABLED."""
+    value = data.get("use_cache")
+    if value is None or value == "":
+        return CACHE_BY_DEFAULT
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def normalize_prompt(prompt):
+    """Case, unicode form, whitespace and surrounding punctuation don't change the image."""
+    prompt = unicodedata.normalize("NFKC", prompt or "").casefold()
+    return _PUNCTUATION.sub("", " ".join(prompt.split()))
+
+
+def cache_key(provider, model, prompt, params=None):
+    payload = [provider, model, normalize_prompt(prompt), params or {}]
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def _count(provider, **increments):
+    """Adds to today's hit/miss counters, creating the row if needed."""
+    lookup = {"provider": provider, "day": timezone.localdate()}
+    updates = {field: F(field) + amount for field, amount in increments.items()}
+    if ImageCacheStat.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            ImageCacheStat.objects.create(**lookup, **increments)
+    except IntegrityError:
+        ImageCacheStat.objects.filter(**lookup).update(**updates)
+
+
+def lookup(provider, model, prompt, params=None, count=1):
+    """
+    Returns ``count`` cached images (StoredMedia, size unknown) for the prompt,
+    or None on a miss. Near-duplicates are served from the first copy stored.
+    """
+    key = cache_key(provider, model, prompt, params)
+    now = timezone.now()
+    entries = list(
+        ImageCacheEntry.objects.filter(cache_key=key, expires_at__gt=now)
+        .select_related("duplicate_of").order_by("slot")[:count]
+    )
+    if len(entries) < count:
+        _count(provider, misses=1)
+        return None
+
+    ImageCacheEntry.objects.filter(id__in=[entry.id for entry in entries]).update(
+        hit_count=F("hit_count") + 1, last_used_at=now,
+    )
+    _count(provider, hits=1, saved_cost=price(provider, model, image_units=count)[2])
+    served = []
+    for entry in entries:
+        source = entry.duplicate_of or entry
+        renditions = {int(width): url for width, url in source.renditions.items()}
+        served.append(media_store.StoredMedia(source.media_key, source.url, source.content_type, None, renditions))
+    return served
+
+
+def store(provider, model, prompt, params, images):
+    """
+    Caches freshly generated images (StoredMedia, in slot order). Concurrent
+    misses for the same prompt keep whichever images were stored first.
+    """
+    key = cache_key(provider, model, prompt, params)
+    now = timezone.now()
+    ImageCacheEntry.objects.bulk_create([
+        ImageCacheEntry(
+            cache_key=key,
+            slot=slot,
+            provider=provider,
+            model=model,
+            prompt=normalize_prompt(prompt),
+            params=params or {},
+            media_key=image.key,
+            url=image.url,
+            content_type=image.content_type,
+            renditions=image.renditions,
+            last_used_at=now,
+            expires_at=now + timedelta(seconds=CACHE_TTL),
+        )
+        for slot, image in enumerate(images)
+    ], ignore_conflicts=True)
+    run_in_background(index_entries, key)
+    evictor.start()
+
+
+##Perceptual index: a dHash per cached image, used to spot providers handing
+##back the same picture for different prompts.
+def index_entries(key):
+    """Background step after store(): hashes the new images and links near-duplicates."""
+    backend = media_store.get_backend()
+    canonical = ImageCacheEntry.objects.filter(duplicate_of__isnull=True).exclude(cache_key=key)
+    for entry in ImageCacheEntry.objects.filter(cache_key=key, phash__isnull=True):
+        try:
+            value = perceptual_hash.dhash(backend.get(entry.media_key))
+        except Exception:
+            logger.exception("Could not hash cached image %s", entry.media_key)
+            continue
+        match = perceptual_hash.nearest(canonical, value)
+        duplicate_of = match[0] if match else None
+        ImageCacheEntry.objects.filter(pk=entry.pk).update(
+            duplicate_of=duplicate_of, **perceptual_hash.hash_fields(value),
+        )
+        if duplicate_of:
+            _count(entry.provider, near_duplicates=1)
+
+
+def evict():
+    """Drops expired entries, then the least recently used ones above MAX_ENTRIES."""
+    expired, _ = ImageCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+    overflow = ImageCacheEntry.objects.count() - MAX_ENTRIES
+    evicted = 0
+    if overflow > 0:
+        stale = list(ImageCacheEntry.objects.order_by("last_used_at").values_list("id", flat=True)[:overflow])
+        evicted, _ = ImageCacheEntry.objects.filter(id__in=stale).delete()
+    if expired or evicted:
+        logger.info("Image cache evicted %d expired and %d least recently used entries", expired, evicted)
+    return EVICT_INTERVAL
+
+
+def stats(provider, start, end):
+    """Hit/miss counters of ``provider`` between the dates ``start`` and ``end`` (inclusive)."""
+    totals = ImageCacheStat.objects.filter(provider=provider, day__range=(start, end)).aggregate(
+        hits=Coalesce(Sum("hits"), 0),
+        misses=Coalesce(Sum("misses"), 0),
+        near_duplicates=Coalesce(Sum("near_duplicates"), 0),
+        saved_cost=Coalesce(Sum("saved_cost"), Decimal("0")),
+    )
+    lookups = totals["hits"] + totals["misses"]
+    return {
+        "hits": totals["hits"],
+        "misses": totals["misses"],
+        "hit_rate": round(totals["hits"] / lookups, 4) if lookups else 0,
+        "near_duplicates": totals["near_duplicates"],
+        "saved_cost": f"${totals['saved_cost']:.4f}",
+    }
+
+
+evictor = PeriodicWorker("areax-image-cache-evictor", evict, idle_interval=EVICT_INTERVAL)
@@ -0,0 +1,169 @@
+import contextvars
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from dotenv import load_dotenv
+from google.genai import types
+
+from . import image_cache, media_store, provider_endpoints
+from .metering import meter
+from .models import GeneratedImage
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+genai_client = provider_endpoints.genai_client(api_key=os.getenv("GEMINI_API_KEY"))
+HUGGING_FACE_API_KEY = os.getenv("HUGGING_FACE_API_KEY")
+FLUX_API_URL = "https://api-inference.huggingface.co/models/black-forest-labs/FLUX.1-dev"
+IMAGEN_MODEL = "imagen-3.0-generate-002"
+
+IMAGEN_MAX_PER_CALL = 4  # Imagen's number_of_images limit
+MAX_PROMPTS = int(os.getenv("IMAGE_BATCH_MAX_PROMPTS", "8"))
+MAX_IMAGES_PER_PROMPT = int(os.getenv("IMAGE_BATCH_MAX_IMAGES", "8"))
+PROVIDERS = ("imagen", "flux")
+# provider -> (metering provider, model) the image cache is keyed on
+PROVIDER_MODELS = {"imagen": ("gemini", IMAGEN_MODEL), "flux": ("huggingface", "FLUX.1-dev")}
+
+# Provider calls and uploads are network-bound, so a thread pool is enough.
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("IMAGE_WORKERS", "8")), thread_name_prefix="areax-image")
+
+
+class ImageGenerationError(Exception):
+    pass
+
+
+def _submit(fn, *args):
+    # Each task runs in a copy of the caller's context so metering keeps the
+    # request's endpoint and user.
+    return _pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _imagen(prompt, count):
+    with meter("gemini", IMAGEN_MODEL) as usage:
+        response = genai_client.models.generate_images(
+            model=IMAGEN_MODEL,
+            prompt=prompt,
+            config=types.GenerateImagesConfig(number_of_images=count),
+        )
+        usage.add(image_units=len(response.generated_images or []))
+    return [img.image.image_bytes for img in response.generated_images or []]
+
+
+def _flux(prompt):
+    with meter("huggingface", "FLUX.1-dev") as usage:
+        response = requests.post(
+            FLUX_API_URL,
+            headers={"Authorization": f"Bearer {HUGGING_FACE_API_KEY}"},
+            json={"inputs": prompt},
+            timeout=120,
+        )
+        if response.status_code != 200 or not response.content:
+            usage.status = "error"
+            raise ImageGenerationError(f"FLUX returned {response.status_code}")
+        usage.add(image_units=1)
+    return [response.content]
+
+
+def _generate_calls(provider, prompt, num_images):
+    """Splits one prompt's request into provider calls that can run in parallel."""
+    if provider == "flux":
+        return [_submit(_flux, prompt) for _ in range(num_images)]
+    calls = []
+    remaining = num_images
+    while remaining > 0:
+        count = min(remaining, IMAGEN_MAX_PER_CALL)
+        calls.append(_submit(_imagen, prompt, count))
+        remaining -= count
+    return calls
+
+
+def generate_batch(prompts, provider="imagen", num_images=1, negative_prompt="", user_email=None,
+                   user_reference_number=None, base_url="", use_cache=False):
+    """
+    Generates ``num_images`` images for each prompt. All provider calls run in
+    parallel, every image is uploaded to the media store in parallel as soon
+    as it arrives, and the rows are written with one bulk_create. With
+    ``use_cache`` prompts already in the image cache skip generation.
+
+    Returns one result per prompt, in input order:
+    ``{"prompt", "status", "generated_images"}`` or ``{"prompt", "status", "error"}``.
+    """
+    if provider not in PROVIDERS:
+        raise ValueError(f"Unknown provider '{provider}', expected one of {', '.join(PROVIDERS)}")
+    if not prompts or len(prompts) > MAX_PROMPTS:
+        raise ValueError(f"Between 1 and {MAX_PROMPTS} prompts are allowed")
+    if not 1 <= num_images <= MAX_IMAGES_PER_PROMPT:
+        raise ValueError(f"num_images must be between 1 and {MAX_IMAGES_PER_PROMPT}")
+
+    cache_provider, cache_model = PROVIDER_MODELS[provider]
+    cached = {}
+    if use_cache:
+        for index, prompt in enumerate(prompts):
+            hit = image_cache.lookup(cache_provider, cache_model, prompt, count=num_images)
+            if hit:
+                cached[index] = hit
+
+    calls = {
+        call: index
+        for index, prompt in enumerate(prompts) if index not in cached
+        for call in _generate_calls(provider, prompt, num_images)
+    }
+
+    uploads = []
+    errors = {}
+    for call in as_completed(calls):
+        index = calls[call]
+        try:
+            images = call.result()
+        except Exception as e:
+            logger.warning("Image generation failed for prompt %d: %s", index, e)
+            errors.setdefault(index, str(e))
+            continue
+        uploads += [(index, _submit(media_store.put_image, data, None, "generated_images", True)) for data in images]
+    uploads.sort(key=lambda upload: upload[0])  # Keep each prompt's images together
+
+    stored = []
+    for index, upload in uploads:
+        try:
+            stored.append((index, upload.result()))
+        except Exception as e:
+            logger.warning("Storing generated image for prompt %d failed: %s", index, e)
+            errors.setdefault(index, str(e))
+
+    if use_cache:
+        for index in {index for index, _item in stored} - set(errors):
+            images = [item for item_index, item in stored if item_index == index]
+            image_cache.store(cache_provider, cache_model, prompts[index], {}, images)
+    stored += [(index, item) for index, items in cached.items() for item in items]
+    stored.sort(key=lambda entry: entry[0])
+
+    rows = GeneratedImage.objects.bulk_create([
+        GeneratedImage(
+            prompt=prompts[index],
+            user_reference_number=user_reference_number,
+            user_email=user_email,
+            negative_prompt=negative_prompt,
+            image=media_store.absolute_url(item.url, base_url),
+        )
+        for index, item in stored
+    ])
+
+    results = [{"prompt": prompt, "generated_images": []} for prompt in prompts]
+    for (index, item), row in zip(stored, rows):
+        results[index]["generated_images"].append({
+            "generated_image_id": row.id,
+            "user_reference_number": user_reference_number,
+            "user_email": user_email,
+            "image": row.image,
+            "renditions": {width: media_store.absolute_url(url, base_url) for width, url in item.renditions.items()},
+            "cached": index in cached,
+        })
+    for index, result in enumerate(results):
+        if result["generated_images"]:
+            result["status"] = "success" if index not in errors else "partial"
+        else:
+            result["status"] = "error"
+            result["error"] = errors.get(index, "No image was generated")
+    return results
@@ -0,0 +1,61 @@
+import base64
+import statistics
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from areax_ai_app.authentication import CachedBasicAuthentication, CachedTokenAuthentication
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the per-request cost of authentication: DRF's Token and Basic "
+        "authenticators against the cached ones, with a throwaway user. Reports "
+        "mean/p99 time and database queries per request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=500)
+
+    def measure(self, label, authenticator, header, count):
+        factory = APIRequestFactory()
+        timings, queries = [], 0
+        for _ in range(count):
+            request = Request(factory.get("/ai/api/caption_list", HTTP_AUTHORIZATION=header))
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                user, _auth = authenticator.authenticate(request)
+                timings.append(time.perf_counter() - start)
+            queries += len(captured)
+            assert user is not None
+        timings.sort()
+        self.stdout.write(
+            f"{label:16s} mean={statistics.mean(timings) * 1e6:9.1f} us  "
+            f"p99={timings[int(len(timings) * 0.99) - 1] * 1e6:9.1f} us  "
+            f"queries/request={queries / count:.2f}"
+        )
+
+    def handle(self, *args, **options):
+        count = options["requests"]
+        username = f"benchmark-auth-{uuid.uuid4().hex[:8]}"
+        password = uuid.uuid4().hex
+        user = User.objects.create_user(username=username, password=password)
+        try:
+            token = Token.objects.create(user=user)
+            token_header = f"Token {token.key}"
+            basic_header = "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()
+            self.measure("token", TokenAuthentication(), token_header, count)
+            self.measure("token (cached)", CachedTokenAuthentication(), token_header, count)
+            # PBKDF2 makes plain Basic slow; fewer rounds are enough to see it
+            self.measure("basic", BasicAuthentication(), basic_header, max(1, count // 10))
+            self.measure("basic (cached)", CachedBasicAuthentication(), basic_header, count)
+        finally:
+            user.delete()
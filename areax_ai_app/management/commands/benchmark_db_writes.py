@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+
+from areax_ai_app.db_tuning import SQLITE_BUSY_TIMEOUT_MS, apply_sqlite_pragmas
+from areax_ai_app.models import ChatHistory
+
+BENCHMARK_EMAIL = "benchmark@areax.local"
+
+
+def run_writers(writers, seconds, write, setup=None, teardown=None):
+    """Runs ``writers`` threads calling ``write()`` for ``seconds``; returns (latencies, errors)."""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    start = threading.Barrier(writers)
+    deadline = [0]
+
+    def worker():
+        state = setup() if setup else None
+        own, failed = [], 0
+        try:
+            start.wait()
+            if not deadline[0]:
+                deadline[0] = time.perf_counter() + seconds
+            while time.perf_counter() < deadline[0]:
+                t0 = time.perf_counter()
+                try:
+                    write(state)
+                    own.append(time.perf_counter() - t0)
+                except (OperationalError, sqlite3.OperationalError):
+                    failed += 1  # "database is locked" once the busy timeout ran out
+        finally:
+            if teardown:
+                teardown(state)
+        with lock:
+            latencies.extend(own)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure write throughput under contention (one small insert per request, "
+        "like the chat/voice log rows) at several writer counts. By default it "
+        "writes ChatHistory rows to the configured database and deletes them "
+        "afterwards; --sqlite-profiles compares stock and tuned SQLite on a temp file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, nargs="+", default=[1, 8, 64])
+        parser.add_argument("--seconds", type=float, default=5)
+        parser.add_argument("--sqlite-profiles", action="store_true",
+                            help="Raw sqlite3: rollback journal + synchronous=FULL vs the db_tuning pragmas")
+
+    def report(self, label, writers, seconds, latencies, errors):
+        if latencies:
+            ordered = sorted(latencies)
+            p50 = statistics.median(ordered) * 1000
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+        else:
+            p50 = p99 = float("nan")
+        self.stdout.write(
+            f"{label:8s} writers={writers:3d}  {len(latencies) / seconds:9.1f} writes/s  "
+            f"p50={p50:7.2f} ms  p99={p99:8.2f} ms  locked_errors={errors}"
+        )
+
+    def handle(self, *args, **options):
+        seconds = options["seconds"]
+        if options["sqlite_profiles"]:
+            self.sqlite_profiles(options["writers"], seconds)
+            return
+
+        self.stdout.write(f"database: {connection.vendor} ({connection.settings_dict['NAME']})")
+
+        def write(_state):
+            ChatHistory.objects.create(user_email=BENCHMARK_EMAIL, message="benchmark message", response="benchmark reply")
+
+        def teardown(_state):
+            connection.close()  # Each thread has its own Django connection
+
+        try:
+            for writers in options["writers"]:
+                latencies, errors = run_writers(writers, seconds, write, teardown=teardown)
+                self.report(connection.vendor, writers, seconds, latencies, errors)
+        finally:
+            ChatHistory.objects.filter(user_email=BENCHMARK_EMAIL).delete()
+
+    def sqlite_profiles(self, writer_counts, seconds):
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in ("stock", "tuned"):
+                path = os.path.join(directory, f"{profile}.db")
+                conn = sqlite3.connect(path)
+                if profile == "tuned":
+                    apply_sqlite_pragmas(conn.cursor())
+                conn.execute("CREATE TABLE log (id INTEGER PRIMARY KEY, email TEXT, message TEXT, response TEXT, at REAL)")
+                conn.commit()
+                conn.close()
+
+                def setup(path=path, profile=profile):
+                    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+                    if profile == "tuned":
+                        apply_sqlite_pragmas(conn.cursor())
+                    return conn
+
+                def write(conn):
+                    conn.execute("INSERT INTO log (email, message, response, at) VALUES (?, ?, ?, ?)",
+                                 (BENCHMARK_EMAIL, "benchmark message", "benchmark reply", time.time()))
+                    conn.commit()
+
+                for writers in writer_counts:
+                    latencies, errors = run_writers(writers, seconds, write, setup=setup, teardown=lambda conn: conn.close())
+                    self.report(profile, writers, seconds, latencies, errors)
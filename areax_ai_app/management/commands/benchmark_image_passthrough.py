@@ -0,0 +1,74 @@
+import base64
+import random
+import time
+import tracemalloc
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from areax_ai_app.media_store import coerce_image_bytes, transcode
+
+
+def synthetic_jpeg(width, height, seed=3):
+    # Noisy gradient so the encoder does real work, like a photo would.
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.frombytes("RGB", (width, height), bytes(rng.getrandbits(8) for _ in range(width * height * 3)))
+    image = Image.blend(image, noise, 0.3)
+    out = BytesIO()
+    image.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+def decode_reencode(payload):
+    # What the views did before: base64 -> PIL decode -> JPEG encode.
+    image = Image.open(BytesIO(base64.b64decode(payload)))
+    image_io = BytesIO()
+    image.save(image_io, format="JPEG")
+    return image_io.getvalue(), image.width * image.height * len(image.getbands())
+
+
+def passthrough(payload):
+    raw, content_type = coerce_image_bytes(payload)
+    return raw, 0
+
+
+def transcode_png(payload):
+    raw, _ = coerce_image_bytes(payload)
+    image = Image.open(BytesIO(raw))
+    return transcode(raw, "image/png"), image.width * image.height * len(image.getbands())
+
+
+class Command(BaseCommand):
+    help = "Compare CPU time and memory per image for passthrough vs decode/re-encode of provider images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--width", type=int, default=1024)
+        parser.add_argument("--height", type=int, default=1024)
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def handle(self, *args, **options):
+        jpeg = synthetic_jpeg(options["width"], options["height"])
+        payload = base64.b64encode(jpeg)  # Providers hand us base64 in some SDK versions
+        n = options["iterations"]
+        self.stdout.write(f"image {options['width']}x{options['height']} jpeg={len(jpeg) / 1024:.0f} KiB, {n} iterations")
+
+        for name, fn, runs in (
+            ("decode+reencode", decode_reencode, n),
+            ("passthrough", passthrough, n),
+            ("transcode->png", transcode_png, max(1, n // 5)),
+        ):
+            fn(payload)  # Warm up
+            tracemalloc.start()
+            cpu = time.process_time()
+            for _ in range(runs):
+                _, bitmap = fn(payload)
+            cpu = (time.process_time() - cpu) / runs
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            # tracemalloc only sees Python buffers; Pillow's decoded bitmap lives in C, so add it.
+            self.stdout.write(
+                f"{name:16s} cpu={cpu * 1000:8.2f} ms/image  "
+                f"python_peak={peak / 1024:8.0f} KiB  decoded_bitmap={bitmap / 1024:8.0f} KiB"
+            )
@@ -0,0 +1,78 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from areax_ai_app.accounts import find_login_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure registration and login throughput through the real endpoints "
+        "(middleware, session and token included) plus the bare user lookup, "
+        "old OR query vs accounts.find_login_user. Throwaway users are deleted "
+        "afterwards. --fast-hasher swaps PBKDF2 for MD5 to isolate the queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--fast-hasher", action="store_true")
+
+    def run(self, label, calls):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            for call in calls:
+                call()
+            elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{label:22s} {len(calls) / elapsed:8.1f} req/s  {elapsed / len(calls) * 1000:7.2f} ms/req  "
+            f"queries/req={len(captured) / len(calls):.2f}"
+        )
+
+    def handle(self, *args, **options):
+        hashers = ["django.contrib.auth.hashers.MD5PasswordHasher"] if options["fast_hasher"] else settings.PASSWORD_HASHERS
+        with override_settings(PASSWORD_HASHERS=hashers):
+            self.benchmark(options["users"])
+
+    def benchmark(self, count):
+        host = next((h for h in settings.ALLOWED_HOSTS if h != "*" and not h.startswith(".")), "localhost")
+        client = Client(SERVER_NAME=host)
+        run = uuid.uuid4().hex[:8]
+        password = uuid.uuid4().hex
+        accounts = [(f"bench-{run}-{i}", f"Bench-{run}-{i}@Example.invalid") for i in range(count)]
+
+        def register(username, email):
+            def call():
+                response = client.post(reverse("user_registration"), {
+                    "username": username, "email": email, "password": password,
+                    "first_name": "Bench", "last_name": "Mark",
+                })
+                assert response.status_code == 201, response.content
+            return call
+
+        def login(identifier):
+            def call():
+                response = client.post(reverse("user_login"), {"username": identifier, "password": password})
+                assert response.json().get("token"), response.content
+            return call
+
+        try:
+            self.run("register", [register(username, email) for username, email in accounts])
+            self.run("login by email", [login(email.upper()) for _username, email in accounts])
+            self.run("login by username", [login(username) for username, _email in accounts])
+            self.run("lookup (OR query)", [
+                lambda email=email: User.objects.filter(Q(email=email.lower()) | Q(username=email)).first()
+                for _username, email in accounts
+            ])
+            self.run("lookup (email index)", [
+                lambda email=email: find_login_user(email) for _username, email in accounts
+            ])
+        finally:
+            User.objects.filter(username__startswith=f"bench-{run}-").delete()
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from areax_ai_app import google_photos_index, photo_retrieval
+from areax_ai_app.google_photos_service import GooglePhotosService
+from areax_ai_app.models import AIContentDb, GooglePhotoSyncState
+
+
+class Command(BaseCommand):
+    help = (
+        "Embed synced Google Photos and captioned images into the per-user photo "
+        "search index and re-cluster it. --rebuild starts the index over, e.g. "
+        "after changing PHOTO_EMBEDDING_MODEL or to drop deleted photos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--email", action="append", help="Only this user (repeatable)")
+        parser.add_argument("--rebuild", action="store_true", help="Discard the user's index and embed everything again")
+        parser.add_argument("--no-sync", action="store_true", help="Skip refreshing the Google Photos index first")
+
+    def handle(self, *args, **options):
+        if not photo_retrieval.EMBEDDINGS_ENABLED:
+            raise CommandError("PHOTO_EMBEDDINGS is disabled.")
+        emails = options["email"] or sorted(
+            set(GooglePhotoSyncState.objects.values_list("user_email", flat=True))
+            | set(AIContentDb.objects.exclude(email__isnull=True).values_list("email", flat=True))
+        )
+        for email in emails:
+            if not options["no_sync"] and GooglePhotoSyncState.objects.filter(user_email=email).exists():
+                # Embedding needs baseUrls less than an hour old
+                service = GooglePhotosService.get_service_for(email)
+                if service is None:
+                    self.stderr.write(f"{email}: no Google credentials, indexing what is already synced")
+                else:
+                    google_photos_index.sync(email, service, full=options["rebuild"] or None, follow_up=False)
+                    google_photos_index.hash_pending(email)
+            if options["rebuild"]:
+                added = photo_retrieval.rebuild(email)
+            else:
+                added = photo_retrieval.index_pending(email)
+                photo_retrieval.VectorIndex(email).cluster()
+            meta = photo_retrieval.VectorIndex(email).meta()
+            self.stdout.write(f"{email}: embedded {added} images, {meta['count']} rows in the index")
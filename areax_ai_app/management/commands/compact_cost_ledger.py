@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from areax_ai_app.cost_ledger import SERVICE_NAMES, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily/monthly cost rollups from the raw usage rows: the "
+        "metered usage events, and the old per-table costs for anything recorded "
+        "before metering. Run it periodically (e.g. nightly from cron) to repair "
+        "any drift, and once with --since to backfill history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--provider", choices=sorted(SERVICE_NAMES), help="Only rebuild this provider")
+        parser.add_argument("--since", help="YYYY-MM-DD, defaults to the start of last month")
+        parser.add_argument("--until", help="YYYY-MM-DD, defaults to today")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        since = parse_date(options["since"]) if options["since"] else (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+        until = parse_date(options["until"]) if options["until"] else today
+        if not since or not until or since > until:
+            raise CommandError("--since/--until must be valid dates with since <= until.")
+
+        providers = [options["provider"]] if options["provider"] else sorted(SERVICE_NAMES)
+        for provider in providers:
+            days = rebuild(provider, since, until)
+            self.stdout.write(f"{provider}: rebuilt {days} daily rollup rows between {since} and {until}")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from areax_ai_app import write_behind
+
+
+class Command(BaseCommand):
+    help = (
+        "Write every log row left in the write-behind spool to the database. "
+        "Running servers replay rows of dead processes on their own; use this "
+        "after a crash when no server is running, or before a deploy."
+    )
+
+    def handle(self, *args, **options):
+        flushed = write_behind.flush()
+        self.stdout.write(f"Flushed {flushed} spooled rows from {write_behind.SPOOL_PATH}")
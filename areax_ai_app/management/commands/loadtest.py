@@ -0,0 +1,370 @@
+import base64
+import io
+import json
+import math
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import wave
+
+import requests
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from areax_ai_app.models import UserLocation
+from areax_ai_app.provider_fakes import FakeGemini, FakeGoogleMaps, FakeGoogleSpeech, FakeOpenAI
+
+PATTERNS = ("constant", "ramp", "spike")
+_SERVER_TIMING_COUNT = re.compile(r'(db\.read|db\.write);[^,]*desc="(\d+)x"')
+
+
+def _silence_wav(seconds=1, rate=16000):
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(b"\x00\x00" * rate * seconds)
+    return base64.b64encode(out.getvalue()).decode("ascii")
+
+
+AUDIO = _silence_wav()
+TOPICS = ("travel", "food", "music", "fitness", "photography")
+
+# name -> (method, path, body(i, run), fakes it calls). Bodies vary with i so
+# the content pool and image cache see a realistic mix instead of one key.
+SCENARIOS = {
+    "login": ("POST", "/ai/api/user_login", lambda i, run: {"username": f"loadtest-{run}", "password": run}, ()),
+    "chat_history": ("GET", "/ai/api/chatsession_history", lambda i, run: {"session_id": str(uuid.uuid4())}, ()),
+    "broadcast_agent": ("POST", "/ai/api/broadcast_agent",
+                        lambda i, run: {"favorite_topics": TOPICS[i % len(TOPICS)]}, ("openai",)),
+    "notification": ("POST", "/ai/api/notification", lambda i, run: {
+        "lat": f"{40 + i % 90 / 100:.4f}", "lng": "-73.9857", "reference_number": f"loadtest-{run}-{i}",
+    }, ("maps", "openai")),
+    "voice_chat": ("POST", "/ai/api/voice_chat", lambda i, run: {
+        "audio": AUDIO, "user_email": f"loadtest-{run}@example.invalid",
+    }, ("openai",)),
+    "onefeed_text": ("POST", "/ai/api/onefeed_new", lambda i, run: {
+        "text": f"plan a weekend about {TOPICS[i % len(TOPICS)]}", "user_email": f"loadtest-{run}@example.invalid",
+    }, ("gemini",)),
+    "onefeed_image": ("POST", "/ai/api/onefeed_new", lambda i, run: {
+        "text": f"create an image of {TOPICS[i % len(TOPICS)]} #{i}", "user_email": f"loadtest-{run}@example.invalid",
+        "use_cache": False,
+    }, ("gemini",)),
+    "onefeed_voice": ("POST", "/ai/api/onefeed_new", lambda i, run: {
+        "audio": AUDIO, "user_email": f"loadtest-{run}@example.invalid",
+    }, ("speech", "gemini")),
+    "image_generation_gemini": ("POST", "/ai/api/image_generation_gemini", lambda i, run: {
+        "prompt": f"a postcard of {TOPICS[i % len(TOPICS)]} #{i}", "num_images": 1, "use_cache": False,
+        "user_email": f"loadtest-{run}@example.invalid",
+    }, ("gemini",)),
+    # Needs a GCS emulator for the signed video URL, so it is only run when asked for
+    "veo_video": ("POST", "/ai/api/veo_video", lambda i, run: {"video_prompt": f"a drone shot of {TOPICS[i % len(TOPICS)]}"},
+                  ("gemini",)),
+}
+DEFAULT_SCENARIOS = [name for name in SCENARIOS if name != "veo_video"]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest rank
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def tree_rss(pid):
+    """Resident memory in bytes of ``pid`` and its children (gunicorn workers), from /proc."""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+    tree, frontier = {pid}, [pid]
+    while frontier:
+        parent = frontier.pop()
+        children = [child for child, ppid in parents.items() if ppid == parent and child not in tree]
+        tree.update(children)
+        frontier.extend(children)
+    total = 0
+    for member in tree:
+        try:
+            with open(f"/proc/{member}/status") as f:
+                total += next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmRSS:"))
+        except (OSError, StopIteration):
+            continue
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        "End-to-end load test against local provider fakes. Starts fake OpenAI, "
+        "Gemini/Imagen/Veo, Google Speech and Maps servers, runs the app pointed at "
+        "them (runserver, or --server-cmd such as gunicorn; --url for a server you "
+        "started yourself), drives each scenario under a load pattern and reports "
+        "p50/p95/p99 latency, throughput, DB queries per request (from the "
+        "Server-Timing header), provider calls per request and server RSS. "
+        "--save-baseline writes the results; --baseline fails on regressions. The "
+        "server it starts gets a throwaway SQLite database, log spool and cache, "
+        "deleted afterwards, so nothing reaches the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=DEFAULT_SCENARIOS)
+        parser.add_argument("--concurrency", type=int, default=8, help="Peak number of concurrent clients")
+        parser.add_argument("--duration", type=float, default=20, help="Seconds measured per scenario")
+        parser.add_argument("--warmup", type=float, default=3, help="Unmeasured seconds per scenario")
+        parser.add_argument("--pattern", choices=PATTERNS, default="constant",
+                            help="constant: all clients throughout; ramp: 1 to --concurrency; "
+                                 "spike: a quarter of them, all of them for the middle fifth")
+        parser.add_argument("--latency-ms", type=float, default=300, help="Median fake provider latency")
+        parser.add_argument("--latency-p99-ms", type=float, default=1500)
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of provider calls failing with 503")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--url", help="Test an already running server (configured for the fakes and a "
+                                          "scratch database by you) instead")
+        parser.add_argument("--server-cmd", help='Server command line, "{bind}" is replaced by host:port '
+                                                 '(default: manage.py runserver --noreload)')
+        parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout")
+        parser.add_argument("--baseline", help="Compare against this baseline file and fail on regressions")
+        parser.add_argument("--save-baseline", help="Write the results to this baseline file")
+        parser.add_argument("--tolerance", type=float, default=0.2,
+                            help="Allowed relative slowdown (p95, throughput) before a regression is reported")
+
+    def handle(self, *args, **options):
+        run = uuid.uuid4().hex[:8]
+        fake_options = {
+            "latency_ms": options["latency_ms"], "latency_p99_ms": options["latency_p99_ms"],
+            "error_rate": options["error_rate"], "seed": options["seed"],
+        }
+        fakes = {
+            "openai": FakeOpenAI(**fake_options),
+            "gemini": FakeGemini(**fake_options),
+            "speech": FakeGoogleSpeech(**fake_options),
+            "maps": FakeGoogleMaps(**fake_options),
+        }
+        user = None
+        workdir = None if options["url"] else tempfile.mkdtemp(prefix="areax-loadtest-")
+        server = None
+        try:
+            for fake in fakes.values():
+                fake.start()
+            if options["url"]:
+                user = User.objects.create_user(f"loadtest-{run}", f"loadtest-{run}@example.invalid", run)
+                base_url = options["url"].rstrip("/")
+            else:
+                server, base_url = self.start_server(fakes, options["server_cmd"], workdir, run)
+            results = {}
+            for name in options["scenarios"]:
+                results[name] = self.run_scenario(name, base_url, run, fakes, server, options)
+                self.report(name, results[name])
+        finally:
+            if server is not None:
+                server.terminate()
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+            for fake in fakes.values():
+                fake.stop()
+            if user is not None:
+                UserLocation.objects.filter(reference_number__startswith=f"loadtest-{run}-").delete()
+                user.delete()
+            if workdir is not None:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        baseline_settings = {key: options[key] for key in (
+            "concurrency", "duration", "pattern", "latency_ms", "latency_p99_ms", "error_rate", "seed")}
+        if options["save_baseline"]:
+            with open(options["save_baseline"], "w", encoding="utf-8") as f:
+                json.dump({"settings": baseline_settings, "scenarios": results}, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Baseline written to {options['save_baseline']}")
+        if options["baseline"]:
+            self.compare(options["baseline"], baseline_settings, results, options["tolerance"])
+
+    def start_server(self, fakes, server_cmd, workdir, run):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        bind = f"127.0.0.1:{port}"
+        env = {
+            **os.environ,
+            "OPENAI_BASE_URL": f"{fakes['openai'].url}/v1",
+            "GEMINI_BASE_URL": fakes["gemini"].url,
+            "VERTEX_BASE_URL": fakes["gemini"].url,
+            "GOOGLE_SPEECH_ENDPOINT": fakes["speech"].url,
+            "SPEECH_RECOGNITION_ENDPOINT": f"{fakes['speech'].url}/speech-api/v2/recognize",
+            "GOOGLE_MAPS_BASE_URL": fakes["maps"].url,
+            "PROVIDER_FAKES": "1",
+            "VEO_POLL_INTERVAL": "0.5",
+            "TRACING_SERVER_TIMING": "true",
+            # Usage events, cost rollups, chats and the rest go to a scratch database
+            "DB_ENGINE": "sqlite",
+            "DB_NAME": os.path.join(workdir, "db.sqlite3"),
+            "LOG_SPOOL_PATH": os.path.join(workdir, "log_spool.sqlite3"),
+            "PHOTO_INDEX_DIR": os.path.join(workdir, "photo_index"),
+            "CACHE_URL": "",
+            "CACHE_DIR": os.path.join(workdir, "cache"),
+        }
+        for key in ("OPENAI_API_KEY", "GEMINI_API_KEY", "GOOGLE_MAP_API_KEY", "GOOGLE_CLOUD_PROJECT", "GCS_BUCKET_NAME"):
+            env.setdefault(key, "provider-fake")
+        if server_cmd:
+            command = server_cmd.format(bind=bind).split()
+        else:
+            command = [sys.executable, "-m", "django", "runserver", bind, "--noreload"]
+        env.setdefault("DJANGO_SETTINGS_MODULE", "areax_ai_project.settings")
+        for setup in (
+            ["migrate", "--noinput", "--verbosity", "0"],
+            ["shell", "-c", "from django.contrib.auth.models import User; "
+                            f"User.objects.create_user('loadtest-{run}', 'loadtest-{run}@example.invalid', '{run}')"],
+        ):
+            try:
+                subprocess.run([sys.executable, "-m", "django", *setup], cwd=str(settings.BASE_DIR), env=env, check=True)
+            except subprocess.CalledProcessError as e:
+                raise CommandError(f"Preparing the scratch database failed: {setup[0]} exited with {e.returncode}")
+        server = subprocess.Popen(command, cwd=str(settings.BASE_DIR), env=env)
+        base_url = f"http://{bind}"
+        deadline = time.monotonic() + 90
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"Server exited with code {server.returncode}: {' '.join(command)}")
+            try:
+                requests.get(f"{base_url}/ai/api/chatsession_history", timeout=2)
+                self.stdout.write(f"Server up on {base_url} (pid {server.pid})")
+                return server, base_url
+            except requests.RequestException:
+                time.sleep(0.5)
+        server.kill()
+        raise CommandError("Server did not start within 90s")
+
+    def active_clients(self, pattern, concurrency, elapsed, duration):
+        if pattern == "ramp":
+            return max(1, round(concurrency * min(1.0, elapsed / duration)))
+        if pattern == "spike":
+            return concurrency if 0.4 <= elapsed / duration < 0.6 else max(1, concurrency // 4)
+        return concurrency
+
+    def run_scenario(self, name, base_url, run, fakes, server, options):
+        method, path, body, upstreams = SCENARIOS[name]
+        url = f"{base_url}{path}"
+        lock = threading.Lock()
+        counter = {"next": 0}
+        samples = []  # (latency_s, ok, db_queries or None), measured phase only
+        rss_samples = []
+        phase = {"measuring": False, "stop": False, "started": time.monotonic()}
+        timeout = options["timeout"]
+
+        def client(index):
+            session = requests.Session()
+            while not phase["stop"]:
+                elapsed = time.monotonic() - phase["started"]
+                if index >= self.active_clients(options["pattern"], options["concurrency"], elapsed, options["duration"]):
+                    time.sleep(0.05)
+                    continue
+                with lock:
+                    i = counter["next"]
+                    counter["next"] += 1
+                payload = body(i, run)
+                measuring = phase["measuring"]
+                begin = time.perf_counter()
+                try:
+                    if method == "GET":
+                        response = session.get(url, params=payload, timeout=timeout)
+                    else:
+                        response = session.post(url, json=payload, timeout=timeout)
+                    ok = response.status_code < 400 or (name == "chat_history" and response.status_code == 404)
+                    counts = _SERVER_TIMING_COUNT.findall(response.headers.get("Server-Timing", ""))
+                    queries = sum(int(count) for _stage, count in counts) if "Server-Timing" in response.headers else None
+                except requests.RequestException:
+                    ok, queries = False, None
+                latency = time.perf_counter() - begin
+                if measuring and phase["measuring"]:
+                    with lock:
+                        samples.append((latency, ok, queries))
+
+        def sample_rss():
+            while not phase["stop"]:
+                if phase["measuring"] and server is not None:
+                    rss_samples.append(tree_rss(server.pid))
+                time.sleep(0.5)
+
+        threads = [threading.Thread(target=client, args=(index,), daemon=True) for index in range(options["concurrency"])]
+        threads.append(threading.Thread(target=sample_rss, daemon=True))
+        for thread in threads:
+            thread.start()
+        time.sleep(options["warmup"])
+        upstream_before = sum(fakes[upstream].request_count for upstream in upstreams)
+        measure_started = time.monotonic()
+        # The load pattern starts over for the measured phase
+        phase.update(measuring=True, started=measure_started)
+        time.sleep(options["duration"])
+        phase["measuring"] = False
+        measured = time.monotonic() - measure_started
+        upstream_calls = sum(fakes[upstream].request_count for upstream in upstreams) - upstream_before
+        phase["stop"] = True
+        for thread in threads:
+            thread.join(timeout + 5)
+
+        latencies = sorted(latency for latency, _ok, _queries in samples)
+        queries = [q for _latency, _ok, q in samples if q is not None]
+        count = len(samples)
+        return {
+            "requests": count,
+            "errors": sum(1 for _latency, ok, _queries in samples if not ok),
+            "throughput_rps": round(count / measured, 2) if measured else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "db_queries_per_request": round(sum(queries) / len(queries), 2) if queries else None,
+            "provider_calls_per_request": round(upstream_calls / count, 2) if count else None,
+            "rss_peak_mb": round(max(rss_samples) / 2**20, 1) if rss_samples else None,
+            "rss_end_mb": round(rss_samples[-1] / 2**20, 1) if rss_samples else None,
+        }
+
+    def report(self, name, result):
+        def show(value, suffix=""):
+            return "-" if value is None else f"{value}{suffix}"
+
+        self.stdout.write(
+            f"{name:24s} {result['requests']:6d} req  {result['throughput_rps']:7.2f} req/s  "
+            f"p50={result['p50_ms']:.0f}ms p95={result['p95_ms']:.0f}ms p99={result['p99_ms']:.0f}ms  "
+            f"errors={result['errors']}  queries/req={show(result['db_queries_per_request'])}  "
+            f"provider calls/req={show(result['provider_calls_per_request'])}  "
+            f"rss peak={show(result['rss_peak_mb'], 'MB')}"
+        )
+
+    def compare(self, path, current_settings, results, tolerance):
+        try:
+            with open(path, encoding="utf-8") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read baseline {path}: {e}")
+        if baseline.get("settings") != current_settings:
+            self.stdout.write(self.style.WARNING(f"Baseline was recorded with different settings: {baseline.get('settings')}"))
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get("scenarios", {}).get(name)
+            if not before:
+                continue
+            if before["p95_ms"] and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+            if before["throughput_rps"] and result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+                regressions.append(f"{name}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+            if before.get("db_queries_per_request") is not None and result["db_queries_per_request"] is not None \
+                    and result["db_queries_per_request"] > before["db_queries_per_request"] + 0.5:
+                regressions.append(f"{name}: queries/request {before['db_queries_per_request']} -> {result['db_queries_per_request']}")
+            if before.get("errors", 0) == 0 and result["errors"]:
+                regressions.append(f"{name}: {result['errors']} errors (baseline had none)")
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path}"))
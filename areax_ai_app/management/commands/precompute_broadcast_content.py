@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from areax_ai_app.content_pool import POOL_SIZE, precompute
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the pre-generated content pools of the broadcast and survey-profile "
+        "endpoints for the most requested parameter combinations (and the "
+        "defaults), after dropping expired variants. Run it periodically from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=50, help="Number of combinations to keep warm")
+        parser.add_argument("--days", type=int, default=7, help="Rank combinations by requests over this many days")
+
+    def handle(self, *args, **options):
+        generated = 0
+        for kind, params, added in precompute(options["top"], options["days"]):
+            if added is None:
+                self.stderr.write(f"{kind} {params}: failed, see the log")
+                continue
+            generated += added
+            self.stdout.write(f"{kind} {params}: {added} new variants (pool size {POOL_SIZE})")
+        self.stdout.write(f"Generated {generated} variants")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from areax_ai_app.search_index import SOURCES, optimize, rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-mirror captions, AI responses and chat history into the full-text "
+        "search index. Run once after deploying search, and whenever rows were "
+        "written without model signals (bulk_create, raw SQL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--type", choices=sorted(SOURCES), action="append", help="Only rebuild this type (repeatable)")
+
+    def handle(self, *args, **options):
+        for source in options["type"] or sorted(SOURCES):
+            written = rebuild(source)
+            self.stdout.write(f"{source}: indexed {written} documents")
+        optimize()
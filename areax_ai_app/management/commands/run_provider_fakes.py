@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from areax_ai_app.provider_fakes import (
+    FakeGemini, FakeGoogleMaps, FakeGoogleSpeech, FakeModelsLab, FakeOpenAI, FakeRunway, FakeS3,
+)
+
+FAKES = {
+    "gemini": FakeGemini,
+    "maps": FakeGoogleMaps,
+    "modelslab": FakeModelsLab,
+    "openai": FakeOpenAI,
+    "runway": FakeRunway,
+    "s3": FakeS3,
+    "speech": FakeGoogleSpeech,
+}
+
+
+class Command(BaseCommand):
+    help = "Serve a fake provider API on localhost for local runs and load tests."
+
+    def add_arguments(self, parser):
+        parser.add_argument("provider", choices=sorted(FAKES))
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth request with 429")
+        parser.add_argument("--latency-ms", type=float, default=0, help="Median added latency (not applied by s3)")
+        parser.add_argument("--latency-p99-ms", type=float, default=None, help="99th percentile added latency")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        fake = FAKES[options["provider"]](
+            port=options["port"], rate_limit_every=options["rate_limit_every"], latency_ms=options["latency_ms"],
+            latency_p99_ms=options["latency_p99_ms"], error_rate=options["error_rate"], seed=options["seed"],
+        )
+        with fake:
+            self.stdout.write(f"Fake {options['provider']} API listening on {fake.url} (Ctrl+C to stop)")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                pass
@@ -0,0 +1,293 @@
+import base64
+import binascii
+import hashlib
+import logging
+import mimetypes
+import os
+import shutil
+import tempfile
+from collections import namedtuple
+from io import BytesIO
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+from dotenv import load_dotenv
+from PIL import Image
+
+from . import tracing
+from .background_tasks import run_in_background
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+##Media storage for everything we generate or mirror (images, thumbnails,
+##videos). Objects are content-addressed, so the same bytes are stored once
+##and every URL can be cached forever; the bytes are served by the bucket/CDN
+##or the web server in front of MEDIA_ROOT, never by a Django view.
+MEDIA_BACKEND = os.getenv("MEDIA_BACKEND", "local")  # local | s3
+MEDIA_BUCKET = os.getenv("AWS_STORAGE_BUCKET_NAME")
+MEDIA_REGION = os.getenv("AWS_S3_REGION_NAME")
+# Any S3-compatible service (MinIO, provider_fakes.FakeS3, ...) instead of AWS.
+MEDIA_ENDPOINT_URL = os.getenv("MEDIA_ENDPOINT_URL")
+# Public origin objects are served from: a CDN in front of the bucket or of MEDIA_ROOT.
+MEDIA_PUBLIC_BASE_URL = os.getenv("MEDIA_PUBLIC_BASE_URL", "").rstrip("/")
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+SPOOL_SIZE = 8 * 1024 * 1024  # Streams larger than this are hashed via a temp file
+
+RENDITION_WIDTHS = (256, 640, 1280)  # 256 doubles as the thumbnail
+
+StoredMedia = namedtuple("StoredMedia", "key url content_type size renditions")
+
+
+class LocalBackend:
+    """Writes under MEDIA_ROOT; the web server (or CDN) serves MEDIA_URL."""
+
+    def __init__(self, root, base_url):
+        self.root = root
+        self.base_url = base_url
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split("/"))
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put(self, key, fileobj, content_type):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename, so readers never see half a file.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as out:
+                shutil.copyfileobj(fileobj, out, 1024 * 1024)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def get(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+
+    def url(self, key):
+        return f"{self.base_url}{key}"
+
+
+class S3Backend:
+    """S3 or any S3-compatible endpoint. boto3 switches to multipart above MULTIPART_THRESHOLD."""
+
+    def __init__(self, bucket, region=None, endpoint_url=None, public_base_url=""):
+        self.bucket = bucket
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self.public_base_url = public_base_url
+        self.client = boto3.client(
+            "s3",
+            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+            region_name=region,
+            endpoint_url=endpoint_url,
+            config=Config(s3={"addressing_style": "path"} if endpoint_url else {}),
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNK_SIZE,
+            max_concurrency=4,
+        )
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    def put(self, key, fileobj, content_type):
+        self.client.upload_fileobj(
+            fileobj, self.bucket, key,
+            ExtraArgs={"ContentType": content_type, "CacheControl": CACHE_CONTROL},
+            Config=self.transfer_config,
+        )
+
+    def get(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+    def url(self, key):
+        if self.public_base_url:
+            return f"{self.public_base_url}/{key}"
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.{self.region}.amazonaws.com/{key}"
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if MEDIA_BACKEND == "s3":
+            _backend = S3Backend(MEDIA_BUCKET, MEDIA_REGION, MEDIA_ENDPOINT_URL, MEDIA_PUBLIC_BASE_URL)
+        else:
+            base_url = f"{MEDIA_PUBLIC_BASE_URL}/" if MEDIA_PUBLIC_BASE_URL else settings.MEDIA_URL
+            _backend = LocalBackend(settings.MEDIA_ROOT, base_url)
+    return _backend
+
+
+def _extension(content_type):
+    if content_type == "image/jpeg":
+        return "jpg"  # mimetypes would say .jpe on some platforms
+    return (mimetypes.guess_extension(content_type) or ".bin").lstrip(".")
+
+
+def content_key(digest, content_type, prefix):
+    return f"{prefix}/{digest[:2]}/{digest}.{_extension(content_type)}"
+
+
+def rendition_key(key, width):
+    return f"{key.rsplit('.', 1)[0]}_w{width}.jpg"
+
+
+@tracing.traced("media.put_stream", stage="media.put")
+def put_stream(fileobj, content_type, prefix="media", renditions=False):
+    """
+    Stores a file-like object under its SHA-256 and returns a StoredMedia.
+    The stream is hashed while it is spooled (to memory up to SPOOL_SIZE, then
+    to disk), and skipped entirely when the object already exists.
+    """
+    sha = hashlib.sha256()
+    size = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+        for chunk in iter(lambda: fileobj.read(1024 * 1024), b""):
+            sha.update(chunk)
+            spool.write(chunk)
+            size += len(chunk)
+        key = content_key(sha.hexdigest(), content_type, prefix)
+        backend = get_backend()
+        if not backend.exists(key):
+            spool.seek(0)
+            backend.put(key, spool, content_type)
+    return _stored(key, content_type, size, renditions)
+
+
+@tracing.traced("media.put_bytes", stage="media.put")
+def put_bytes(data, content_type, prefix="media", renditions=False):
+    """Same as put_stream for bytes already in memory."""
+    key = content_key(hashlib.sha256(data).hexdigest(), content_type, prefix)
+    backend = get_backend()
+    if not backend.exists(key):
+        backend.put(key, BytesIO(data), content_type)
+    return _stored(key, content_type, len(data), renditions)
+
+
+def _stored(key, content_type, size, renditions):
+    backend = get_backend()
+    urls = {}
+    if renditions and content_type.startswith("image/"):
+        # Rendition keys are derived from the original's, so their URLs can be
+        # returned now and the resizing done off the request thread.
+        urls = {width: backend.url(rendition_key(key, width)) for width in RENDITION_WIDTHS}
+        run_in_background(make_renditions, key)
+    return StoredMedia(key, backend.url(key), content_type, size, urls)
+
+
+@tracing.traced("media.make_renditions", stage="media.renditions")
+def make_renditions(key):
+    """
+    Writes JPEG copies of the image at every RENDITION_WIDTHS width smaller
+    than the original; larger widths point at a copy of the original size.
+    """
+    backend = get_backend()
+    pending = [width for width in RENDITION_WIDTHS if not backend.exists(rendition_key(key, width))]
+    if not pending:
+        return
+    image = Image.open(BytesIO(backend.get(key)))
+    image.draft("RGB", (max(pending), max(pending)))  # Lets JPEG decode at reduced scale
+    image = image.convert("RGB")
+    for width in sorted(pending, reverse=True):
+        if image.width > width:
+            image.thumbnail((width, width * image.height // image.width), Image.LANCZOS)
+        out = BytesIO()
+        image.save(out, format="JPEG", quality=85, optimize=True, progressive=True)
+        out.seek(0)
+        backend.put(rendition_key(key, width), out, "image/jpeg")
+
+
+##Image passthrough: providers already hand us encoded images, so we look at
+##the magic bytes and store them as they are. PIL is only involved when the
+##caller needs a different format than the provider produced.
+_MAGIC = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+_PIL_FORMATS = {"image/jpeg": "JPEG", "image/png": "PNG", "image/webp": "WEBP", "image/gif": "GIF"}
+
+
+def sniff_image_type(data):
+    """Returns the image MIME type from the leading bytes, or None."""
+    for magic, content_type in _MAGIC:
+        if data.startswith(magic):
+            return content_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def coerce_image_bytes(data):
+    """
+    Returns ``(raw_bytes, content_type)`` for provider image data that may be
+    raw bytes or base64 (str or bytes), depending on SDK version.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        data = bytes(data)
+        content_type = sniff_image_type(data)
+        if content_type:
+            return data, content_type
+    try:
+        raw = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Provider returned image data that is neither an image nor base64")
+    content_type = sniff_image_type(raw)
+    if content_type is None:
+        raise ValueError("Unrecognised image format from provider")
+    return raw, content_type
+
+
+@tracing.traced("media.transcode", stage="media.transcode")
+def transcode(data, content_type):
+    """Re-encodes image bytes into ``content_type``."""
+    image = Image.open(BytesIO(data))
+    if content_type == "image/jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    out = BytesIO()
+    image.save(out, format=_PIL_FORMATS[content_type], **({"quality": 90} if content_type == "image/jpeg" else {}))
+    return out.getvalue()
+
+
+def put_image(data, target_type=None, prefix="media", renditions=False):
+    """
+    Stores provider image data (raw or base64). The bytes go to storage
+    untouched unless ``target_type`` is set and differs from what was sniffed.
+    """
+    raw, content_type = coerce_image_bytes(data)
+    if target_type and target_type != content_type:
+        raw, content_type = transcode(raw, target_type), target_type
+    return put_bytes(raw, content_type, prefix=prefix, renditions=renditions)
+
+
+def absolute_url(url, base_url):
+    """
+    Prefixes relative MEDIA_URL paths (local backend without a CDN) with the
+    site's base URL for API responses; bucket/CDN URLs pass through.
+    """
+    if url.startswith(("http://", "https://")):
+        return url
+    return f"{base_url}{url}"
@@ -0,0 +1,267 @@
+import atexit
+import contextvars
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+##Versioned price table (USD). A new price list gets a new version key; old
+##UsageEvent rows keep the version they were priced with.
+##Units: *_per_1k -> per 1000 tokens, per_1k_chars -> per 1000 characters,
+##per_image, per_video_second, per_audio_minute, per_request.
+PRICE_TABLES = {
+    "2025-06": {
+        ("openai", "gpt-4"): {"input_per_1k": "0.03", "output_per_1k": "0.06"},
+        ("openai", "gpt-4o"): {"input_per_1k": "0.0025", "output_per_1k": "0.01"},
+        ("openai", "whisper-1"): {"per_audio_minute": "0.006"},
+        ("openai", "tts-1"): {"per_1k_chars": "0.015"},
+        ("openai", "dall-e-3"): {"per_image": "0.04"},
+        ("gemini", "gemini-2.0-flash"): {"input_per_1k": "0.0001", "output_per_1k": "0.0004"},
+        ("gemini", "gemini-2.0-flash-001"): {"input_per_1k": "0.0001", "output_per_1k": "0.0004"},
+        ("gemini", "gemini-2.0-flash-exp"): {"input_per_1k": "0.0001", "output_per_1k": "0.0004"},
+        ("gemini", "gemini-1.5-pro"): {"input_per_1k": "0.00125", "output_per_1k": "0.005"},
+        ("gemini", "imagen-3.0-generate-002"): {"per_image": "0.03"},
+        ("gemini", "veo-2.0-generate-001"): {"per_video_second": "0.50"},
+        ("google", "speech-to-text"): {"per_audio_minute": "0.016"},
+        ("google", "text-to-speech"): {"per_1k_chars": "0.016"},
+        ("huggingface", "FLUX.1-dev"): {"per_image": "0"},
+        ("stability", "sd3-medium"): {"per_image": "0.035"},
+        ("runway", "gen3a_turbo"): {"per_video_second": "0.05"},
+        ("modelslab", "cogvideox"): {"per_request": "0.2"},
+        ("together", "meta-llama/Llama-3.3-70B-Instruct-Turbo"): {"input_per_1k": "0.00088", "output_per_1k": "0.00088"},
+    },
+}
+PRICE_VERSION = os.getenv("METERING_PRICE_VERSION", "2025-06")
+
+FLUSH_INTERVAL = float(os.getenv("METERING_FLUSH_INTERVAL", "2"))
+FLUSH_BATCH_SIZE = int(os.getenv("METERING_FLUSH_BATCH_SIZE", "200"))
+
+_ZERO = Decimal("0")
+
+
+def price(provider, model, version=None, input_tokens=0, output_tokens=0, image_units=0,
+          video_seconds=0, audio_seconds=0, characters=0):
+    """
+    Prices one call from the versioned table. Returns
+    ``(input_cost, output_cost, total_cost)`` as Decimals; unknown models cost 0
+    and are logged so the table can be extended.
+    """
+    rates = PRICE_TABLES.get(version or PRICE_VERSION, {}).get((provider, model))
+    if rates is None:
+        logger.warning("No price for %s/%s in price table %s", provider, model, version or PRICE_VERSION)
+        return _ZERO, _ZERO, _ZERO
+
+    def rate(key):
+        return Decimal(rates.get(key, "0"))
+
+    input_cost = rate("input_per_1k") * input_tokens / 1000
+    output_cost = (
+        rate("output_per_1k") * output_tokens / 1000
+        + rate("per_image") * image_units
+        + rate("per_video_second") * Decimal(str(video_seconds))
+        + rate("per_audio_minute") * Decimal(str(audio_seconds)) / 60
+        + rate("per_1k_chars") * characters / 1000
+        + rate("per_request")
+    )
+    q = Decimal("0.000001")
+    input_cost, output_cost = input_cost.quantize(q), output_cost.quantize(q)
+    return input_cost, output_cost, input_cost + output_cost
+
+
+##Request attribution: the middleware resets it per request, views add the user.
+_attribution = contextvars.ContextVar("metering_attribution", default={})
+
+
+def reset(endpoint=""):
+    _attribution.set({"endpoint": endpoint or ""})
+
+
+def bind(**fields):
+    """Attaches user_email / user_reference_number (or endpoint) to this request's calls."""
+    _attribution.set({**_attribution.get(), **{k: v for k, v in fields.items() if v}})
+
+
+class Meter:
+    """
+    Measures one provider call. Use as a context manager around the call and
+    report units with ``from_openai`` / ``from_gemini`` / ``add``. The priced
+    costs are available on the object after the block exits.
+    """
+
+    def __init__(self, provider, model, **attribution):
+        self.provider = provider
+        self.model = model
+        self.attribution = {**_attribution.get(), **{k: v for k, v in attribution.items() if v}}
+        self.units = defaultdict(float)
+        self.status = "ok"
+        self.latency_ms = 0
+        self.input_cost = self.output_cost = self.total_cost = _ZERO
+
+    def __enter__(self):
+        self._span = tracing.start_span(f"{self.provider} {self.model}", tracing.CLIENT, f"{self.provider}.{self.model}", {
+            "gen_ai.system": self.provider,
+            "gen_ai.request.model": self.model,
+        })
+        metrics.PROVIDER_IN_FLIGHT.inc(self.provider, self.model)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        self.latency_ms = int(elapsed * 1000)
+        if exc_type is not None:
+            self.status = "error"
+        self.input_cost, self.output_cost, self.total_cost = price(self.provider, self.model, **self._unit_kwargs())
+        _writer.enqueue(self._event())
+        metrics.PROVIDER_IN_FLIGHT.dec(self.provider, self.model)
+        metrics.PROVIDER_CALLS.inc(self.provider, self.model, self.status)
+        metrics.PROVIDER_LATENCY.observe(elapsed, self.provider, self.model)
+        metrics.PROVIDER_COST.inc(self.provider, self.model, amount=float(self.total_cost))
+        for key, value in self._unit_kwargs().items():
+            if value:
+                metrics.PROVIDER_UNITS.inc(self.provider, self.model, key, amount=value)
+                self._span.set(f"gen_ai.usage.{key}", value)
+        self._span.set("cost_usd", float(self.total_cost))
+        self._span.end(error=exc)
+        return False
+
+    def add(self, **units):
+        for key, value in units.items():
+            self.units[key] += value or 0
+        return self
+
+    def from_openai(self, response):
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.add(input_tokens=usage.prompt_tokens, output_tokens=usage.completion_tokens)
+        return self
+
+    def from_gemini(self, response):
+        # Same field names in google.generativeai and google.genai responses.
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            self.add(
+                input_tokens=getattr(usage, "prompt_token_count", 0) or 0,
+                output_tokens=getattr(usage, "candidates_token_count", 0) or 0,
+            )
+        return self
+
+    def _unit_kwargs(self):
+        return {
+            "input_tokens": int(self.units["input_tokens"]),
+            "output_tokens": int(self.units["output_tokens"]),
+            "image_units": int(self.units["image_units"]),
+            "video_seconds": self.units["video_seconds"],
+            "audio_seconds": self.units["audio_seconds"],
+            "characters": int(self.units["characters"]),
+        }
+
+    def _event(self):
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "endpoint": self.attribution.get("endpoint", "")[:100],
+            "user_email": self.attribution.get("user_email", "") or "",
+            "user_reference_number": self.attribution.get("user_reference_number", "") or "",
+            "status": self.status,
+            "latency_ms": self.latency_ms,
+            "price_version": PRICE_VERSION,
+            "input_cost": self.input_cost,
+            "output_cost": self.output_cost,
+            "total_cost": self.total_cost,
+            "created_at": timezone.now(),
+            **self._unit_kwargs(),
+        }
+
+
+def meter(provider, model, **attribution):
+    return Meter(provider, model, **attribution)
+
+
+##Asynchronous batch writer
+class UsageWriter:
+    """
+    Collects usage events in memory and writes them from a daemon thread with
+    one bulk_create per batch, then rolls the batch into the cost ledger.
+    Request threads only pay for a queue put.
+    """
+
+    def __init__(self, maxsize=10000):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, event):
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            logger.error("Usage queue full, dropping event for %s/%s", event["provider"], event["model"])
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="areax-metering", daemon=True)
+                self._thread.start()
+
+    def _drain(self, first):
+        batch = [first]
+        while len(batch) < FLUSH_BATCH_SIZE:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            self.write(self._drain(first))
+
+    def flush(self):
+        """Writes everything queued so far on the calling thread."""
+        while True:
+            try:
+                first = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            self.write(self._drain(first))
+
+    def write(self, batch):
+        from .cost_ledger import record_cost
+        from .models import UsageEvent
+
+        close_old_connections()
+        try:
+            UsageEvent.objects.bulk_create([UsageEvent(**event) for event in batch])
+            rollup = defaultdict(lambda: [_ZERO, 0])
+            for event in batch:
+                key = (event["provider"], event["user_email"], timezone.localdate(event["created_at"]))
+                rollup[key][0] += event["total_cost"]
+                rollup[key][1] += 1
+            for (provider, user_email, day), (amount, count) in rollup.items():
+                record_cost(provider, amount, user_email, day, count=count)
+        except Exception:
+            logger.exception("Failed to write %d usage events", len(batch))
+        finally:
+            close_old_connections()
+
+
+_writer = UsageWriter()
+atexit.register(_writer.flush)
+metrics.QUEUE_DEPTH.set_function(lambda: _writer._queue.qsize(), "usage_events")
@@ -0,0 +1,298 @@
+import atexit
+import bisect
+import fcntl
+import glob
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+##Prometheus metrics without a client library. Every thread updates its own
+##shard (plain dicts only that thread writes to), so recording a sample takes
+##no lock. A flusher thread merges the shards and, when METRICS_DIR is set,
+##writes the process's totals to METRICS_DIR/<pid>-<token>.json every
+##METRICS_FLUSH_INTERVAL seconds; /metrics sums the files of all gunicorn
+##workers. Gauges of processes that stopped flushing are ignored, and their
+##counters are folded into archive.json so they stay monotonic.
+METRICS_DIR = os.getenv("METRICS_DIR") or os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")  # When set, /metrics wants "Authorization: Bearer <token>"
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+STALE_AFTER = FLUSH_INTERVAL * 6  # A file not rewritten for this long belongs to a dead process
+ARCHIVE_AFTER = max(600, STALE_AFTER)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PROVIDER_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600)  # Video generation runs for minutes
+
+_metrics = {}  # name -> metric
+_local = threading.local()
+_shards = []  # (thread, counters, histograms, gauges) of every thread that recorded something
+_shards_lock = threading.Lock()
+_retired = ({}, {}, {})  # Totals of shards whose thread has exited
+_process = {"file": None, "thread": None}
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = ({}, {}, {})
+        with _shards_lock:
+            _shards.append((threading.current_thread(), *shard))
+        _start_flusher()
+        return shard
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        _metrics[name] = self
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        counters = _shard()[0]
+        key = (self.name, labels)
+        counters[key] = counters.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Summed over threads and live processes. ``set_function`` reports a value read at flush time instead."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._functions = {}  # labels -> callable
+
+    def inc(self, *labels, amount=1):
+        gauges = _shard()[2]
+        key = (self.name, labels)
+        gauges[key] = gauges.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set_function(self, fn, *labels):
+        self._functions[labels] = fn
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        histograms = _shard()[1]
+        key = (self.name, labels)
+        entry = histograms.get(key)
+        if entry is None:
+            entry = histograms[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+
+HTTP_REQUESTS = Counter("areax_http_requests_total", "Requests served.", ("endpoint", "method", "status"))
+HTTP_LATENCY = Histogram("areax_http_request_duration_seconds", "Request latency.", ("endpoint",))
+HTTP_IN_FLIGHT = Gauge("areax_http_requests_in_flight", "Requests being served.")
+PROVIDER_CALLS = Counter("areax_provider_calls_total", "Upstream AI provider calls.", ("provider", "model", "status"))
+PROVIDER_LATENCY = Histogram(
+    "areax_provider_call_duration_seconds", "Upstream AI provider call latency.", ("provider", "model"), PROVIDER_BUCKETS,
+)
+PROVIDER_IN_FLIGHT = Gauge("areax_provider_calls_in_flight", "Upstream AI provider calls in progress.", ("provider", "model"))
+PROVIDER_COST = Counter("areax_provider_cost_usd_total", "Priced cost of upstream AI provider calls.", ("provider", "model"))
+PROVIDER_UNITS = Counter("areax_provider_units_total", "Billed units of upstream AI provider calls.", ("provider", "model", "unit"))
+QUEUE_DEPTH = Gauge("areax_queue_depth", "Items waiting in in-process queues.", ("queue",))
+
+
+##Aggregation
+def _merge(target, source):
+    counters, histograms, gauges = target
+    for key, value in list(source[0].items()):
+        counters[key] = counters.get(key, 0) + value
+    for key, (counts, total) in list(source[1].items()):
+        entry = histograms.get(key)
+        if entry is None or len(entry[0]) != len(counts):
+            histograms[key] = [list(counts), total]
+        else:
+            entry[0] = [a + b for a, b in zip(entry[0], counts)]
+            entry[1] += total
+    for key, value in list(source[2].items()):
+        gauges[key] = gauges.get(key, 0) + value
+
+
+def snapshot():
+    """This process's totals as ``(counters, histograms, gauges)``."""
+    with _shards_lock:
+        for shard in [shard for shard in _shards if not shard[0].is_alive()]:
+            _shards.remove(shard)
+            _merge(_retired, shard[1:])
+        shards = list(_shards)
+    totals = ({}, {}, {})
+    _merge(totals, _retired)
+    for _thread, counters, histograms, gauges in shards:
+        # Copying a dict is atomic under the GIL, so the owning thread can keep writing
+        _merge(totals, (dict(counters), {k: (list(v[0]), v[1]) for k, v in dict(histograms).items()}, dict(gauges)))
+    for metric in _metrics.values():
+        for labels, fn in getattr(metric, "_functions", {}).items():
+            try:
+                totals[2][(metric.name, labels)] = totals[2].get((metric.name, labels), 0) + fn()
+            except Exception:
+                logger.exception("Gauge %s%s failed", metric.name, labels)
+    return totals
+
+
+def _encode(totals):
+    counters, histograms, gauges = totals
+    return {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), counts, total] for (name, labels), (counts, total) in histograms.items()],
+        "gauges": [[name, list(labels), value] for (name, labels), value in gauges.items()],
+    }
+
+
+def _decode(data, into, gauges=True):
+    _merge(into, (
+        {(name, tuple(labels)): value for name, labels, value in data.get("counters", [])},
+        {(name, tuple(labels)): (counts, total) for name, labels, counts, total in data.get("histograms", [])},
+        {(name, tuple(labels)): value for name, labels, value in data.get("gauges", [])} if gauges else {},
+    ))
+
+
+def _write(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def flush():
+    """Writes this process's totals to its file in METRICS_DIR."""
+    if not METRICS_DIR:
+        return
+    if _process["file"] is None or not _process["file"].startswith(os.path.join(METRICS_DIR, f"{os.getpid()}-")):
+        # New file after a fork, so a preforked worker never overwrites its parent's
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _process["file"] = os.path.join(METRICS_DIR, f"{os.getpid()}-{secrets.token_hex(4)}.json")
+    try:
+        _write(_process["file"], _encode(snapshot()))
+    except OSError as e:
+        logger.warning("Could not write metrics to %s: %s", _process["file"], e)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def _start_flusher():
+    if not METRICS_DIR or (_process["thread"] is not None and _process["thread"].is_alive()):
+        return
+    with _shards_lock:
+        if _process["thread"] is None or not _process["thread"].is_alive():
+            _process["thread"] = threading.Thread(target=_flush_loop, name="areax-metrics", daemon=True)
+            _process["thread"].start()
+
+
+def _archive_dead(now):
+    """Folds the counters and histograms of long-dead processes into archive.json and removes their files."""
+    archive_path = os.path.join(METRICS_DIR, "archive.json")
+    with open(os.path.join(METRICS_DIR, "archive.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = [
+            path for path in glob.glob(os.path.join(METRICS_DIR, "*-*.json"))
+            if path != _process["file"] and now - os.path.getmtime(path) > ARCHIVE_AFTER
+        ]
+        if not dead:
+            return
+        archived = ({}, {}, {})
+        for path in [archive_path] + dead:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    _decode(json.load(f), archived, gauges=False)
+            except (OSError, ValueError):
+                continue
+        _write(archive_path, _encode(archived))
+        for path in dead:
+            os.unlink(path)
+
+
+def collect():
+    """Totals over every process sharing METRICS_DIR (or just this one)."""
+    if not METRICS_DIR:
+        return snapshot()
+    flush()
+    now = time.time()
+    try:
+        _archive_dead(now)
+    except OSError as e:
+        logger.warning("Could not archive dead process metrics: %s", e)
+    totals = ({}, {}, {})
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        try:
+            mtime = os.path.getmtime(path)
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # Replaced or removed while we listed the directory
+        live = not path.endswith("archive.json") and now - mtime <= STALE_AFTER
+        _decode(data, totals, gauges=live)
+    return totals
+
+
+##Exposition
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render():
+    """All metrics in the Prometheus text format."""
+    counters, histograms, gauges = collect()
+    series = {"counter": counters, "gauge": gauges}
+    lines = []
+    for name, metric in sorted(_metrics.items()):
+        lines.append(f"# HELP {name} {metric.help}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        if metric.kind == "histogram":
+            for (metric_name, labels), (counts, total) in sorted(histograms.items()):
+                if metric_name != name or len(counts) != len(metric.buckets) + 1:
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(metric.labels, labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(metric.labels, labels)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(metric.labels, labels)} {cumulative}")
+            continue
+        for (metric_name, labels), value in sorted(series[metric.kind].items()):
+            if metric_name == name:
+                lines.append(f"{name}{_labels(metric.labels, labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+atexit.register(flush)
@@ -0,0 +1,72 @@
+import time
+
+from django.db import connection
+
+from . import metering, metrics, tracing
+
+
+class TracingMiddleware:
+    """
+    Opens the request's root span (continuing an incoming W3C traceparent),
+    gives every database write of the request its own span while reads are
+    only counted, and with TRACING_SERVER_TIMING set reports the per-stage
+    timings in a Server-Timing header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        root = tracing.begin_request(
+            f"{request.method} {request.path}",
+            request.headers.get("traceparent"),
+            {"http.method": request.method, "http.target": request.path},
+        )
+        try:
+            with connection.execute_wrapper(tracing.db_wrapper):
+                response = self.get_response(request)
+        except Exception:
+            tracing.end_request(root, 500)
+            raise
+        timing = tracing.end_request(root, response.status_code)
+        if tracing.SERVER_TIMING:
+            response["Server-Timing"] = timing
+        response["traceresponse"] = f"00-{root.trace_id}-{root.span_id}-01"
+        return response
+
+
+class MetricsMiddleware:
+    """Counts requests and their latency per URL route (not per path, so ids don't become label values)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics.HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            metrics.HTTP_IN_FLIGHT.dec()
+            match = getattr(request, "resolver_match", None)
+            endpoint = match.route if match is not None else "unmatched"
+            metrics.HTTP_REQUESTS.inc(endpoint, request.method, str(status))
+            metrics.HTTP_LATENCY.observe(time.perf_counter() - started, endpoint)
+
+
+class MeteringContextMiddleware:
+    """
+    Starts a fresh metering attribution for every request so provider calls
+    made while serving it are recorded against its endpoint. Views add the
+    user with ``metering.bind``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metering.reset(endpoint=request.path)
+        return self.get_response(request)
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-19 05:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('areax_ai_app', '0019_smartresponse_user_image_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userlocation',
+            name='thumbnail_url',
+            field=models.URLField(blank=True, max_length=500, null=True),
+        ),
+        migrations.AddField(
+            model_name='userlocation',
+            name='thumbnail_status',
+            field=models.CharField(default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('areax_ai_app', '0020_userlocation_thumbnail_url_userlocation_thumbnail_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCostRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=50)),
+                ('user_email', models.CharField(blank=True, default='', max_length=200)),
+                ('day', models.DateField()),
+                ('request_count', models.PositiveIntegerField(default=0)),
+                ('total_cost', models.DecimalField(decimal_places=6, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['provider', 'day'], name='daily_cost_provider_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('provider', 'user_email', 'day'), name='uniq_daily_cost_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyCostRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=50)),
+                ('user_email', models.CharField(blank=True, default='', max_length=200)),
+                ('month', models.DateField()),
+                ('request_count', models.PositiveIntegerField(default=0)),
+                ('total_cost', models.DecimalField(decimal_places=6, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['provider', 'month'], name='monthly_cost_provider_month_idx')],
+                'constraints': [models.UniqueConstraint(fields=('provider', 'user_email', 'month'), name='uniq_monthly_cost_rollup')],
+            },
+        ),
+    ]
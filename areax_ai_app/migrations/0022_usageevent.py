@@ -0,0 +1,41 @@
+# Generated by Django 5.0.6 on 2026-10-19 06:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('areax_ai_app', '0021_dailycostrollup_monthlycostrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsageEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=100)),
+                ('endpoint', models.CharField(blank=True, default='', max_length=100)),
+                ('user_email', models.CharField(blank=True, default='', max_length=200)),
+                ('user_reference_number', models.CharField(blank=True, default='', max_length=200)),
+                ('status', models.CharField(default='ok', max_length=10)),
+                ('input_tokens', models.PositiveIntegerField(default=0)),
+                ('output_tokens', models.PositiveIntegerField(default=0)),
+                ('image_units', models.PositiveIntegerField(default=0)),
+                ('video_seconds', models.FloatField(default=0)),
+                ('audio_seconds', models.FloatField(default=0)),
+                ('characters', models.PositiveIntegerField(default=0)),
+                ('latency_ms', models.PositiveIntegerField(default=0)),
+                ('price_version', models.CharField(max_length=20)),
+                ('input_cost', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('output_cost', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('total_cost', models.DecimalField(decimal_places=6, default=0, max_digits=12)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['provider', 'created_at'], name='usage_provider_created_idx')],
+            },
+        ),
+    ]
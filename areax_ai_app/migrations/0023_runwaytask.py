@@ -0,0 +1,38 @@
+# Generated by Django 5.0.6 on 2026-10-19 07:55
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('areax_ai_app', '0022_usageevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunwayTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=100, unique=True)),
+                ('user_email', models.CharField(blank=True, default='', max_length=200)),
+                ('user_reference_number', models.CharField(blank=True, default='', max_length=200)),
+                ('prompt_text', models.TextField(blank=True, default='')),
+                ('prompt_image', models.TextField(blank=True, null=True)),
+                ('status', models.CharField(default='PENDING', max_length=20)),
+                ('progress', models.FloatField(default=0)),
+                ('output', models.JSONField(blank=True, null=True)),
+                ('failure', models.TextField(blank=True, null=True)),
+                ('failure_code', models.CharField(blank=True, max_length=100, null=True)),
+                ('poll_count', models.PositiveIntegerField(default=0)),
+                ('next_poll_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_poll_at'], name='runway_task_due_idx')],
+            },
+        ),
+    ]
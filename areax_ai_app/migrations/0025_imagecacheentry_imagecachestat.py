@@ -0,0 +1,71 @@
+# Generated by Django 5.0.6 on 2026-10-19 09:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('areax_ai_app', '0024_videodb_modelslab_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cache_key', models.CharField(max_length=64)),
+                ('slot', models.PositiveSmallIntegerField(default=0)),
+                ('provider', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=100)),
+                ('prompt', models.TextField()),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('media_key', models.CharField(max_length=300)),
+                ('url', models.CharField(max_length=500)),
+                ('content_type', models.CharField(max_length=50)),
+                ('renditions', models.JSONField(blank=True, default=dict)),
+                ('phash', models.BigIntegerField(blank=True, null=True)),
+                ('phash_band0', models.PositiveIntegerField(blank=True, null=True)),
+                ('phash_band1', models.PositiveIntegerField(blank=True, null=True)),
+                ('phash_band2', models.PositiveIntegerField(blank=True, null=True)),
+                ('phash_band3', models.PositiveIntegerField(blank=True, null=True)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField()),
+                ('duplicate_of', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='areax_ai_app.imagecacheentry')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['last_used_at'], name='image_cache_lru_idx'),
+                    models.Index(fields=['expires_at'], name='image_cache_expiry_idx'),
+                    models.Index(fields=['phash_band0'], name='image_cache_band0_idx'),
+                    models.Index(fields=['phash_band1'], name='image_cache_band1_idx'),
+                    models.Index(fields=['phash_band2'], name='image_cache_band2_idx'),
+                    models.Index(fields=['phash_band3'], name='image_cache_band3_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('cache_key', 'slot'), name='uniq_image_cache_slot'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImageCacheStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=50)),
+                ('day', models.DateField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('misses', models.PositiveIntegerField(default=0)),
+                ('near_duplicates', models.PositiveIntegerField(default=0)),
+                ('saved_cost', models.DecimalField(decimal_places=6, default=0, max_digits=14)),
+            ],
+            options={
+                'constraints': [
+                    models.UniqueConstraint(fields=('provider', 'day'), name='uniq_image_cache_stat'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.6 on 2026-10-19 10:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('areax_ai_app', '0025_imagecacheentry_imagecachestat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GooglePhotoItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_email', models.CharField(max_length=200)),
+                ('media_item_id', models.CharField(max_length=255)),
+                ('filename', models.CharField(blank=True, default='', max_length=255)),
+                ('mime_type', models.CharField(blank=True, default='', max_length=100)),
+                ('creation_time', models.DateTimeField(blank=True, null=True)),
+                ('metadata', models.JSONField(default=dict)),
+                ('phash', models.BigIntegerField(blank=True, null=True)),
+                ('phash_band0', models.PositiveIntegerField(blank=True, null=True)),
+                ('phash_band1', models.PositiveIntegerField(blank=True, null=True)),
+                ('phash_band2', models.PositiveIntegerField(blank=True, null=True)),
+                ('phash_band3', models.PositiveIntegerField(blank=True, null=True)),
+                ('synced_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['user_email', 'filename'], name='google_photo_filename_idx'),
+                    models.Index(fields=['user_email', 'phash_band0'], name='google_photo_band0_idx'),
+                    models.Index(fields=['user_email', 'phash_band1'], name='google_photo_band1_idx'),
+                    models.Index(fields=['user_email', 'phash_band2'], name='google_photo_band2_idx'),
+                    models.Index(fields=['user_email', 'phash_band3'], name='google_photo_band3_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('user_email', 'media_item_id'), name='uniq_google_photo_item'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='GooglePhotoSyncState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_email', models.CharField(max_length=200, unique=True)),
+                ('item_count', models.PositiveIntegerField(default=0)),
+                ('newest_creation_time', models.DateTimeField(blank=True, null=True)),
+                ('last_synced_at', models.DateTimeField(blank=True, null=True)),
+                ('last_full_sync_at', models.DateTimeField(blank=True, null=True)),
+                ('sync_started_at', models.DateTimeField(blank=True, null=True)),
+                ('error', models.TextField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('areax_ai_app', '0026_googlephotoitem_googlephotosyncstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhotoEmbedding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_email', models.CharField(max_length=200)),
+                ('source', models.CharField(max_length=20)),
+                ('source_id', models.CharField(max_length=255)),
+                ('row', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_email', 'row'], name='photo_embedding_row_idx')],
+                'constraints': [
+                    models.UniqueConstraint(fields=('user_email', 'source', 'source_id'), name='uniq_photo_embedding'),
+                ],
+            },
+        ),
+    ]
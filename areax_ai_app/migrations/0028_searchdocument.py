@@ -0,0 +1,71 @@
+# Generated by Django 5.0.6 on 2026-10-19 11:10
+
+from django.db import migrations, models
+
+# The full-text index lives outside the ORM: an FTS5 table kept current by
+# triggers on SQLite, a generated tsvector column with a GIN index on
+# PostgreSQL. Other databases fall back to a LIKE scan in search_index.
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE areax_search_fts USING fts5("
+    "body, content='areax_ai_app_searchdocument', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER areax_search_fts_ai AFTER INSERT ON areax_ai_app_searchdocument BEGIN "
+    "INSERT INTO areax_search_fts(rowid, body) VALUES (new.id, new.body); END",
+    "CREATE TRIGGER areax_search_fts_ad AFTER DELETE ON areax_ai_app_searchdocument BEGIN "
+    "INSERT INTO areax_search_fts(areax_search_fts, rowid, body) VALUES ('delete', old.id, old.body); END",
+    "CREATE TRIGGER areax_search_fts_au AFTER UPDATE ON areax_ai_app_searchdocument BEGIN "
+    "INSERT INTO areax_search_fts(areax_search_fts, rowid, body) VALUES ('delete', old.id, old.body); "
+    "INSERT INTO areax_search_fts(rowid, body) VALUES (new.id, new.body); END",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS areax_search_fts_au",
+    "DROP TRIGGER IF EXISTS areax_search_fts_ad",
+    "DROP TRIGGER IF EXISTS areax_search_fts_ai",
+    "DROP TABLE IF EXISTS areax_search_fts",
+]
+POSTGRES_FORWARD = [
+    "ALTER TABLE areax_ai_app_searchdocument ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('english', coalesce(body, ''))) STORED",
+    "CREATE INDEX areax_search_vector_idx ON areax_ai_app_searchdocument USING GIN (search_vector)",
+]
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS areax_search_vector_idx",
+    "ALTER TABLE areax_ai_app_searchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('areax_ai_app', '0027_photoembedding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=30)),
+                ('object_id', models.CharField(max_length=64)),
+                ('user_email', models.CharField(blank=True, default='', max_length=200)),
+                ('body', models.TextField()),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_email', 'source'], name='search_doc_user_idx')],
+                'constraints': [
+                    models.UniqueConstraint(fields=('source', 'object_id'), name='uniq_search_document'),
+                ],
+            },
+        ),
+        migrations.RunPython(
+            _run({"sqlite": SQLITE_FORWARD, "postgresql": POSTGRES_FORWARD}),
+            _run({"sqlite": SQLITE_BACKWARD, "postgresql": POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.6 on 2026-10-19 11:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    # Lowest user id wins when several accounts share an email (case-insensitively)
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    UserEmailIndex = apps.get_model("areax_ai_app", "UserEmailIndex")
+    seen, batch = set(), []
+    for user_id, email in User.objects.exclude(email="").order_by("pk").values_list("pk", "email").iterator():
+        email = email.strip().lower()
+        if not email or email in seen:
+            continue
+        seen.add(email)
+        batch.append(UserEmailIndex(user_id=user_id, email=email))
+        if len(batch) >= 1000:
+            UserEmailIndex.objects.bulk_create(batch)
+            batch = []
+    UserEmailIndex.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('areax_ai_app', '0028_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserEmailIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.CharField(max_length=254, unique=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='email_index', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
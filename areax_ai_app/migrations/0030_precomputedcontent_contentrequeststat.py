@@ -0,0 +1,51 @@
+# Generated by Django 5.0.6 on 2026-10-19 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('areax_ai_app', '0029_useremailindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecomputedContent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=30)),
+                ('params_key', models.CharField(max_length=64)),
+                ('params', models.JSONField(default=dict)),
+                ('content', models.TextField()),
+                ('served_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_served_at', models.DateTimeField(blank=True, null=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['kind', 'params_key', 'expires_at'], name='precomputed_pool_idx'),
+                    models.Index(fields=['expires_at'], name='precomputed_expiry_idx'),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name='ContentRequestStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=30)),
+                ('params_key', models.CharField(max_length=64)),
+                ('params', models.JSONField(default=dict)),
+                ('day', models.DateField()),
+                ('requests', models.PositiveIntegerField(default=0)),
+                ('pool_hits', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'kind'], name='content_request_day_idx')],
+                'constraints': [
+                    models.UniqueConstraint(fields=('kind', 'params_key', 'day'), name='uniq_content_request_stat'),
+                ],
+            },
+        ),
+    ]
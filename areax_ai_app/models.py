@@ -117,6 +117,8 @@ class UserLocation(models.Model):
     lng = models.DecimalField(max_digits=9, decimal_places=6)
     place_name = models.CharField(max_length=255, blank=True, null=True)
     notification_content = models.TextField(null=True,blank=True)
+    thumbnail_url = models.URLField(max_length=500,null=True,blank=True)
+    thumbnail_status = models.CharField(max_length=20,default="pending")  # pending / ready / failed
     updated_at = models.DateTimeField(default=now,null=True,blank=True)  # Default to the current timestamp
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -133,6 +135,22 @@ class VideoDB(models.Model):
     prompt = models.TextField(blank=True,null=True)
     video_url = models.URLField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    ##ModelsLab job tracking: video_url holds the future link until the job resolves
+    provider_job_id = models.CharField(max_length=100, blank=True, null=True)
+    track_id = models.CharField(max_length=100, blank=True, null=True, unique=True)  # Ours, echoed by the webhook
+    client_track_id = models.CharField(max_length=200, blank=True, null=True)
+    client_webhook = models.URLField(max_length=500, blank=True, null=True)
+    status = models.CharField(max_length=20, default="success")  # processing / success / failed
+    error = models.TextField(blank=True, null=True)
+    size = models.BigIntegerField(blank=True, null=True)  # Bytes
+    duration = models.FloatField(blank=True, null=True)  # Seconds
+    mirrored_url = models.URLField(max_length=500, blank=True, null=True)
+    check_count = models.PositiveIntegerField(default=0)
+    next_check_at = models.DateTimeField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_check_at"], name="video_status_check_idx")]
 
     def __str__(self):
         return f"Video for prompt: {self.prompt}"
@@ -231,3 +249,291 @@ class WellnessBotLog(models.Model):
     response = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+
+
+#####COST LEDGER: materialised cost rollups per provider and user
+class DailyCostRollup(models.Model):
+    provider = models.CharField(max_length=50)
+    user_email = models.CharField(max_length=200, blank=True, default="")  # "" when the source row has no user
+    day = models.DateField()
+    request_count = models.PositiveIntegerField(default=0)
+    total_cost = models.DecimalField(max_digits=14, decimal_places=6, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["provider", "user_email", "day"], name="uniq_daily_cost_rollup"),
+        ]
+        indexes = [models.Index(fields=["provider", "day"], name="daily_cost_provider_day_idx")]
+
+    def __str__(self):
+        return f"{self.provider} {self.day} ${self.total_cost}"
+
+
+class MonthlyCostRollup(models.Model):
+    provider = models.CharField(max_length=50)
+    user_email = models.CharField(max_length=200, blank=True, default="")
+    month = models.DateField()  # First day of the month
+    request_count = models.PositiveIntegerField(default=0)
+    total_cost = models.DecimalField(max_digits=14, decimal_places=6, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["provider", "user_email", "month"], name="uniq_monthly_cost_rollup"),
+        ]
+        indexes = [models.Index(fields=["provider", "month"], name="monthly_cost_provider_month_idx")]
+
+    def __str__(self):
+        return f"{self.provider} {self.month:%B %Y} ${self.total_cost}"
+
+
+#####METERING: one row per upstream provider call, written in batches
+class UsageEvent(models.Model):
+    provider = models.CharField(max_length=50)
+    model = models.CharField(max_length=100)
+    endpoint = models.CharField(max_length=100, blank=True, default="")
+    user_email = models.CharField(max_length=200, blank=True, default="")
+    user_reference_number = models.CharField(max_length=200, blank=True, default="")
+    status = models.CharField(max_length=10, default="ok")  # ok / error
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    image_units = models.PositiveIntegerField(default=0)
+    video_seconds = models.FloatField(default=0)
+    audio_seconds = models.FloatField(default=0)
+    characters = models.PositiveIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(default=0)
+    price_version = models.CharField(max_length=20)
+    input_cost = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    output_cost = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    total_cost = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+    created_at = models.DateTimeField(default=now)  # Capture time, not flush time
+
+    class Meta:
+        indexes = [models.Index(fields=["provider", "created_at"], name="usage_provider_created_idx")]
+
+    def __str__(self):
+        return f"{self.provider}/{self.model} ${self.total_cost}"
+
+
+#####RUNWAY: generation tasks tracked by the background poller
+class RunwayTask(models.Model):
+    # Runway's own task statuses
+    STATUS_PENDING = "PENDING"
+    STATUS_THROTTLED = "THROTTLED"
+    STATUS_RUNNING = "RUNNING"
+    STATUS_SUCCEEDED = "SUCCEEDED"
+    STATUS_FAILED = "FAILED"
+    STATUS_CANCELLED = "CANCELLED"
+    ACTIVE_STATUSES = (STATUS_PENDING, STATUS_THROTTLED, STATUS_RUNNING)
+
+    task_id = models.CharField(max_length=100, unique=True)  # Runway's task id
+    user_email = models.CharField(max_length=200, blank=True, default="")
+    user_reference_number = models.CharField(max_length=200, blank=True, default="")
+    prompt_text = models.TextField(blank=True, default="")
+    prompt_image = models.TextField(blank=True, null=True)
+    status = models.CharField(max_length=20, default=STATUS_PENDING)
+    progress = models.FloatField(default=0)
+    output = models.JSONField(blank=True, null=True)  # List of video URLs once SUCCEEDED
+    failure = models.TextField(blank=True, null=True)
+    failure_code = models.CharField(max_length=100, blank=True, null=True)
+    poll_count = models.PositiveIntegerField(default=0)
+    next_poll_at = models.DateTimeField(default=now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_poll_at"], name="runway_task_due_idx")]
+
+    def __str__(self):
+        return f"Runway task {self.task_id} ({self.status})"
+
+
+#####IMAGE CACHE: generated images reused for repeated prompts
+class ImageCacheEntry(models.Model):
+    cache_key = models.CharField(max_length=64)  # sha256 of provider, model, normalised prompt and params
+    slot = models.PositiveSmallIntegerField(default=0)  # Position of the image within one request
+    provider = models.CharField(max_length=50)
+    model = models.CharField(max_length=100)
+    prompt = models.TextField()  # Normalised prompt
+    params = models.JSONField(default=dict, blank=True)
+    media_key = models.CharField(max_length=300)
+    url = models.CharField(max_length=500)
+    content_type = models.CharField(max_length=50)
+    renditions = models.JSONField(default=dict, blank=True)
+    # 64-bit dHash of the image (signed for the database) and its four 16-bit
+    # bands; any two hashes within 3 bits share at least one band exactly.
+    phash = models.BigIntegerField(blank=True, null=True)
+    phash_band0 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band1 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band2 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band3 = models.PositiveIntegerField(blank=True, null=True)
+    duplicate_of = models.ForeignKey("self", on_delete=models.SET_NULL, blank=True, null=True, related_name="duplicates")
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["cache_key", "slot"], name="uniq_image_cache_slot"),
+        ]
+        indexes = [
+            models.Index(fields=["last_used_at"], name="image_cache_lru_idx"),
+            models.Index(fields=["expires_at"], name="image_cache_expiry_idx"),
+            models.Index(fields=["phash_band0"], name="image_cache_band0_idx"),
+            models.Index(fields=["phash_band1"], name="image_cache_band1_idx"),
+            models.Index(fields=["phash_band2"], name="image_cache_band2_idx"),
+            models.Index(fields=["phash_band3"], name="image_cache_band3_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.provider}/{self.model} '{self.prompt[:40]}' #{self.slot}"
+
+
+class ImageCacheStat(models.Model):
+    provider = models.CharField(max_length=50)
+    day = models.DateField()
+    hits = models.PositiveIntegerField(default=0)
+    misses = models.PositiveIntegerField(default=0)
+    near_duplicates = models.PositiveIntegerField(default=0)
+    saved_cost = models.DecimalField(max_digits=14, decimal_places=6, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["provider", "day"], name="uniq_image_cache_stat"),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.day} {self.hits} hits / {self.misses} misses"
+
+
+#####GOOGLE PHOTOS: per-user index of library metadata, refreshed incrementally
+class GooglePhotoItem(models.Model):
+    user_email = models.CharField(max_length=200)
+    media_item_id = models.CharField(max_length=255)
+    filename = models.CharField(max_length=255, blank=True, default="")
+    mime_type = models.CharField(max_length=100, blank=True, default="")
+    creation_time = models.DateTimeField(blank=True, null=True)
+    metadata = models.JSONField(default=dict)  # mediaItem as returned by the Library API
+    # dHash of the photo's thumbnail, see perceptual_hash
+    phash = models.BigIntegerField(blank=True, null=True)
+    phash_band0 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band1 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band2 = models.PositiveIntegerField(blank=True, null=True)
+    phash_band3 = models.PositiveIntegerField(blank=True, null=True)
+    synced_at = models.DateTimeField(default=now)  # Last time a listing returned this item
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user_email", "media_item_id"], name="uniq_google_photo_item"),
+        ]
+        indexes = [
+            models.Index(fields=["user_email", "filename"], name="google_photo_filename_idx"),
+            models.Index(fields=["user_email", "phash_band0"], name="google_photo_band0_idx"),
+            models.Index(fields=["user_email", "phash_band1"], name="google_photo_band1_idx"),
+            models.Index(fields=["user_email", "phash_band2"], name="google_photo_band2_idx"),
+            models.Index(fields=["user_email", "phash_band3"], name="google_photo_band3_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_email} {self.filename or self.media_item_id}"
+
+
+class GooglePhotoSyncState(models.Model):
+    user_email = models.CharField(max_length=200, unique=True)
+    item_count = models.PositiveIntegerField(default=0)
+    newest_creation_time = models.DateTimeField(blank=True, null=True)  # Incremental syncs start here
+    last_synced_at = models.DateTimeField(blank=True, null=True)
+    last_full_sync_at = models.DateTimeField(blank=True, null=True)
+    sync_started_at = models.DateTimeField(blank=True, null=True)  # Lease held by the process syncing
+    error = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.user_email} ({self.item_count} photos)"
+
+
+#####PHOTO SEARCH: maps rows of each user's on-disk vector file (photo_retrieval) to items
+class PhotoEmbedding(models.Model):
+    SOURCE_GOOGLE_PHOTOS = "google_photos"
+    SOURCE_CAPTION = "caption"
+
+    user_email = models.CharField(max_length=200)
+    source = models.CharField(max_length=20)  # google_photos / caption
+    source_id = models.CharField(max_length=255)  # GooglePhotoItem.media_item_id or AIContentDb.id
+    row = models.PositiveIntegerField()  # Row in the user's vector file
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user_email", "source", "source_id"], name="uniq_photo_embedding"),
+        ]
+        indexes = [models.Index(fields=["user_email", "row"], name="photo_embedding_row_idx")]
+
+    def __str__(self):
+        return f"{self.user_email} {self.source}:{self.source_id} @{self.row}"
+
+
+#####SEARCH: one row per searchable record, full-text indexed by the database (search_index)
+class SearchDocument(models.Model):
+    source = models.CharField(max_length=30)  # Key of search_index.SOURCES
+    object_id = models.CharField(max_length=64)
+    user_email = models.CharField(max_length=200, blank=True, default="")
+    body = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["source", "object_id"], name="uniq_search_document"),
+        ]
+        indexes = [models.Index(fields=["user_email", "source"], name="search_doc_user_idx")]
+
+    def __str__(self):
+        return f"{self.source}:{self.object_id}"
+
+
+#####ACCOUNTS: normalised email -> user, so login and registration hit one unique index (accounts)
+class UserEmailIndex(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="email_index")
+    email = models.CharField(max_length=254, unique=True)  # accounts.normalize_email(user.email)
+
+    def __str__(self):
+        return f"{self.email} -> {self.user_id}"
+
+
+#####CONTENT POOL: pre-generated broadcast/profile posts per parameter combination (content_pool)
+class PrecomputedContent(models.Model):
+    kind = models.CharField(max_length=30)  # Key of content_pool.KINDS
+    params_key = models.CharField(max_length=64)  # content_pool.params_key(kind, params)
+    params = models.JSONField(default=dict)
+    content = models.TextField()
+    served_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_served_at = models.DateTimeField(blank=True, null=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["kind", "params_key", "expires_at"], name="precomputed_pool_idx"),
+            models.Index(fields=["expires_at"], name="precomputed_expiry_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.params} (served {self.served_count}x)"
+
+
+class ContentRequestStat(models.Model):
+    kind = models.CharField(max_length=30)
+    params_key = models.CharField(max_length=64)
+    params = models.JSONField(default=dict)
+    day = models.DateField()
+    requests = models.PositiveIntegerField(default=0)
+    pool_hits = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "params_key", "day"], name="uniq_content_request_stat"),
+        ]
+        indexes = [models.Index(fields=["day", "kind"], name="content_request_day_idx")]
+
+    def __str__(self):
+        return f"{self.kind} {self.params} {self.day}: {self.requests} requests"
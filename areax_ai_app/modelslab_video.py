@@ -0,0 +1,341 @@
+import hashlib
+import hmac
+import ipaddress
+import logging
+import os
+import socket
+import struct
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from django.db.models import Min
+from django.urls import reverse
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from . import media_store
+from .background_tasks import PeriodicWorker, claim_due, run_in_background
+from .metering import meter
+from .models import VideoDB
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+MODELSLAB_API_KEY = os.getenv("MODELSLAB_API_KEY", "")
+MODELSLAB_BASE_URL = os.getenv("MODELSLAB_BASE_URL", "https://modelslab.com/api/v6").rstrip("/")
+# Signs the per-job token in the webhook URL we hand to ModelsLab (SECRET_KEY when unset).
+MODELSLAB_WEBHOOK_SECRET = os.getenv("MODELSLAB_WEBHOOK_SECRET", "")
+# Hosts (and their subdomains) finished videos may be fetched from for mirroring and sizing.
+MEDIA_HOSTS = tuple(
+    host.strip().lower()
+    for host in os.getenv("MODELSLAB_MEDIA_HOSTS", "modelslab.com,stablediffusionapi.com").split(",")
+    if host.strip()
+)
+# Copy finished videos into the media store so playback doesn't depend on ModelsLab's CDN.
+MIRROR_VIDEOS = os.getenv("MODELSLAB_MIRROR_VIDEOS", "false").lower() in ("1", "true", "yes")
+MIRROR_PREFIX = "ModelLab_videos"
+
+##Resolver schedule (seconds). The webhook normally resolves a job; the
+##resolver is the fallback for lost or late callbacks.
+WEBHOOK_GRACE = 30  # Extra wait past ModelsLab's ETA before we ask ourselves
+MIN_CHECK_INTERVAL = 10
+MAX_CHECK_INTERVAL = 120
+JOB_TIMEOUT = int(os.getenv("MODELSLAB_JOB_TIMEOUT", "1800"))
+CHECK_BATCH_SIZE = 25
+REQUEST_TIMEOUT = 30
+
+STATUS_PROCESSING = "processing"
+STATUS_SUCCESS = "success"
+STATUS_FAILED = "failed"
+
+_fetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="areax-modelslab")
+
+
+class ModelsLabError(Exception):
+    def __init__(self, details, status_code=502):
+        super().__init__(str(details))
+        self.details = details
+        self.status_code = status_code
+
+
+def _webhook_token(track_id):
+    key = (MODELSLAB_WEBHOOK_SECRET or settings.SECRET_KEY).encode("utf-8")
+    return hmac.new(key, f"modelslab-webhook:{track_id}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def webhook_url(request, track_id):
+    """Our webhook with the job's track id and a token only we can compute for it."""
+    url = request.build_absolute_uri(reverse("modelslab_webhook"))
+    return f"{url}?track_id={track_id}&token={_webhook_token(track_id)}"
+
+
+def verify_webhook(track_id, token):
+    if not track_id or not token:
+        return False
+    return hmac.compare_digest(token, _webhook_token(track_id))
+
+
+def is_media_host(url):
+    """Whether ``url`` is https on one of MEDIA_HOSTS, i.e. safe for us to download."""
+    parts = urlsplit(url or "")
+    host = (parts.hostname or "").lower()
+    return parts.scheme == "https" and any(host == allowed or host.endswith(f".{allowed}") for allowed in MEDIA_HOSTS)
+
+
+def check_public_url(url):
+    """
+    Raises ValueError unless ``url`` is http(s) and every address its host
+    resolves to is public, so client webhooks can't reach internal services.
+    """
+    parts = urlsplit(url or "")
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("webhook must be an http(s) URL")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or None)}
+    except (socket.gaierror, UnicodeError):
+        raise ValueError("webhook host does not resolve")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%", 1)[0]).is_global:
+            raise ValueError("webhook must point at a public address")
+
+
+def _next_interval(check_count, eta=None):
+    if eta:
+        try:
+            return min(max(float(eta) + WEBHOOK_GRACE, MIN_CHECK_INTERVAL), MAX_CHECK_INTERVAL)
+        except (TypeError, ValueError):
+            pass
+    return min(MIN_CHECK_INTERVAL * 2 ** check_count, MAX_CHECK_INTERVAL)
+
+
+def submit_video(kind, payload, request, user_email=None, user_reference_number=None, prompt=None):
+    """
+    Starts a ModelsLab video job (``kind`` is text2video or img2video) with
+    our own webhook and track id, and records it as a processing VideoDB row.
+    The caller's ``webhook``/``track_id`` in ``payload`` are kept on the row
+    and called back once the job resolves. Returns ``(response_data, video)``.
+    """
+    payload = dict(payload)
+    client_webhook = payload.pop("webhook", None)
+    client_track_id = payload.pop("track_id", None)
+    if client_webhook:
+        try:
+            check_public_url(client_webhook)
+        except ValueError as e:
+            raise ModelsLabError({"webhook": str(e)}, status_code=400)
+    track_id = uuid.uuid4().hex
+    payload.update(key=MODELSLAB_API_KEY, webhook=webhook_url(request, track_id), track_id=track_id)
+
+    with meter("modelslab", payload.get("model_id", "cogvideox")) as usage:
+        response = requests.post(f"{MODELSLAB_BASE_URL}/video/{kind}", json=payload, timeout=REQUEST_TIMEOUT)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {"status": "error", "message": response.text}
+        if response.status_code != 200 or data.get("status") in ("error", "failed"):
+            usage.status = "error"
+            raise ModelsLabError(data, response.status_code if response.status_code != 200 else 502)
+
+    video = VideoDB.objects.create(
+        user_reference_number=user_reference_number,
+        user_email=user_email,
+        prompt=prompt,
+        video_url=(data.get("future_links") or [None])[0],
+        provider_job_id=str(data.get("id") or ""),
+        track_id=track_id,
+        client_track_id=client_track_id,
+        client_webhook=client_webhook,
+        status=STATUS_PROCESSING,
+        next_check_at=timezone.now() + timedelta(seconds=_next_interval(0, data.get("eta"))),
+    )
+    if data.get("status") == "success":
+        resolve(video, data)  # Short clips can come back finished
+    else:
+        resolver.wake()
+    return {**data, "video_id": video.id}, video
+
+
+def _meta_duration(meta):
+    meta = meta or {}
+    try:
+        return float(meta["num_frames"]) / float(meta["fps"])
+    except (KeyError, TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def resolve(video, data):
+    """
+    Applies a ModelsLab status payload (webhook body or fetch response) to the
+    row. Final states are written with a conditional update so a webhook and
+    the resolver racing on the same job only finish it once.
+    """
+    state = data.get("status")
+    now = timezone.now()
+    if state == "success" and data.get("output"):
+        fields = {
+            "status": STATUS_SUCCESS,
+            "video_url": data["output"][0],
+            "duration": _meta_duration(data.get("meta")),
+            "next_check_at": None,
+        }
+    elif state in ("error", "failed"):
+        fields = {
+            "status": STATUS_FAILED,
+            "error": str(data.get("message") or data.get("messege") or data)[:2000],
+            "next_check_at": None,
+        }
+    elif (now - video.created_at).total_seconds() > JOB_TIMEOUT:
+        fields = {"status": STATUS_FAILED, "error": "Video generation timed out.", "next_check_at": None}
+    else:
+        VideoDB.objects.filter(pk=video.pk, status=STATUS_PROCESSING).update(
+            next_check_at=video.next_check_at, check_count=video.check_count,
+        )
+        return False
+
+    if VideoDB.objects.filter(pk=video.pk, status=STATUS_PROCESSING).update(updated_at=now, **fields):
+        run_in_background(finish_video, video.pk)
+    return True
+
+
+def fetch_status(job_id):
+    response = requests.post(
+        f"{MODELSLAB_BASE_URL}/video/fetch/{job_id}", json={"key": MODELSLAB_API_KEY}, timeout=REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def _fetch(video):
+    try:
+        return fetch_status(video.provider_job_id), None
+    except Exception as e:
+        return None, e
+
+
+def check_pending_jobs():
+    """
+    Resolver pass: asks ModelsLab about every processing job whose webhook is
+    overdue and returns the seconds until the next one is due.
+    """
+    pending = VideoDB.objects.filter(status=STATUS_PROCESSING).exclude(provider_job_id="")
+    videos = claim_due(pending, "next_check_at", timezone.now(), CHECK_BATCH_SIZE)
+    for video, (data, error) in zip(videos, _fetch_pool.map(_fetch, videos)):
+        video.check_count += 1
+        video.next_check_at = timezone.now() + timedelta(seconds=_next_interval(video.check_count, (data or {}).get("eta")))
+        if error is not None:
+            logger.warning("ModelsLab fetch for job %s failed: %s", video.provider_job_id, error)
+            data = {}
+        resolve(video, data)
+
+    next_due = pending.aggregate(at=Min("next_check_at"))["at"]
+    if next_due is None:
+        return None
+    return (next_due - timezone.now()).total_seconds()
+
+
+def _mp4_duration(fileobj):
+    """Reads the duration from the mvhd box of an MP4 file; None if it has none."""
+    fileobj.seek(0, os.SEEK_END)
+    end = fileobj.tell()
+    pos = 0
+    while pos + 8 <= end:
+        fileobj.seek(pos)
+        box_size, box_type = struct.unpack(">I4s", fileobj.read(8))
+        header = 8
+        if box_size == 1:
+            box_size = struct.unpack(">Q", fileobj.read(8))[0]
+            header = 16
+        elif box_size == 0:
+            box_size = end - pos
+        if box_size < header:
+            return None
+        if box_type == b"moov":
+            end, pos = pos + box_size, pos + header  # Descend into the movie box
+            continue
+        if box_type == b"mvhd":
+            version = fileobj.read(4)[0]
+            if version == 1:
+                fileobj.read(16)
+                timescale, duration = struct.unpack(">IQ", fileobj.read(12))
+            else:
+                fileobj.read(8)
+                timescale, duration = struct.unpack(">II", fileobj.read(8))
+            return duration / timescale if timescale else None
+        pos += box_size
+    return None
+
+
+def _mirror(video):
+    """Streams the finished video into the media store. Returns (url, size, duration)."""
+    with requests.get(video.video_url, stream=True, timeout=REQUEST_TIMEOUT) as response, \
+            tempfile.TemporaryFile() as tmp:
+        response.raise_for_status()
+        for chunk in response.iter_content(chunk_size=1024 * 1024):
+            tmp.write(chunk)
+        duration = _mp4_duration(tmp)
+        tmp.seek(0)
+        stored = media_store.put_stream(tmp, "video/mp4", prefix=MIRROR_PREFIX)
+    return stored.url, stored.size, duration
+
+
+def finish_video(video_id):
+    """
+    Background step after a job resolves: records size (and duration when the
+    provider didn't report it), mirrors the file if enabled and calls the
+    client's webhook.
+    """
+    video = VideoDB.objects.get(pk=video_id)
+    if video.status == STATUS_SUCCESS:
+        updates = {}
+        try:
+            if not is_media_host(video.video_url):
+                # The URL came from a webhook or fetch payload; only download from ModelsLab's own hosts
+                logger.warning("Not fetching video %s from unexpected host: %s", video_id, video.video_url)
+            elif MIRROR_VIDEOS:
+                updates["mirrored_url"], updates["size"], duration = _mirror(video)
+                if video.duration is None and duration:
+                    updates["duration"] = duration
+            else:
+                head = requests.head(video.video_url, allow_redirects=True, timeout=REQUEST_TIMEOUT)
+                if head.headers.get("Content-Length"):
+                    updates["size"] = int(head.headers["Content-Length"])
+        except Exception:
+            logger.exception("Could not mirror/measure video %s", video_id)
+        if updates:
+            VideoDB.objects.filter(pk=video_id).update(**updates)
+            for field, value in updates.items():
+                setattr(video, field, value)
+
+    if video.client_webhook:
+        try:
+            # Checked again at call time: the name may resolve differently than at submit
+            check_public_url(video.client_webhook)
+            requests.post(video.client_webhook, json=client_payload(video), timeout=REQUEST_TIMEOUT,
+                          allow_redirects=False)
+        except (ValueError, requests.RequestException) as e:
+            logger.warning("Client webhook %s failed for video %s: %s", video.client_webhook, video_id, e)
+
+
+def client_payload(video, request=None):
+    mirrored_url = video.mirrored_url
+    if mirrored_url and request is not None:
+        mirrored_url = request.build_absolute_uri(mirrored_url)
+    return {
+        "video_id": video.id,
+        "track_id": video.client_track_id,
+        "status": video.status,
+        "video_url": video.video_url,
+        "mirrored_url": mirrored_url,
+        "playback_url": mirrored_url or video.video_url,
+        "size": video.size,
+        "duration": video.duration,
+        "error": video.error,
+    }
+
+
+resolver = PeriodicWorker("areax-modelslab-resolver", check_pending_jobs, idle_interval=MAX_CHECK_INTERVAL)
@@ -0,0 +1,59 @@
+from io import BytesIO
+
+from django.db.models import Q
+from PIL import Image
+
+##Difference hashes (dHash) for matching images by content. A hash is stored
+##as a signed 64-bit integer plus four 16-bit bands; two hashes within 3 bits
+##always share at least one band exactly, so near matches are found with
+##indexed equality lookups instead of scanning every row.
+MAX_BAND_DISTANCE = 3
+_MASK = (1 << 64) - 1
+
+
+def dhash(data):
+    """64-bit difference hash: brightness gradients of a 9x8 grayscale thumbnail."""
+    image = Image.open(BytesIO(data))
+    image.draft("L", (64, 64))  # JPEGs decode at reduced scale
+    pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def signed(value):
+    """The unsigned hash as a value that fits a BigIntegerField."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def bands(value):
+    return [(value >> (16 * band)) & 0xFFFF for band in range(4)]
+
+
+def hash_fields(value):
+    """Model field values for ``phash`` and ``phash_band0``..``phash_band3``."""
+    fields = {f"phash_band{band}": band_value for band, band_value in enumerate(bands(value))}
+    fields["phash"] = signed(value)
+    return fields
+
+
+def hamming(a, b):
+    return ((a ^ b) & _MASK).bit_count()
+
+
+def nearest(queryset, value, max_distance=MAX_BAND_DISTANCE, limit=200):
+    """
+    Returns ``(pk, distance)`` of the row in ``queryset`` whose phash is
+    closest to ``value`` within ``max_distance`` bits, or None.
+    """
+    match = Q()
+    for band, band_value in enumerate(bands(value)):
+        match |= Q(**{f"phash_band{band}": band_value})
+    best = None
+    for pk, phash in queryset.filter(match).exclude(phash__isnull=True).values_list("pk", "phash")[:limit]:
+        distance = hamming(value, phash)
+        if distance <= max_distance and (best is None or distance < best[1]):
+            best = (pk, distance)
+    return best
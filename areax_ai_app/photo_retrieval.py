@@ -0,0 +1,374 @@
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+
+import numpy as np
+import requests
+from django.conf import settings
+from django.utils import timezone
+from dotenv import load_dotenv
+from PIL import Image
+
+from . import perceptual_hash
+from .models import AIContentDb, GooglePhotoItem, PhotoEmbedding
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+##Photo retrieval over a user's synced Google Photos and captioned images.
+##Each image gets a normalised CLIP embedding, appended as float16 to a
+##per-user file that is memory-mapped for search, so the index never has to
+##fit in RAM. Large libraries are split into IVF lists (k-means cells) and a
+##query only scans the NPROBE closest cells plus rows added since clustering.
+##A text query uses CLIP's text tower against the same vectors. Opt-in
+##(PHOTO_EMBEDDINGS=true): without it only the perceptual-hash matches run.
+EMBEDDINGS_ENABLED = os.getenv("PHOTO_EMBEDDINGS", "false").lower() in ("1", "true", "yes")
+EMBEDDING_MODEL = os.getenv("PHOTO_EMBEDDING_MODEL", "openai/clip-vit-base-patch32")
+INDEX_DIR = os.getenv("PHOTO_INDEX_DIR", os.path.join(settings.BASE_DIR, "photo_index"))
+IVF_MIN_ROWS = 20000  # Below this an exact scan is already a few milliseconds
+NPROBE = int(os.getenv("PHOTO_INDEX_NPROBE", "8"))
+SCAN_CHUNK = 65536
+EMBED_BATCH_SIZE = 32
+THUMBNAIL_SIZE = "=w224-h224"  # CLIP's input size; Google Photos resizes for us
+BASE_URL_TTL = 55 * 60
+REQUEST_TIMEOUT = 30
+# Cosine similarity above which two CLIP image embeddings are the same photo
+MATCH_MIN_SCORE = float(os.getenv("PHOTO_MATCH_MIN_SCORE", "0.92"))
+
+SOURCES = (PhotoEmbedding.SOURCE_GOOGLE_PHOTOS, PhotoEmbedding.SOURCE_CAPTION)
+
+_download_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="areax-photo-index")
+
+
+class _Embedder:
+    def __init__(self, name, model, processor, no_grad):
+        self.name = name
+        self.model = model
+        self.processor = processor
+        self.no_grad = no_grad
+        self.dim = self.model.config.projection_dim
+        self.lock = threading.Lock()  # One forward pass at a time; torch already uses every core
+
+    def images(self, images):
+        with self.lock, self.no_grad():
+            features = self.model.get_image_features(**self.processor(images=images, return_tensors="pt"))
+        return _normalize(features.numpy())
+
+    def text(self, text):
+        with self.lock, self.no_grad():
+            inputs = self.processor(text=[text], return_tensors="pt", padding=True, truncation=True)
+            features = self.model.get_text_features(**inputs)
+        return _normalize(features.numpy())[0]
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                # Imported here so processes that never embed (or run with PHOTO_EMBEDDINGS off) don't load torch
+                import torch
+                from transformers import CLIPModel, CLIPProcessor
+
+                _embedder = _Embedder(
+                    EMBEDDING_MODEL,
+                    CLIPModel.from_pretrained(EMBEDDING_MODEL).eval(),
+                    CLIPProcessor.from_pretrained(EMBEDDING_MODEL),
+                    torch.no_grad,
+                )
+    return _embedder
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    """
+    One user's vectors: ``vectors.f16`` (rows of float16, append-only),
+    ``meta.json`` (dim, count, model) and, once clustered, ``centroids.npy``,
+    ``order.npy`` (row ids grouped by cell) and ``offsets.npy``.
+    """
+
+    def __init__(self, email):
+        self.path = os.path.join(INDEX_DIR, hashlib.sha256(email.strip().lower().encode("utf-8")).hexdigest()[:32])
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def _locked(self):
+        # Appends and clustering may run in several processes at once
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file(".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def meta(self):
+        try:
+            with open(self._file("meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"count": 0, "dim": None, "model": None, "clustered_rows": 0}
+
+    def _write_meta(self, meta):
+        fd, tmp_path = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._file("meta.json"))
+
+    def _save(self, name, array):
+        # Readers may be searching while we cluster, so files are swapped in whole
+        fd, tmp_path = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+        os.replace(tmp_path, self._file(name))
+
+    def _vectors(self, meta):
+        return np.memmap(self._file("vectors.f16"), dtype=np.float16, mode="r", shape=(meta["count"], meta["dim"]))
+
+    def append(self, vectors, model):
+        """Appends normalised vectors and returns the row number of the first one."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float16)
+        with self._locked():
+            meta = self.meta()
+            if meta["count"] and (meta["dim"] != vectors.shape[1] or meta["model"] != model):
+                raise ValueError("Index was built with another embedding model; rebuild it")
+            with open(self._file("vectors.f16"), "ab") as f:
+                f.write(vectors.tobytes())
+            first = meta["count"]
+            meta.update(count=first + len(vectors), dim=int(vectors.shape[1]), model=model)
+            self._write_meta(meta)
+        return first
+
+    def reset(self):
+        with self._locked():
+            for name in ("vectors.f16", "centroids.npy", "order.npy", "offsets.npy", "meta.json"):
+                try:
+                    os.remove(self._file(name))
+                except FileNotFoundError:
+                    pass
+
+    def cluster(self, iterations=8):
+        """(Re)builds the IVF cells with k-means over a sample of the rows."""
+        with self._locked():
+            meta = self.meta()
+            count = meta["count"]
+            if count < IVF_MIN_ROWS:
+                meta["clustered_rows"] = 0
+                self._write_meta(meta)
+                return 0
+            vectors = self._vectors(meta)
+            cells = int(math.sqrt(count))
+            rng = np.random.default_rng(0)
+            sample = np.asarray(vectors[np.sort(rng.choice(count, min(count, cells * 64), replace=False))], dtype=np.float32)
+            centroids = sample[rng.choice(len(sample), cells, replace=False)]
+            for _ in range(iterations):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                for cell in range(cells):
+                    members = sample[assignment == cell]
+                    if len(members):
+                        centroids[cell] = members.mean(axis=0)
+                centroids = _normalize(centroids)
+
+            assignment = np.empty(count, dtype=np.int32)
+            for start in range(0, count, SCAN_CHUNK):
+                chunk = np.asarray(vectors[start:start + SCAN_CHUNK], dtype=np.float32)
+                assignment[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable").astype(np.int32)
+            offsets = np.searchsorted(assignment[order], np.arange(cells + 1))
+            self._save("order.npy", order)
+            self._save("offsets.npy", offsets)
+            self._save("centroids.npy", centroids)
+            meta["clustered_rows"] = count
+            self._write_meta(meta)
+            return cells
+
+    def search(self, query, k):
+        """Returns ``[(row, score)]`` for the ``k`` rows most similar (cosine) to ``query``."""
+        meta = self.meta()
+        count = meta["count"]
+        if not count or k <= 0:
+            return []
+        vectors = self._vectors(meta)
+        query = np.asarray(query, dtype=np.float32)
+        clustered = meta.get("clustered_rows", 0)
+        if clustered:
+            centroids = np.load(self._file("centroids.npy"), mmap_mode="r")
+            order = np.load(self._file("order.npy"), mmap_mode="r")
+            offsets = np.load(self._file("offsets.npy"))
+            probe = np.argsort(-(centroids @ query))[:NPROBE]
+            rows = np.concatenate(
+                [order[offsets[cell]:offsets[cell + 1]] for cell in probe] + [np.arange(clustered, count)]
+            )
+            rows = rows[rows < count]  # Cells may be newer than the meta we read
+            rows.sort()  # Sequential reads from the memory map
+            scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+        else:
+            rows = np.arange(count)
+            scores = np.concatenate([
+                np.asarray(vectors[start:start + SCAN_CHUNK], dtype=np.float32) @ query
+                for start in range(0, count, SCAN_CHUNK)
+            ])
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+
+def _open_image(data):
+    image = Image.open(BytesIO(data))
+    image.draft("RGB", (448, 448))
+    return image.convert("RGB")
+
+
+def _download(url):
+    try:
+        response = requests.get(url, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return _open_image(response.content)
+    except Exception as e:
+        logger.warning("Could not load %s for the photo index: %s", url, e)
+        return None
+
+
+def _embed_and_store(email, source, pending):
+    """``pending`` is ``[(source_id, image_url)]``; downloads, embeds and appends in batches."""
+    embedder = get_embedder()
+    index = VectorIndex(email)
+    added = 0
+    for start in range(0, len(pending), EMBED_BATCH_SIZE):
+        batch = pending[start:start + EMBED_BATCH_SIZE]
+        loaded = [
+            (source_id, image)
+            for (source_id, _url), image in zip(batch, _download_pool.map(_download, [url for _id, url in batch]))
+            if image is not None
+        ]
+        if not loaded:
+            continue
+        first = index.append(embedder.images([image for _id, image in loaded]), embedder.name)
+        PhotoEmbedding.objects.bulk_create([
+            PhotoEmbedding(user_email=email, source=source, source_id=source_id, row=first + offset)
+            for offset, (source_id, _image) in enumerate(loaded)
+        ], ignore_conflicts=True)  # A concurrent indexer may have won; its row is the one used
+        added += len(loaded)
+    return added
+
+
+def index_pending(email):
+    """Embeds the user's synced photos (with a still-valid baseUrl) and captioned images not indexed yet."""
+    if not EMBEDDINGS_ENABLED:
+        return 0
+    indexed = PhotoEmbedding.objects.filter(user_email=email)
+    photos = (
+        GooglePhotoItem.objects.filter(user_email=email, synced_at__gte=timezone.now() - timedelta(seconds=BASE_URL_TTL))
+        .exclude(media_item_id__in=indexed.filter(source=PhotoEmbedding.SOURCE_GOOGLE_PHOTOS).values("source_id"))
+        .values_list("media_item_id", "metadata")
+    )
+    added = _embed_and_store(email, PhotoEmbedding.SOURCE_GOOGLE_PHOTOS, [
+        (media_item_id, metadata["baseUrl"] + THUMBNAIL_SIZE)
+        for media_item_id, metadata in photos if metadata.get("baseUrl")
+    ])
+    captioned = AIContentDb.objects.filter(email=email).values_list("id", "image_url")
+    done = set(indexed.filter(source=PhotoEmbedding.SOURCE_CAPTION).values_list("source_id", flat=True))
+    added += _embed_and_store(email, PhotoEmbedding.SOURCE_CAPTION, [
+        (str(content_id), image_url) for content_id, image_url in captioned if str(content_id) not in done
+    ])
+    meta = VectorIndex(email).meta()
+    if meta["count"] >= IVF_MIN_ROWS and meta["count"] - meta.get("clustered_rows", 0) > meta["count"] // 10:
+        VectorIndex(email).cluster()  # Keep the unclustered tail under ~10% of the index
+    return added
+
+
+def _hydrate(email, hits, sources):
+    """Turns ``[(source, source_id, score)]`` into API results, dropping items that no longer exist."""
+    photo_ids = [source_id for source, source_id, _score in hits if source == PhotoEmbedding.SOURCE_GOOGLE_PHOTOS]
+    caption_ids = [int(source_id) for source, source_id, _score in hits if source == PhotoEmbedding.SOURCE_CAPTION]
+    photos = {item.media_item_id: item for item in GooglePhotoItem.objects.filter(user_email=email, media_item_id__in=photo_ids)}
+    captions = {content.id: content for content in AIContentDb.objects.filter(email=email, id__in=caption_ids)}
+    results = []
+    for source, source_id, score in hits:
+        if source not in sources:
+            continue
+        if source == PhotoEmbedding.SOURCE_GOOGLE_PHOTOS and source_id in photos:
+            item = photos[source_id]
+            results.append({"source": source, "id": source_id, "score": round(score, 4),
+                            "filename": item.filename, "metadata": item.metadata})
+        elif source == PhotoEmbedding.SOURCE_CAPTION and int(source_id) in captions:
+            content = captions[int(source_id)]
+            results.append({"source": source, "id": content.id, "score": round(score, 4),
+                            "caption": content.caption, "image_url": content.image_url})
+    return results
+
+
+def search(email, image_data=None, text=None, k=10, sources=SOURCES):
+    """
+    Top-``k`` photos for a query image or caption text. Near-identical
+    library photos (dHash within 3 bits) come first with their hash
+    similarity as score, followed by the embedding neighbours.
+    """
+    if image_data is None and not text:
+        raise ValueError("Provide an image or a text query")
+    hits = []
+    seen = set()
+    if image_data is not None and PhotoEmbedding.SOURCE_GOOGLE_PHOTOS in sources:
+        value = perceptual_hash.dhash(image_data)
+        best = perceptual_hash.nearest(GooglePhotoItem.objects.filter(user_email=email), value)
+        if best:
+            item = GooglePhotoItem.objects.get(pk=best[0])
+            hits.append((PhotoEmbedding.SOURCE_GOOGLE_PHOTOS, item.media_item_id, 1 - best[1] / 64))
+            seen.add((PhotoEmbedding.SOURCE_GOOGLE_PHOTOS, item.media_item_id))
+
+    if EMBEDDINGS_ENABLED:
+        embedder = get_embedder()
+        index = VectorIndex(email)
+        if index.meta()["model"] not in (None, embedder.name):
+            raise ValueError("The photo index was built with another embedding model; rebuild it")
+        query = embedder.images([_open_image(image_data)])[0] if image_data is not None else embedder.text(text)
+        # Over-fetch: rows of deleted items or other sources are dropped below
+        rows = index.search(query, k * 3)
+        entries = {
+            entry.row: entry
+            for entry in PhotoEmbedding.objects.filter(user_email=email, row__in=[row for row, _score in rows])
+        }
+        for row, score in rows:
+            entry = entries.get(row)
+            if entry is not None and (entry.source, entry.source_id) not in seen:
+                seen.add((entry.source, entry.source_id))
+                hits.append((entry.source, entry.source_id, score))
+    elif text:
+        raise ValueError("Text search needs PHOTO_EMBEDDINGS enabled")
+
+    return _hydrate(email, hits, sources)[:k]
+
+
+def rebuild(email):
+    """
+    Rewrites the user's index from scratch (new model, or to drop rows of
+    deleted items). Google Photos items need a fresh baseUrl, so run a sync first.
+    """
+    VectorIndex(email).reset()
+    PhotoEmbedding.objects.filter(user_email=email).delete()
+    added = index_pending(email)
+    VectorIndex(email).cluster()
+    return added
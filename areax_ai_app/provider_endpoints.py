@@ -0,0 +1,75 @@
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+##Endpoint overrides for the provider SDKs, so the app can be pointed at
+##provider_fakes (the loadtest command does this) without code changes.
+##Unset, every client talks to the real service. OPENAI_BASE_URL needs nothing
+##here: the openai SDK reads it itself.
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "")  # Gemini API (text, Imagen) for google-genai and google.generativeai
+VERTEX_BASE_URL = os.getenv("VERTEX_BASE_URL", "")  # google-genai with vertexai=True (Veo)
+GOOGLE_SPEECH_ENDPOINT = os.getenv("GOOGLE_SPEECH_ENDPOINT", "")  # Cloud Speech-to-Text and Text-to-Speech
+GOOGLE_MAPS_BASE_URL = os.getenv("GOOGLE_MAPS_BASE_URL", "https://maps.googleapis.com").rstrip("/")
+SPEECH_RECOGNITION_ENDPOINT = os.getenv("SPEECH_RECOGNITION_ENDPOINT", "")  # speech_recognition's recognize_google
+# Fakes don't check credentials; with this set, Google clients get a dummy token instead of looking for ADC
+PROVIDER_FAKES = os.getenv("PROVIDER_FAKES", "").lower() in ("1", "true", "yes")
+
+
+def _credentials():
+    if not PROVIDER_FAKES:
+        return {}
+    from google.oauth2.credentials import Credentials
+
+    return {"credentials": Credentials(token="provider-fake")}
+
+
+def genai_client(**kwargs):
+    """google.genai.Client(**kwargs), sent to GEMINI_BASE_URL / VERTEX_BASE_URL when set."""
+    from google import genai
+
+    base_url = VERTEX_BASE_URL if kwargs.get("vertexai") else GEMINI_BASE_URL
+    if base_url:
+        kwargs["http_options"] = {"base_url": base_url}
+        if kwargs.get("vertexai"):
+            kwargs.update(_credentials())
+    return genai.Client(**kwargs)
+
+
+def generativeai_options():
+    """Extra ``genai.configure()`` arguments for the legacy google.generativeai SDK."""
+    if not GEMINI_BASE_URL:
+        return {}
+    return {"transport": "rest", "client_options": {"api_endpoint": GEMINI_BASE_URL}}
+
+
+def _google_cloud_options():
+    if not GOOGLE_SPEECH_ENDPOINT:
+        return {}
+    return {"transport": "rest", "client_options": {"api_endpoint": GOOGLE_SPEECH_ENDPOINT}, **_credentials()}
+
+
+def speech_client():
+    from google.cloud import speech
+
+    return speech.SpeechClient(**_google_cloud_options())
+
+
+def text_to_speech_client():
+    from google.cloud import texttospeech
+
+    return texttospeech.TextToSpeechClient(**_google_cloud_options())
+
+
+def recognize_google(recognizer, audio_data, **kwargs):
+    if SPEECH_RECOGNITION_ENDPOINT:
+        kwargs["endpoint"] = SPEECH_RECOGNITION_ENDPOINT
+    return recognizer.recognize_google(audio_data, **kwargs)
+
+
+def storage_client(**kwargs):
+    # Only the credentials change: the Veo views need a real bucket (or STORAGE_EMULATOR_HOST) for signed URLs
+    from google.cloud import storage
+
+    return storage.Client(**kwargs, **_credentials())
@@ -0,0 +1,543 @@
+import base64
+import hashlib
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+##Local stand-ins for the paid providers, for exercising the integration code
+##without credentials or cost. Point the client at ``server.url`` (OPENAI_BASE_URL,
+##GEMINI_BASE_URL, VERTEX_BASE_URL, GOOGLE_SPEECH_ENDPOINT, GOOGLE_MAPS_BASE_URL,
+##RUNWAYML_BASE_URL, MODELSLAB_BASE_URL, MEDIA_ENDPOINT_URL; see
+##provider_endpoints) and inspect ``server.requests`` afterwards. Latency and
+##errors are drawn from a seeded generator, so a run is reproducible.
+
+
+def _png(width=64, height=64, rgb=(64, 128, 192)):
+    """A valid solid-colour PNG, so image code downstream (PIL renditions) has real bytes to work on."""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+    rows = b"".join(b"\x00" + bytes(rgb) * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+FAKE_PNG = _png()
+FAKE_AUDIO = b"ID3\x03\x00\x00\x00\x00\x00\x00" + b"\xff\xfb\x90\x00" * 256  # MP3-looking bytes
+
+
+def _words(seed, count):
+    """Deterministic filler text for ``seed``."""
+    vocabulary = ("sunset", "coffee", "trail", "city", "friends", "weekend", "music", "ocean", "market", "story")
+    rng = random.Random(seed)
+    return " ".join(rng.choice(vocabulary) for _ in range(count))
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    server_version = "AreaXFake/1.0"
+
+    def log_message(self, format, *args):
+        pass  # Keep test and benchmark output clean
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def _send(self, status, payload, content_type="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method):
+        fake = self.server.fake
+        with fake.lock:
+            fake.requests.append((method, self.path))
+            fake.request_count += 1
+            limited = fake.rate_limit_every and fake.request_count % fake.rate_limit_every == 0
+            delay, failed = fake.draw()
+        body = self._body() if method == "POST" else {}
+        if delay:
+            time.sleep(delay)
+        if limited:
+            return self._send(429, {"error": {"code": 429, "message": "Too many requests", "status": "RESOURCE_EXHAUSTED"}})
+        if failed:
+            return self._send(503, {"error": {"code": 503, "message": "Fake upstream failure", "status": "UNAVAILABLE"}})
+        for route_method, pattern, handler in fake.routes:
+            match = pattern.fullmatch(self.path.split("?", 1)[0])
+            if route_method == method and match:
+                return self._send(*handler(body, *match.groups()))
+        return self._send(404, {"error": f"No fake route for {method} {self.path}"})
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+
+class FakeProviderServer:
+    """
+    Threaded HTTP server on localhost with a table of JSON routes. Use as a
+    context manager; ``rate_limit_every=N`` answers every Nth request with 429.
+    Each request waits a log-normal delay with median ``latency_ms`` and 99th
+    percentile ``latency_p99_ms``, and fails with 503 at ``error_rate``.
+    Handlers return ``(status, payload)`` or ``(status, bytes, content_type)``.
+    """
+    handler_class = _FakeHandler
+
+    def __init__(self, port=0, rate_limit_every=0, latency_ms=0, latency_p99_ms=None, error_rate=0.0, seed=0):
+        self.port = port
+        self.rate_limit_every = rate_limit_every
+        self.latency_ms = latency_ms
+        self.latency_p99_ms = latency_p99_ms or latency_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.routes = []
+        self.requests = []
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    def route(self, method, pattern, handler):
+        self.routes.append((method, re.compile(pattern), handler))
+
+    def draw(self):
+        """``(delay_seconds, failed)`` for the next request; call with ``lock`` held."""
+        delay = 0.0
+        if self.latency_ms > 0:
+            # 2.326 = z-score of the 99th percentile
+            sigma = max(0.0, math.log(max(self.latency_p99_ms, self.latency_ms) / self.latency_ms) / 2.326)
+            delay = self.random.lognormvariate(math.log(self.latency_ms), sigma) / 1000
+        return delay, self.random.random() < self.error_rate
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._httpd.server_address[1]}"
+
+    def start(self):
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", self.port), self.handler_class)
+        self._httpd.fake = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="areax-fake-provider", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakeRunway(FakeProviderServer):
+    """
+    Runway's task API: ``POST /v1/image_to_video`` creates a task that moves
+    PENDING -> RUNNING -> SUCCEEDED over ``polls_to_finish`` status checks.
+    Prompts containing "fail" end as FAILED with a moderation code.
+    """
+
+    def __init__(self, polls_to_finish=3, **kwargs):
+        super().__init__(**kwargs)
+        self.polls_to_finish = polls_to_finish
+        self.tasks = {}
+        self.route("POST", r"/v1/image_to_video", self._create)
+        self.route("GET", r"/v1/tasks/([\w-]+)", self._retrieve)
+
+    def _create(self, body):
+        task_id = str(uuid.uuid4())
+        with self.lock:
+            self.tasks[task_id] = {"polls": 0, "prompt": body.get("promptText") or ""}
+        return 200, {"id": task_id}
+
+    def _retrieve(self, body, task_id):
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if task is None:
+                return 404, {"error": "Task not found"}
+            task["polls"] += 1
+            polls = task["polls"]
+        payload = {"id": task_id, "createdAt": "2025-01-01T00:00:00Z"}
+        if polls < self.polls_to_finish:
+            payload.update(status="PENDING" if polls == 1 else "RUNNING", progress=polls / self.polls_to_finish)
+        elif "fail" in task["prompt"].lower():
+            payload.update(status="FAILED", failure="The provided image was flagged by content moderation.",
+                           failureCode="SAFETY.INPUT.IMAGE")
+        else:
+            payload.update(status="SUCCEEDED", progress=1, output=[f"https://fake.runway.local/{task_id}.mp4"])
+        return 200, payload
+
+
+class FakeModelsLab(FakeProviderServer):
+    """
+    ModelsLab's video API under ``/api/v6`` (set MODELSLAB_BASE_URL to
+    ``server.url + "/api/v6"``). Jobs are ready after ``polls_to_finish``
+    fetches; with ``webhook_delay`` set, the job's webhook is also called that
+    many seconds after submission, as ModelsLab does.
+    """
+
+    def __init__(self, polls_to_finish=2, webhook_delay=None, **kwargs):
+        super().__init__(**kwargs)
+        self.polls_to_finish = polls_to_finish
+        self.webhook_delay = webhook_delay
+        self.jobs = {}
+        self._next_id = 1000
+        self.route("POST", r"/api/v6/video/(text2video|img2video)", self._create)
+        self.route("POST", r"/api/v6/video/fetch/(\d+)", self._fetch)
+
+    def _result(self, job_id):
+        return {
+            "status": "success",
+            "id": job_id,
+            "output": [f"https://fake.modelslab.local/{job_id}.mp4"],
+            "meta": {"num_frames": 16, "fps": 8},
+            "track_id": self.jobs[job_id]["track_id"],
+        }
+
+    def _create(self, body, kind):
+        with self.lock:
+            self._next_id += 1
+            job_id = self._next_id
+            self.jobs[job_id] = {"polls": 0, "track_id": body.get("track_id"), "webhook": body.get("webhook")}
+        if self.webhook_delay is not None and body.get("webhook"):
+            threading.Timer(self.webhook_delay, self._call_webhook, args=(job_id,)).start()
+        return 200, {
+            "status": "processing",
+            "id": job_id,
+            "eta": 1,
+            "future_links": [f"https://fake.modelslab.local/{job_id}.mp4"],
+            "fetch_result": f"{self.url}/api/v6/video/fetch/{job_id}",
+        }
+
+    def _fetch(self, body, job_id):
+        job_id = int(job_id)
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return 200, {"status": "error", "message": "Job not found"}
+            job["polls"] += 1
+            polls = job["polls"]
+        if polls < self.polls_to_finish:
+            return 200, {"status": "processing", "id": job_id, "eta": 1}
+        return 200, self._result(job_id)
+
+    def _call_webhook(self, job_id):
+        request = urllib.request.Request(
+            self.jobs[job_id]["webhook"], data=json.dumps(self._result(job_id)).encode("utf-8"),
+            headers={"Content-Type": "application/json"}, method="POST",
+        )
+        try:
+            urllib.request.urlopen(request, timeout=10).close()
+        except OSError:
+            pass  # The resolver is expected to pick the job up instead
+
+
+class FakeOpenAI(FakeProviderServer):
+    """
+    OpenAI's REST API under ``/v1`` (set OPENAI_BASE_URL to ``server.url +
+    "/v1"``): chat completions (``n`` choices), DALL-E image generations
+    (URLs served by the fake itself, or b64_json), Whisper transcriptions,
+    TTS and embeddings. Replies are deterministic for a given prompt.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.route("POST", r"/v1/chat/completions", self._chat)
+        self.route("POST", r"/v1/images/generations", self._images)
+        self.route("POST", r"/v1/audio/transcriptions", self._transcription)
+        self.route("POST", r"/v1/audio/speech", lambda body: (200, FAKE_AUDIO, "audio/mpeg"))
+        self.route("POST", r"/v1/embeddings", self._embeddings)
+        self.route("GET", r"/files/([\w-]+)\.png", lambda body, name: (200, FAKE_PNG, "image/png"))
+
+    def _chat(self, body):
+        prompt = json.dumps(body.get("messages", []))
+        prompt_tokens = max(1, len(prompt) // 4)
+        choices = [
+            {
+                "index": i,
+                "message": {"role": "assistant", "content": f"Fake reply {i}: {_words(prompt + str(i), 40)} #fake"},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }
+            for i in range(int(body.get("n") or 1))
+        ]
+        completion_tokens = sum(len(choice["message"]["content"]) // 4 for choice in choices)
+        return 200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4"),
+            "choices": choices,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _images(self, body):
+        count = int(body.get("n") or 1)
+        if body.get("response_format") == "b64_json":
+            data = [{"b64_json": base64.b64encode(FAKE_PNG).decode("ascii")} for _ in range(count)]
+        else:
+            data = [{"url": f"{self.url}/files/{uuid.uuid4().hex}.png"} for _ in range(count)]
+        return 200, {"created": int(time.time()), "data": data}
+
+    def _transcription(self, body):
+        # Multipart upload; the audio itself is ignored
+        return 200, {"task": "transcribe", "language": "english", "duration": 3.0,
+                     "text": f"Tell me something about {_words(self.request_count, 3)}", "segments": []}
+
+    def _embeddings(self, body):
+        inputs = body.get("input") or [""]
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        data = []
+        for i, text in enumerate(inputs):
+            rng = random.Random(str(text))
+            data.append({"object": "embedding", "index": i, "embedding": [rng.uniform(-1, 1) for _ in range(1536)]})
+        tokens = sum(len(str(text)) // 4 + 1 for text in inputs)
+        return 200, {"object": "list", "data": data, "model": body.get("model", "text-embedding-3-small"),
+                     "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+
+class FakeGemini(FakeProviderServer):
+    """
+    Gemini API and Vertex AI model endpoints (set GEMINI_BASE_URL and
+    VERTEX_BASE_URL to ``server.url``): ``generateContent``, Imagen's
+    ``predict`` and Veo's ``predictLongRunning``. Veo operations finish after
+    ``polls_to_finish`` polls (``GET .../operations/<id>`` on the Gemini API,
+    ``fetchPredictOperation`` on Vertex).
+    """
+
+    def __init__(self, polls_to_finish=2, **kwargs):
+        super().__init__(**kwargs)
+        self.polls_to_finish = polls_to_finish
+        self.operations = {}
+        self.route("POST", r"/(v1|v1beta|v1beta1)/(.+):(generateContent|predict|predictLongRunning|fetchPredictOperation)", self._model)
+        self.route("GET", r"/(v1|v1beta|v1beta1)/(.+/operations/[\w-]+)", lambda body, version, name: self._operation(name))
+
+    def _model(self, body, version, model_path, method):
+        model = model_path.rsplit("/", 1)[-1]
+        if method == "generateContent":
+            return self._generate_content(body, model)
+        if method == "predict":
+            count = int((body.get("parameters") or {}).get("sampleCount") or 1)
+            return 200, {"predictions": [
+                {"bytesBase64Encoded": base64.b64encode(FAKE_PNG).decode("ascii"), "mimeType": "image/png"}
+                for _ in range(count)
+            ]}
+        if method == "predictLongRunning":
+            name = f"{model_path}/operations/{uuid.uuid4().hex}"
+            output = ((body.get("parameters") or {}).get("storageUri") or "gs://fake-bucket/videos").rstrip("/")
+            with self.lock:
+                self.operations[name] = {"polls": 0, "vertex": version == "v1beta1", "output": output}
+            return 200, {"name": name}
+        return self._operation(body.get("operationName", ""))
+
+    def _generate_content(self, body, model):
+        prompt = json.dumps(body.get("contents", []))
+        text = f"Fake {model} reply: {_words(prompt, 40)}"
+        prompt_tokens, output_tokens = max(1, len(prompt) // 4), len(text) // 4
+        return 200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": output_tokens,
+                              "totalTokenCount": prompt_tokens + output_tokens},
+            "modelVersion": model,
+        }
+
+    def _operation(self, name):
+        with self.lock:
+            operation = self.operations.get(name)
+            if operation is None:
+                return 404, {"error": {"code": 404, "message": "Operation not found", "status": "NOT_FOUND"}}
+            operation["polls"] += 1
+            done = operation["polls"] >= self.polls_to_finish
+        if not done:
+            return 200, {"name": name, "done": False}
+        if operation["vertex"]:
+            response = {"@type": "type.googleapis.com/cloud.ai.large_models.vision.GenerateVideoResponse",
+                        "videos": [{"gcsUri": f"{operation['output']}/sample_0.mp4", "mimeType": "video/mp4"}]}
+        else:
+            response = {"@type": "type.googleapis.com/google.ai.generativelanguage.v1beta.PredictLongRunningResponse",
+                        "generateVideoResponse": {"generatedSamples": [{"video": {"uri": f"{self.url}/files/{uuid.uuid4().hex}.mp4"}}]}}
+        return 200, {"name": name, "done": True, "response": response}
+
+
+class FakeGoogleSpeech(FakeProviderServer):
+    """
+    Cloud Speech-to-Text and Text-to-Speech REST APIs (set
+    GOOGLE_SPEECH_ENDPOINT to ``server.url``), plus the legacy web speech
+    endpoint speech_recognition's ``recognize_google`` posts to (set
+    SPEECH_RECOGNITION_ENDPOINT to ``server.url + "/speech-api/v2/recognize"``).
+    """
+
+    def __init__(self, billed_seconds=15, **kwargs):
+        super().__init__(**kwargs)
+        self.billed_seconds = billed_seconds
+        self.route("POST", r"/v1/speech:recognize", self._recognize)
+        self.route("POST", r"/v1/text:synthesize",
+                   lambda body: (200, {"audioContent": base64.b64encode(FAKE_AUDIO).decode("ascii")}))
+        self.route("POST", r"/speech-api/v2/recognize", self._legacy_recognize)
+
+    def _transcript(self):
+        return f"tell me about {_words(self.request_count, 3)}"
+
+    def _recognize(self, body):
+        return 200, {
+            "results": [{"alternatives": [{"transcript": self._transcript(), "confidence": 0.93}],
+                         "resultEndTime": "3s", "languageCode": "en-us"}],
+            "totalBilledTime": f"{self.billed_seconds}s",
+            "requestId": str(self.request_count),
+        }
+
+    def _legacy_recognize(self, body):
+        # One JSON object per line, the first one empty, like the real endpoint
+        result = {"result": [{"alternative": [{"transcript": self._transcript(), "confidence": 0.93}], "final": True}],
+                  "result_index": 0}
+        return 200, ('{"result":[]}\n' + json.dumps(result) + "\n").encode("utf-8"), "application/json"
+
+
+class FakeGoogleMaps(FakeProviderServer):
+    """Reverse geocoding (set GOOGLE_MAPS_BASE_URL to ``server.url``)."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.route("GET", r"/maps/api/geocode/json", self._geocode)
+
+    def _geocode(self, body):
+        number = self.request_count % 500 + 1
+        return 200, {"status": "OK", "results": [{"formatted_address": f"{number} Fake Street, Testville", "types": ["street_address"]}]}
+
+
+class _FakeS3Handler(BaseHTTPRequestHandler):
+    server_version = "AreaXFakeS3/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _split(self):
+        path, _, query = self.path.partition("?")
+        bucket, _, key = urllib.parse.unquote(path.lstrip("/")).partition("/")
+        return bucket, key, urllib.parse.parse_qs(query, keep_blank_values=True)
+
+    def _payload(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if "aws-chunked" not in (self.headers.get("Content-Encoding") or ""):
+            return raw
+        # Newer botocore streams uploads as aws-chunked: "<hex size>[;ext]\r\n<data>\r\n"... then trailers.
+        data, pos = [], 0
+        while True:
+            line_end = raw.index(b"\r\n", pos)
+            size = int(raw[pos:line_end].split(b";")[0], 16)
+            if size == 0:
+                return b"".join(data)
+            data.append(raw[line_end + 2:line_end + 2 + size])
+            pos = line_end + 2 + size + 2
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _record(self):
+        fake = self.server.fake
+        with fake.lock:
+            fake.requests.append((self.command, self.path))
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        self._record()
+        bucket, key, _ = self._split()
+        obj = self.server.fake.objects.get((bucket, key))
+        if obj is None:
+            return self._send(404, b"<Error><Code>NoSuchKey</Code></Error>", {"Content-Type": "application/xml"})
+        self._send(200, obj["body"], {
+            "Content-Type": obj["content_type"],
+            "Cache-Control": obj["cache_control"],
+            "ETag": f'"{hashlib.md5(obj["body"]).hexdigest()}"',
+        })
+
+    def do_PUT(self):
+        self._record()
+        fake = self.server.fake
+        bucket, key, query = self._split()
+        body = self._payload()
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        with fake.lock:
+            if "uploadId" in query:
+                fake.uploads[query["uploadId"][0]]["parts"][int(query["partNumber"][0])] = body
+            else:
+                fake.objects[(bucket, key)] = {
+                    "body": body,
+                    "content_type": self.headers.get("Content-Type", "binary/octet-stream"),
+                    "cache_control": self.headers.get("Cache-Control", ""),
+                }
+        self._send(200, b"", {"ETag": etag})
+
+    def do_POST(self):
+        self._record()
+        fake = self.server.fake
+        bucket, key, query = self._split()
+        self._payload()
+        with fake.lock:
+            if "uploads" in query:
+                upload_id = uuid.uuid4().hex
+                fake.uploads[upload_id] = {
+                    "parts": {},
+                    "content_type": self.headers.get("Content-Type", "binary/octet-stream"),
+                    "cache_control": self.headers.get("Cache-Control", ""),
+                }
+                xml = (f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                       f"<UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>")
+            else:
+                upload = fake.uploads.pop(query["uploadId"][0])
+                fake.objects[(bucket, key)] = {
+                    "body": b"".join(upload["parts"][n] for n in sorted(upload["parts"])),
+                    "content_type": upload["content_type"],
+                    "cache_control": upload["cache_control"],
+                }
+                fake.multipart_completed += 1
+                xml = (f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket><Key>{key}</Key>"
+                       f'<ETag>"fake"</ETag></CompleteMultipartUploadResult>')
+        self._send(200, xml.encode("utf-8"), {"Content-Type": "application/xml"})
+
+
+class FakeS3(FakeProviderServer):
+    """
+    Minimal MinIO-style S3 endpoint (path-style addressing, no auth) for the
+    media store: PUT/GET/HEAD objects and multipart uploads. Set
+    MEDIA_BACKEND=s3 and MEDIA_ENDPOINT_URL to ``server.url``.
+    """
+    handler_class = _FakeS3Handler
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.objects = {}
+        self.uploads = {}
+        self.multipart_completed = 0
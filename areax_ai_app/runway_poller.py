@@ -0,0 +1,170 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.db.models import Min
+from django.utils import timezone
+from dotenv import load_dotenv
+from runwayml import RunwayML
+
+from .background_tasks import PeriodicWorker, claim_due
+from .metering import meter
+from .models import RunwayTask
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+RUNWAYML_API_SECRET = os.getenv("RUNWAYML_API_SECRET")
+RUNWAYML_BASE_URL = os.getenv("RUNWAYML_BASE_URL")  # Set to a provider_fakes server for local runs
+
+##Polling schedule (seconds). Each task is first checked FIRST_POLL_DELAY after
+##submission, then at an interval that grows by BACKOFF_FACTOR per check,
+##clamped to MIN/MAX_POLL_INTERVAL. Once Runway reports progress the interval
+##is shortened to the estimated time left.
+FIRST_POLL_DELAY = float(os.getenv("RUNWAY_FIRST_POLL_DELAY", "10"))
+MIN_POLL_INTERVAL = float(os.getenv("RUNWAY_MIN_POLL_INTERVAL", "5"))
+MAX_POLL_INTERVAL = float(os.getenv("RUNWAY_MAX_POLL_INTERVAL", "60"))
+BACKOFF_FACTOR = 1.5
+TASK_TIMEOUT = int(os.getenv("RUNWAY_TASK_TIMEOUT", "900"))
+POLL_BATCH_SIZE = int(os.getenv("RUNWAY_POLL_BATCH_SIZE", "50"))
+POLL_CONCURRENCY = int(os.getenv("RUNWAY_POLL_CONCURRENCY", "8"))
+
+ACTIVE_STATUSES = RunwayTask.ACTIVE_STATUSES
+
+_client = None
+_poll_pool = ThreadPoolExecutor(max_workers=POLL_CONCURRENCY, thread_name_prefix="areax-runway")
+_throttle = {"until": None, "delay": MIN_POLL_INTERVAL}
+
+
+def get_client():
+    global _client
+    if _client is None:
+        kwargs = {"api_key": RUNWAYML_API_SECRET}
+        if RUNWAYML_BASE_URL:
+            kwargs["base_url"] = RUNWAYML_BASE_URL
+        _client = RunwayML(**kwargs)
+    return _client
+
+
+def submit_task(prompt_text, prompt_image=None, user_email="", user_reference_number="",
+                model="gen3a_turbo", duration=5):
+    """
+    Creates the Runway task, stores it and hands it to the poller. Returns the
+    RunwayTask row immediately; the result is read from the status endpoint.
+    """
+    with meter("runway", model, user_email=user_email, user_reference_number=user_reference_number) as usage:
+        task = get_client().image_to_video.create(
+            model=model,
+            prompt_image=prompt_image,
+            prompt_text=prompt_text,
+            duration=duration,
+        )
+        usage.add(video_seconds=duration)
+
+    record = RunwayTask.objects.create(
+        task_id=task.id,
+        user_email=user_email or "",
+        user_reference_number=user_reference_number or "",
+        prompt_text=prompt_text,
+        prompt_image=prompt_image,
+        next_poll_at=timezone.now() + timedelta(seconds=FIRST_POLL_DELAY),
+    )
+    poller.wake()
+    return record
+
+
+def _next_interval(task, now):
+    interval = FIRST_POLL_DELAY * BACKOFF_FACTOR ** task.poll_count
+    if task.progress and 0 < task.progress < 1:
+        elapsed = (now - task.created_at).total_seconds()
+        interval = min(interval, elapsed / task.progress * (1 - task.progress))
+    return min(max(interval, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
+
+def _time_out(task, now):
+    task.status = RunwayTask.STATUS_FAILED
+    task.failure = "Video generation timed out."
+    task.failure_code = "TIMEOUT"
+    task.finished_at = now
+
+
+def _retrieve(task_id):
+    try:
+        return get_client().tasks.retrieve(task_id), None
+    except Exception as e:
+        return None, e
+
+
+def poll_due_tasks():
+    """
+    One poller pass: checks every due task concurrently, writes all state
+    changes with a single bulk_update and returns the number of seconds until
+    the next task is due (None when nothing is pending).
+    """
+    now = timezone.now()
+    if _throttle["until"] and now < _throttle["until"]:
+        return (_throttle["until"] - now).total_seconds()
+
+    # Claiming lets several processes run pollers without checking a task twice.
+    tasks = claim_due(RunwayTask.objects.filter(status__in=ACTIVE_STATUSES), "next_poll_at", now, POLL_BATCH_SIZE)
+    results = _poll_pool.map(_retrieve, [task.task_id for task in tasks])
+
+    throttled = False
+    for task, (remote, error) in zip(tasks, results):
+        now = timezone.now()
+        timed_out = (now - task.created_at).total_seconds() > TASK_TIMEOUT
+        if error is not None:
+            if timed_out:
+                # A task whose status can't be read (purged, bad id, outage) must still settle
+                logger.warning("Runway task %s timed out, last status check failed: %s", task.task_id, error)
+                task.poll_count += 1
+                _time_out(task, now)
+                continue
+            if getattr(error, "status_code", None) == 429:
+                throttled = True
+                task.next_poll_at = now + timedelta(seconds=_throttle["delay"])
+                continue
+            logger.warning("Runway status check for %s failed: %s", task.task_id, error)
+            task.poll_count += 1
+            task.next_poll_at = now + timedelta(seconds=_next_interval(task, now))
+            continue
+
+        task.poll_count += 1
+        task.status = remote.status
+        task.progress = getattr(remote, "progress", None) or task.progress
+        if remote.status == RunwayTask.STATUS_SUCCEEDED:
+            task.output = list(remote.output or [])
+            task.progress = 1
+            task.finished_at = now
+        elif remote.status not in ACTIVE_STATUSES:  # FAILED or CANCELLED
+            task.failure = getattr(remote, "failure", None)
+            task.failure_code = getattr(remote, "failure_code", None)
+            task.finished_at = now
+        elif timed_out:
+            _time_out(task, now)
+        else:
+            task.next_poll_at = now + timedelta(seconds=_next_interval(task, now))
+
+    if throttled:
+        logger.warning("Runway rate limited the poller, pausing %.0fs", _throttle["delay"])
+        _throttle["until"] = timezone.now() + timedelta(seconds=_throttle["delay"])
+        _throttle["delay"] = min(_throttle["delay"] * 2, MAX_POLL_INTERVAL)
+    else:
+        _throttle["until"], _throttle["delay"] = None, MIN_POLL_INTERVAL
+
+    if tasks:
+        RunwayTask.objects.bulk_update(
+            tasks,
+            ["status", "progress", "output", "failure", "failure_code", "poll_count", "next_poll_at", "finished_at"],
+        )
+
+    next_due = RunwayTask.objects.filter(status__in=ACTIVE_STATUSES).aggregate(at=Min("next_poll_at"))["at"]
+    if next_due is None:
+        return None
+    return (next_due - timezone.now()).total_seconds()
+
+
+# The idle interval only matters for tasks submitted by another process; tasks
+# submitted here wake the poller directly.
+poller = PeriodicWorker("areax-runway-poller", poll_due_tasks, idle_interval=MAX_POLL_INTERVAL)
@@ -0,0 +1,188 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+
+from agno.agent import Agent
+from agno.models.google import Gemini
+from agno.tools.googlecalendar import GoogleCalendarTools
+from dotenv import load_dotenv
+from tzlocal import get_localzone_name
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+##Warm agents for SchedulingAgentAPIView. Each user gets up to
+##AGENTS_PER_USER idle agents, each with its own calendar toolkit, so the
+##Google API client built on the first call is reused instead of re-read from
+##the credentials every request. Read-only calendar calls (event listings
+##for a window) are cached for CALENDAR_CACHE_TTL per calendar and dropped as
+##soon as any agent writes to that calendar. Agents are rebuilt after
+##AGENT_MAX_RUNS runs so their in-memory run history stays bounded.
+MODEL_ID = "gemini-2.0-flash"
+AGENTS_PER_USER = int(os.getenv("SCHEDULING_AGENTS_PER_USER", "2"))
+MAX_POOLED_USERS = int(os.getenv("SCHEDULING_AGENT_MAX_USERS", "200"))
+AGENT_MAX_RUNS = int(os.getenv("SCHEDULING_AGENT_MAX_RUNS", "50"))
+CALENDAR_CACHE_TTL = float(os.getenv("CALENDAR_CACHE_TTL", "60"))
+
+READ_TOOLS = ("list_events", "get_events", "find_available_slots", "list_calendars")
+WRITE_TOOLS = ("create_event", "update_event", "delete_event", "quick_add_event")
+
+INSTRUCTIONS = """
+            You are a helpful Google Calendar assistant.
+            Current datetime: {current_datetime}
+            User's timezone: {timezone}
+
+            You can help users with:
+            1. Creating calendar events with specific start/end times
+            2. Retrieving scheduled events
+            3. Answering questions about their calendar
+
+            Always confirm the details before creating events and provide clear responses.
+            """
+
+
+class _CalendarCache:
+    """TTL cache of read-only tool results, grouped per calendar so a write clears the whole calendar."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = defaultdict(dict)  # calendar -> {(tool, args): (expires_at, result)}
+        self._lock = threading.Lock()
+
+    def get(self, calendar, key):
+        with self._lock:
+            entry = self._entries[calendar].get(key)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def set(self, calendar, key, result):
+        with self._lock:
+            self._entries[calendar][key] = (time.monotonic() + self.ttl, result)
+
+    def invalidate(self, calendar):
+        with self._lock:
+            self._entries.pop(calendar, None)
+
+
+calendar_cache = _CalendarCache(CALENDAR_CACHE_TTL)
+
+
+class CachedGoogleCalendarTools(GoogleCalendarTools):
+    """
+    GoogleCalendarTools that caches read-only calls and times every call.
+    The wrappers keep each tool's name, docstring and signature, so the
+    agent sees the same tool schema as with the plain toolkit.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.steps = []  # Tool calls of the current run: {"tool", "ms", "cached"}
+        for name in READ_TOOLS + WRITE_TOOLS:
+            method = getattr(self, name, None)
+            if method is not None:
+                # Instance attributes, set before the toolkit registers its tools
+                setattr(self, name, self._wrap(name, method, read_only=name in READ_TOOLS))
+        super().__init__(*args, **kwargs)
+
+    @property
+    def calendar(self):
+        # Tools sharing a token and calendar id see the same events
+        return f"{getattr(self, 'token_path', None)}:{getattr(self, 'calendar_id', 'primary')}"
+
+    def _wrap(self, name, method, read_only):
+        @functools.wraps(method)
+        def tool(*args, **kwargs):
+            started = time.perf_counter()
+            key = (name, json.dumps([args, kwargs], sort_keys=True, default=str))
+            result = calendar_cache.get(self.calendar, key) if read_only else None
+            cached = result is not None
+            if not cached:
+                result = method(*args, **kwargs)
+                if read_only:
+                    calendar_cache.set(self.calendar, key, result)
+                else:
+                    calendar_cache.invalidate(self.calendar)
+            self.steps.append({"tool": name, "ms": round((time.perf_counter() - started) * 1000, 2), "cached": cached})
+            return result
+        return tool
+
+
+def build_agent():
+    agent = Agent(
+        model=Gemini(id=MODEL_ID),
+        tools=[CachedGoogleCalendarTools()],
+        instructions=INSTRUCTIONS,
+        show_tool_calls=True
+    )
+    agent.areax_runs = 0
+    return agent
+
+
+class AgentPool:
+    """Idle agents per user, most recently used users kept, at most AGENTS_PER_USER each."""
+
+    def __init__(self, per_user, max_users):
+        self.per_user = per_user
+        self.max_users = max_users
+        self._idle = OrderedDict()  # user -> [agent, ...]
+        self._lock = threading.Lock()
+
+    def checkout(self, user):
+        """An idle agent of ``user`` (or a new one) and whether it was reused."""
+        with self._lock:
+            agents = self._idle.get(user)
+            if agents:
+                self._idle.move_to_end(user)
+                return agents.pop(), True
+        return build_agent(), False
+
+    def checkin(self, user, agent):
+        if agent.areax_runs >= AGENT_MAX_RUNS:
+            return
+        with self._lock:
+            agents = self._idle.setdefault(user, [])
+            self._idle.move_to_end(user)
+            if len(agents) < self.per_user:
+                agents.append(agent)
+            while len(self._idle) > self.max_users:
+                self._idle.popitem(last=False)
+
+
+pool = AgentPool(AGENTS_PER_USER, MAX_POOLED_USERS)
+
+
+def run(user, message):
+    """
+    Runs ``message`` on a pooled agent of ``user``. Returns the agent's
+    response and metadata with per-tool-call latency.
+    """
+    agent, reused = pool.checkout(user or "")
+    tools = agent.tools[0]
+    tools.steps = []
+    agent.instructions = INSTRUCTIONS.format(
+        current_datetime=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        timezone=get_localzone_name(),
+    )
+    started = time.perf_counter()
+    try:
+        response = agent.run(message)
+    except Exception:
+        # A failed run may leave the agent half way through a conversation; don't reuse it
+        agent.areax_runs = AGENT_MAX_RUNS
+        raise
+    finally:
+        agent.areax_runs += 1
+        pool.checkin(user or "", agent)
+    total_ms = round((time.perf_counter() - started) * 1000, 2)
+    tool_ms = sum(step["ms"] for step in tools.steps)
+    return response, {
+        "agent_reused": reused,
+        "total_ms": total_ms,
+        "model_ms": round(total_ms - tool_ms, 2),
+        "tool_calls": tools.steps,
+    }
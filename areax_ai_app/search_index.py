@@ -0,0 +1,205 @@
+import logging
+import re
+
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import AIContentDb, AIResponse, ChatHistory, ImageCaptionGeminiDB, SearchDocument, SmartResponse
+
+logger = logging.getLogger(__name__)
+
+##Full-text search over generated captions and chat history. Every searchable
+##record is mirrored into one SearchDocument row by post_save/post_delete
+##receivers; the database indexes those rows itself (FTS5 table + triggers on
+##SQLite, generated tsvector + GIN index on PostgreSQL, see migration 0028).
+# source -> (model, text fields, user email field or None, created field)
+SOURCES = {
+    "caption": (AIContentDb, ("caption",), "email", "created_at"),
+    "image_caption": (ImageCaptionGeminiDB, ("caption",), None, "created_at"),
+    "ai_response": (AIResponse, ("response_text",), "user_email", "created_at"),
+    "chat_history": (ChatHistory, ("message", "response"), "user_email", "timestamp"),
+    "smart_response": (
+        SmartResponse,
+        ("text", "audio_transcript", "text_response", "image_prompt", "video_prompt"),
+        "user_email",
+        "created_at",
+    ),
+}
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+SNIPPET_WORDS = 24
+MAX_PAGE_SIZE = 100
+REBUILD_BATCH_SIZE = 1000
+
+_TABLE = SearchDocument._meta.db_table
+
+
+def _document(source, instance):
+    model, fields, email_field, created_field = SOURCES[source]
+    body = "\n".join(value for value in (getattr(instance, field) for field in fields) if value)
+    return SearchDocument(
+        source=source,
+        object_id=str(instance.pk),
+        user_email=(getattr(instance, email_field) or "") if email_field else "",
+        body=body,
+        created_at=getattr(instance, created_field),
+    )
+
+
+def index_instance(source, instance):
+    document = _document(source, instance)
+    if not document.body:
+        SearchDocument.objects.filter(source=source, object_id=document.object_id).delete()
+        return
+    SearchDocument.objects.update_or_create(
+        source=source,
+        object_id=document.object_id,
+        defaults={"user_email": document.user_email, "body": document.body, "created_at": document.created_at},
+    )
+
+
+def connect_signals():
+    for source, (model, *_rest) in SOURCES.items():
+        def saved(sender, instance, source=source, **kwargs):
+            try:
+                index_instance(source, instance)
+            except Exception:
+                # Search must never break the write it mirrors; rebuild_search_index repairs it
+                logger.exception("Could not index %s %s for search", source, instance.pk)
+
+        def deleted(sender, instance, source=source, **kwargs):
+            SearchDocument.objects.filter(source=source, object_id=str(instance.pk)).delete()
+
+        post_save.connect(saved, sender=model, weak=False, dispatch_uid=f"search_index_save_{source}")
+        post_delete.connect(deleted, sender=model, weak=False, dispatch_uid=f"search_index_delete_{source}")
+
+
+def rebuild(source):
+    """Re-mirrors every row of ``source``; returns the number of documents written."""
+    model, *_rest = SOURCES[source]
+    written = 0
+    with transaction.atomic():
+        SearchDocument.objects.filter(source=source).delete()
+        batch = []
+        for instance in model.objects.order_by("pk").iterator(chunk_size=REBUILD_BATCH_SIZE):
+            document = _document(source, instance)
+            if document.body:
+                batch.append(document)
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                written += len(SearchDocument.objects.bulk_create(batch))
+                batch = []
+        written += len(SearchDocument.objects.bulk_create(batch))
+    return written
+
+
+def optimize():
+    """Merges FTS5 segments after a large rebuild (SQLite only)."""
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO areax_search_fts(areax_search_fts) VALUES ('optimize')")
+
+
+def _fts5_query(query):
+    # Quote every word so user input can't use (or break) FTS5 query syntax;
+    # the last word matches as a prefix for search-as-you-type.
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+def _filters(user_email, sources, alias="d"):
+    clauses, params = [], []
+    if user_email is not None:
+        clauses.append(f"{alias}.user_email = %s")
+        params.append(user_email)
+    if sources:
+        clauses.append(f"{alias}.source IN ({', '.join(['%s'] * len(sources))})")
+        params.extend(sources)
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
+def _search_sqlite(query, user_email, sources, limit, offset):
+    match = _fts5_query(query)
+    if match is None:
+        return 0, []
+    where, params = _filters(user_email, sources)
+    base = f"FROM areax_search_fts JOIN {_TABLE} d ON d.id = areax_search_fts.rowid WHERE areax_search_fts MATCH %s{where}"
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) {base}", [match, *params])
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f"SELECT d.source, d.object_id, d.user_email, d.created_at, -bm25(areax_search_fts), "
+            f"snippet(areax_search_fts, 0, %s, %s, '…', %s) {base} "
+            f"ORDER BY bm25(areax_search_fts) LIMIT %s OFFSET %s",
+            [HIGHLIGHT_START, HIGHLIGHT_END, SNIPPET_WORDS, match, *params, limit, offset],
+        )
+        return total, cursor.fetchall()
+
+
+def _search_postgres(query, user_email, sources, limit, offset):
+    where, params = _filters(user_email, sources)
+    options = f"StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords={SNIPPET_WORDS}, MinWords=8"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM {_TABLE} d WHERE d.search_vector @@ websearch_to_tsquery('english', %s){where}",
+            [query, *params],
+        )
+        total = cursor.fetchone()[0]
+        # Rank and page first, so ts_headline only runs on the rows returned
+        cursor.execute(
+            f"SELECT page.source, page.object_id, page.user_email, page.created_at, page.rank, "
+            f"ts_headline('english', page.body, websearch_to_tsquery('english', %s), %s) "
+            f"FROM (SELECT d.source, d.object_id, d.user_email, d.created_at, d.body, "
+            f"ts_rank_cd(d.search_vector, websearch_to_tsquery('english', %s)) AS rank "
+            f"FROM {_TABLE} d WHERE d.search_vector @@ websearch_to_tsquery('english', %s){where} "
+            f"ORDER BY rank DESC LIMIT %s OFFSET %s) page ORDER BY page.rank DESC",
+            [query, options, query, query, *params, limit, offset],
+        )
+        return total, cursor.fetchall()
+
+
+def _search_fallback(query, user_email, sources, limit, offset):
+    # No full-text index on this database: a LIKE scan, newest first
+    documents = SearchDocument.objects.filter(body__icontains=query)
+    if user_email is not None:
+        documents = documents.filter(user_email=user_email)
+    if sources:
+        documents = documents.filter(source__in=sources)
+    total = documents.count()
+    rows = []
+    for document in documents.order_by("-created_at")[offset:offset + limit]:
+        start = document.body.lower().find(query.lower())
+        snippet = document.body[max(0, start - 80):start + len(query) + 80]
+        snippet = re.sub(re.escape(query), lambda m: f"{HIGHLIGHT_START}{m.group(0)}{HIGHLIGHT_END}", snippet, flags=re.I)
+        rows.append((document.source, document.object_id, document.user_email, document.created_at, 0.0, snippet))
+    return total, rows
+
+
+def search(query, user_email=None, sources=None, page=1, page_size=20):
+    """
+    Ranked matches for ``query`` across SOURCES, optionally limited to one
+    user (records without an owner, e.g. image_caption, only appear in
+    unscoped searches) and to some sources. Returns ``(total, results)``.
+    """
+    query = (query or "").strip()
+    if not query:
+        raise ValueError("q is required")
+    if sources and any(source not in SOURCES for source in sources):
+        raise ValueError(f"types must be among {', '.join(SOURCES)}")
+    page_size = min(max(int(page_size), 1), MAX_PAGE_SIZE)
+    offset = (max(int(page), 1) - 1) * page_size
+    backend = {"sqlite": _search_sqlite, "postgresql": _search_postgres}.get(connection.vendor, _search_fallback)
+    total, rows = backend(query, user_email, list(sources or []), page_size, offset)
+    return total, [
+        {
+            "type": source,
+            "id": object_id,
+            "user_email": email or None,
+            "created_at": created_at,
+            "score": round(float(score), 4),
+            "highlight": snippet,
+        }
+        for source, object_id, email, created_at, score, snippet in rows
+    ]
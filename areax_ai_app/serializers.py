@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from . import accounts
 from .models import UserCredentials,AIContentDb,UserInput, AIResponse,Feedback,GeneratedImage,OpenaAI_UsageDB,VideoDB,SmartResponse,ChatSession,EnhancedSocialContent
 
 class UserSerializer(serializers.ModelSerializer):
@@ -10,9 +11,9 @@ class UserSerializer(serializers.ModelSerializer):
 
     def validate_email(self, value):
         """
-        Check if the email address is unique.
+        Check if the email address is unique (case-insensitively).
         """
-        if User.objects.filter(email=value).exists():
+        if accounts.email_taken(value):
             raise serializers.ValidationError('This email address is already in use.')
         return value
 
@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import ChatSession, SmartResponse
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+##Read-through cache of chat session transcripts. A session only grows by
+##appending SmartResponse rows, so the writers append each new turn to the
+##cached transcript and DeleteChatHistoryAPI drops it; a history fetch is one
+##cache read. The in-process LRU is per worker process: with several workers
+##set SESSION_CACHE_URL (redis://...) so they share one copy, or keep
+##SESSION_CACHE_LOCAL_TTL short.
+CACHE_URL = os.getenv("SESSION_CACHE_URL", "")
+CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", str(24 * 3600)))
+LOCAL_TTL = int(os.getenv("SESSION_CACHE_LOCAL_TTL", "30"))
+LOCAL_MAX_BYTES = int(os.getenv("SESSION_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# One turn is stored as a JSON array in this order
+TURN_FIELDS = (
+    "id", "user_reference_number", "user_email", "text", "audio", "audio_transcript", "text_response",
+    "audio_response", "image_prompt", "image_response", "video_prompt", "video_response", "created_at",
+)
+
+
+def _turn(response):
+    # DRF's encoder, so datetimes come back exactly as the API rendered them
+    return json.dumps(
+        [getattr(response, field) for field in TURN_FIELDS], cls=JSONEncoder, separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def _header(chat_session):
+    return json.dumps({"pk": chat_session.pk, "user_email": chat_session.user_email}).encode("utf-8")
+
+
+class LocalBackend:
+    """Byte-bounded LRU of [header, turn, turn, ...] lists."""
+
+    STRIPES = 1024  # Generation counters are shared by hash, so they never grow
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, [header, *turns])
+        self._generations = [0] * self.STRIPES
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def generation(self, key):
+        return self._generations[hash(key) % self.STRIPES]
+
+    def _bump(self, key):
+        self._generations[hash(key) % self.STRIPES] += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._size -= entry[1]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return list(entry[2])
+
+    def put(self, key, items, generation):
+        with self._lock:
+            if self.generation(key) != generation:
+                return  # Appended to or deleted while we were reading the database
+            self._drop(key)
+            size = sum(len(item) for item in items)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, size, list(items))
+            self._size += size
+            while self._size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def append(self, key, item):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._bump(key)
+                return
+            entry[2].append(item)
+            self._entries[key] = (entry[0], entry[1] + len(item), entry[2])
+            self._size += len(item)
+
+    def delete(self, key):
+        with self._lock:
+            self._drop(key)
+            self._bump(key)
+
+
+class RedisBackend:
+    """
+    One Redis list per session (header first). RPUSHX only appends to a
+    cached list, and a per-session generation counter, WATCHed while the
+    transcript is loaded, keeps a slow reader from caching a stale copy.
+    """
+
+    def __init__(self, url, ttl):
+        import redis  # Only needed when SESSION_CACHE_URL is set
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self._watch_error = redis.WatchError
+
+    def generation(self, key):
+        return int(self.client.get(f"{key}:gen") or 0)
+
+    def get(self, key):
+        return self.client.lrange(key, 0, -1) or None
+
+    def put(self, key, items, generation):
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(f"{key}:gen")
+                if int(pipe.get(f"{key}:gen") or 0) != generation:
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                pipe.rpush(key, *items)
+                pipe.expire(key, self.ttl)
+                pipe.execute()
+            except self._watch_error:
+                pass
+
+    def append(self, key, item):
+        if not self.client.rpushx(key, item):
+            self.client.incr(f"{key}:gen")
+            self.client.expire(f"{key}:gen", self.ttl)
+
+    def delete(self, key):
+        with self.client.pipeline() as pipe:
+            pipe.delete(key)
+            pipe.incr(f"{key}:gen")
+            pipe.expire(f"{key}:gen", self.ttl)
+            pipe.execute()
+
+
+_backend = {"instance": None}
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    if _backend["instance"] is None:
+        with _backend_lock:
+            if _backend["instance"] is None:
+                if CACHE_URL:
+                    _backend["instance"] = RedisBackend(CACHE_URL, CACHE_TTL)
+                else:
+                    _backend["instance"] = LocalBackend(LOCAL_MAX_BYTES, LOCAL_TTL)
+    return _backend["instance"]
+
+
+def _key(session_uuid):
+    return f"areax:session:{session_uuid}"
+
+
+def _load(session_uuid):
+    chat_session = ChatSession.objects.filter(session_id=session_uuid).first()
+    if chat_session is None:
+        return None
+    responses = SmartResponse.objects.filter(chat_session=chat_session).order_by("created_at", "id")
+    return [_header(chat_session), *(_turn(response) for response in responses.only(*TURN_FIELDS))]
+
+
+def _read(session_uuid):
+    backend = get_backend()
+    key = _key(session_uuid)
+    try:
+        items = backend.get(key)
+        if items is not None:
+            return items
+        generation = backend.generation(key)
+    except Exception:
+        logger.exception("Session cache read failed for %s", session_uuid)
+        return _load(session_uuid)
+    items = _load(session_uuid)
+    if items is not None:
+        try:
+            backend.put(key, items, generation)
+        except Exception:
+            logger.exception("Session cache write failed for %s", session_uuid)
+    return items
+
+
+def _session(header, session_uuid):
+    # Enough of a ChatSession to hang a SmartResponse on, without querying it
+    return ChatSession(pk=header["pk"], session_id=session_uuid, user_email=header["user_email"])
+
+
+def get_transcript(session_uuid):
+    """
+    ``(chat_session, turns)`` for the session, turns oldest first as dicts
+    keyed by TURN_FIELDS, or ``(None, None)`` if there is no such session.
+    """
+    items = _read(session_uuid)
+    if items is None:
+        return None, None
+    header = json.loads(items[0])
+    turns = [dict(zip(TURN_FIELDS, json.loads(item))) for item in items[1:]]
+    return _session(header, session_uuid), turns
+
+
+def get_or_create_session(session_id=None):
+    """The ChatSession for ``session_id`` (created if unknown), or a new session when it's empty."""
+    if session_id:
+        session_uuid = session_id if isinstance(session_id, uuid.UUID) else uuid.UUID(str(session_id))
+        items = _read(session_uuid)
+        if items is not None:
+            return _session(json.loads(items[0]), session_uuid)
+        chat_session, _ = ChatSession.objects.get_or_create(session_id=session_uuid)
+        return chat_session
+    return ChatSession.objects.create(session_id=uuid.uuid4())
+
+
+def append(chat_session, response):
+    """Adds a freshly saved SmartResponse to its session's cached transcript."""
+    try:
+        get_backend().append(_key(chat_session.session_id), _turn(response))
+    except Exception:
+        logger.exception("Session cache append failed for %s", chat_session.session_id)
+
+
+def invalidate(session_uuid):
+    try:
+        get_backend().delete(_key(session_uuid))
+    except Exception:
+        logger.exception("Session cache invalidation failed for %s", session_uuid)
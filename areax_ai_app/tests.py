@@ -1,3 +1,204 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from . import cost_ledger, runway_poller
+from .models import AIResponse, DailyCostRollup, MonthlyCostRollup, RunwayTask, UsageEvent, UserInput
+from .provider_fakes import FakeRunway
+
+
+class RunwayPollerTests(TestCase):
+    """runway_video and the shared poller against provider_fakes.FakeRunway."""
+
+    def setUp(self):
+        self.fake = FakeRunway().start()
+        self.addCleanup(self.fake.stop)
+        for name, value in (("RUNWAYML_BASE_URL", self.fake.url), ("RUNWAYML_API_SECRET", "test-key"), ("_client", None)):
+            patcher = mock.patch.object(runway_poller, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # The SDK retries 429s by itself; the poller's own back-off is what's under test
+        runway_poller._client = runway_poller.get_client().with_options(max_retries=0)
+        throttle = mock.patch.dict(runway_poller._throttle, {"until": None, "delay": runway_poller.MIN_POLL_INTERVAL})
+        throttle.start()
+        self.addCleanup(throttle.stop)
+        wake = mock.patch.object(runway_poller.poller, "wake")  # Poll by hand instead of on the worker thread
+        wake.start()
+        self.addCleanup(wake.stop)
+        self.client = APIClient()
+
+    def submit(self, prompt_text="A drone shot over the coast"):
+        response = self.client.post("/ai/api/runway_video", {"prompt_text": prompt_text}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED, response.data)
+        return response
+
+    def poll(self, task_id, times=1):
+        """Makes the task due and runs ``times`` poller passes."""
+        for _ in range(times):
+            RunwayTask.objects.filter(task_id=task_id).update(next_poll_at=timezone.now())
+            runway_poller.poll_due_tasks()
+        return RunwayTask.objects.get(task_id=task_id)
+
+    def backdate(self, task_id, seconds):
+        RunwayTask.objects.filter(task_id=task_id).update(created_at=timezone.now() - timedelta(seconds=seconds))
+
+    def test_submit_returns_202_with_status_url(self):
+        response = self.submit()
+
+        task_id = response.data["task_id"]
+        self.assertIn(task_id, self.fake.tasks)
+        self.assertEqual(response.data["status"], RunwayTask.STATUS_PENDING)
+        self.assertTrue(response.data["status_url"].endswith(f"/ai/api/runway_video/{task_id}"))
+        self.assertTrue(RunwayTask.objects.filter(task_id=task_id, status=RunwayTask.STATUS_PENDING).exists())
+        runway_poller.poller.wake.assert_called_once()
+
+    def test_submit_without_prompt_is_rejected(self):
+        response = self.client.post("/ai/api/runway_video", {}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.fake.request_count, 0)
+
+    def test_polling_reaches_succeeded(self):
+        task_id = self.submit().data["task_id"]
+
+        task = self.poll(task_id)
+        self.assertEqual(task.status, RunwayTask.STATUS_PENDING)
+        self.assertGreater(task.next_poll_at, timezone.now())
+
+        task = self.poll(task_id, times=2)
+        self.assertEqual(task.status, RunwayTask.STATUS_SUCCEEDED)
+        self.assertEqual(task.output, [f"https://fake.runway.local/{task_id}.mp4"])
+        self.assertEqual(task.poll_count, 3)
+        self.assertIsNotNone(task.finished_at)
+
+        response = self.client.get(f"/ai/api/runway_video/{task_id}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["video_url"], task.output)
+
+    def test_polling_reaches_failed(self):
+        task_id = self.submit("please fail this one").data["task_id"]
+
+        task = self.poll(task_id, times=3)
+
+        self.assertEqual(task.status, RunwayTask.STATUS_FAILED)
+        self.assertEqual(task.failure_code, "SAFETY.INPUT.IMAGE")
+        self.assertIsNotNone(task.finished_at)
+
+        response = self.client.get(f"/ai/api/runway_video/{task_id}")
+        self.assertEqual(response.data["failureCode"], "SAFETY.INPUT.IMAGE")
+
+    def test_status_check_times_out(self):
+        task_id = self.submit().data["task_id"]
+        self.backdate(task_id, runway_poller.TASK_TIMEOUT + 1)
+
+        task = self.poll(task_id)
+
+        self.assertEqual(task.status, RunwayTask.STATUS_FAILED)
+        self.assertEqual(task.failure_code, "TIMEOUT")
+        self.assertIsNotNone(task.finished_at)
+
+    def test_failing_status_check_is_retried_then_times_out(self):
+        RunwayTask.objects.create(task_id="purged-task", prompt_text="gone")
+
+        task = self.poll("purged-task")  # Runway answers 404
+        self.assertEqual(task.status, RunwayTask.STATUS_PENDING)
+        self.assertEqual(task.poll_count, 1)
+        self.assertGreater(task.next_poll_at, timezone.now())
+
+        self.backdate("purged-task", runway_poller.TASK_TIMEOUT + 1)
+        task = self.poll("purged-task")
+        self.assertEqual(task.status, RunwayTask.STATUS_FAILED)
+        self.assertEqual(task.failure_code, "TIMEOUT")
+        self.assertIsNotNone(task.finished_at)
+
+    def test_rate_limit_pauses_poller(self):
+        RunwayTask.objects.create(task_id="limited-task", prompt_text="x")
+        self.fake.rate_limit_every = 1
+
+        task = self.poll("limited-task")
+        self.assertEqual(task.status, RunwayTask.STATUS_PENDING)
+        self.assertEqual(task.poll_count, 0)  # A 429 isn't counted against the task
+        self.assertIsNotNone(runway_poller._throttle["until"])
+        self.assertEqual(runway_poller._throttle["delay"], runway_poller.MIN_POLL_INTERVAL * 2)
+
+        requests_made = self.fake.request_count
+        RunwayTask.objects.filter(task_id="limited-task").update(next_poll_at=timezone.now())
+        self.assertGreater(runway_poller.poll_due_tasks(), 0)
+        self.assertEqual(self.fake.request_count, requests_made)  # Paused: Runway wasn't called again
+
+
+class CostLedgerTests(TestCase):
+    def setUp(self):
+        # One request per day from Jan 30 to Mar 2, each costing its day of the year in cents
+        self.days = [date(2025, 1, 30) + timedelta(days=offset) for offset in range(32)]
+        for day in self.days:
+            cost_ledger.record_cost("openai", Decimal(day.timetuple().tm_yday) / 100, "a@example.com", when=day)
+
+    def expected(self, start, end):
+        days = [day for day in self.days if start <= day <= end]
+        return sum((Decimal(day.timetuple().tm_yday) / 100 for day in days), Decimal("0")), len(days)
+
+    def test_total_cost_across_month_edges(self):
+        for start, end in [
+            (date(2025, 1, 31), date(2025, 3, 1)),  # Ragged edges around one whole month
+            (date(2025, 2, 1), date(2025, 2, 28)),  # Exactly one month
+            (date(2025, 1, 30), date(2025, 2, 28)),  # Ragged start, whole month
+            (date(2025, 2, 1), date(2025, 3, 2)),  # Whole month, ragged end
+            (date(2025, 2, 10), date(2025, 2, 20)),  # Inside one month
+            (date(2025, 1, 31), date(2025, 2, 1)),  # Two days across a month boundary
+            (date(2024, 12, 1), date(2025, 12, 31)),  # Wider than the data
+        ]:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(cost_ledger.total_cost("openai", start, end), self.expected(start, end))
+
+    def test_total_cost_filters_by_user(self):
+        start, end = date(2025, 1, 1), date(2025, 3, 31)
+        self.assertEqual(cost_ledger.total_cost("openai", start, end, user_email="a@example.com"), self.expected(start, end))
+        self.assertEqual(cost_ledger.total_cost("openai", start, end, user_email="b@example.com"), (Decimal("0"), 0))
+        self.assertEqual(cost_ledger.total_cost("gemini", start, end), (Decimal("0"), 0))
+
+
+class CostLedgerRebuildTests(TestCase):
+    def at(self, *args):
+        return timezone.make_aware(datetime(*args))
+
+    def legacy_response(self, when, cost):
+        response = AIResponse.objects.create(
+            user_input=UserInput.objects.create(text="hi", tone="casual"), user_email="a@example.com", total_cost=cost,
+        )
+        AIResponse.objects.filter(pk=response.pk).update(created_at=when)
+
+    def test_rebuild_keeps_pre_metering_totals(self):
+        # Metering went live on Feb 10; AIResponse kept its cost column afterwards too
+        self.legacy_response(self.at(2025, 1, 20, 12), Decimal("1.00"))
+        self.legacy_response(self.at(2025, 2, 5, 12), Decimal("2.00"))
+        self.legacy_response(self.at(2025, 2, 12, 12), Decimal("4.00"))
+        for when, cost in [(self.at(2025, 2, 10, 12), "8.00"), (self.at(2025, 3, 3, 12), "16.00")]:
+            UsageEvent.objects.create(provider="openai", model="gpt-4", user_email="a@example.com",
+                                      price_version="test", total_cost=Decimal(cost), created_at=when)
+
+        cost_ledger.rebuild("openai", date(2025, 1, 1), date(2025, 3, 31))
+
+        self.assertEqual(cost_ledger.total_cost("openai", date(2025, 1, 1), date(2025, 1, 31)), (Decimal("1.00"), 1))
+        # February: the pre-metering row plus the metered one, not the duplicate cost on the Feb 12 AIResponse
+        self.assertEqual(cost_ledger.total_cost("openai", date(2025, 2, 1), date(2025, 2, 28)), (Decimal("10.00"), 2))
+        self.assertEqual(cost_ledger.total_cost("openai", date(2025, 2, 1), date(2025, 2, 9)), (Decimal("2.00"), 1))
+        self.assertEqual(cost_ledger.total_cost("openai", date(2025, 1, 15), date(2025, 3, 15)), (Decimal("27.00"), 4))
+
+        # The nightly run over the cut-over months must not lose the pre-metering rows
+        cost_ledger.rebuild("openai", date(2025, 2, 1), date(2025, 3, 31))
+        self.assertEqual(cost_ledger.total_cost("openai", date(2025, 1, 15), date(2025, 3, 15)), (Decimal("27.00"), 4))
+        self.assertEqual(DailyCostRollup.objects.filter(provider="openai").count(), 4)
+        self.assertEqual(MonthlyCostRollup.objects.filter(provider="openai").count(), 3)
+
+    def test_rebuild_before_any_metering_reads_legacy_tables(self):
+        self.legacy_response(self.at(2025, 1, 20, 12), Decimal("1.50"))
+
+        cost_ledger.rebuild("openai", date(2025, 1, 1), date(2025, 1, 31))
 
-# Create your tests here.
+        self.assertEqual(cost_ledger.total_cost("openai", date(2025, 1, 1), date(2025, 1, 31)), (Decimal("1.50"), 1))
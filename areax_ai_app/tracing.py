@@ -0,0 +1,329 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+from . import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+##Lightweight tracing in the OpenTelemetry data model. Spans are opened
+##around provider calls (metering.meter), database writes (TracingMiddleware),
+##media store operations, outgoing HTTP through requests and background
+##tasks. Finished spans are batched to an OTLP/HTTP JSON collector
+##(TRACING_OTLP_ENDPOINT, or the standard OTEL_EXPORTER_OTLP_* variables)
+##and/or appended to TRACING_FILE as OTLP JSON lines. With
+##TRACING_SERVER_TIMING=true each response also gets a Server-Timing header
+##summarising its stages; it names providers, models and internal hosts, so
+##it is off unless asked for (the loadtest command turns it on).
+OTLP_ENDPOINT = os.getenv("TRACING_OTLP_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT") or (
+    os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "").rstrip("/") + "/v1/traces" if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") else ""
+)
+TRACE_FILE = os.getenv("TRACING_FILE", "")
+SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "areax-ai")
+SERVER_TIMING = os.getenv("TRACING_SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+EXPORT_INTERVAL = 2
+EXPORT_BATCH_SIZE = 512
+STATEMENT_LIMIT = 500  # Characters of SQL kept on db spans
+
+# OTLP span kinds and status codes
+INTERNAL, SERVER, CLIENT = 1, 2, 3
+STATUS_OK, STATUS_ERROR = 1, 2
+
+_current = contextvars.ContextVar("tracing_current_span", default=None)
+_scope = contextvars.ContextVar("tracing_request_scope", default=None)
+_TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+_NOT_TOKEN = re.compile(r"[^A-Za-z0-9!#$%&'*+\-.^_`|~]")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "stage", "attributes",
+                 "start_ns", "end_ns", "status", "message", "_token")
+
+    def __init__(self, name, kind, stage, attributes, trace_id, parent_id):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.stage = stage
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.status = STATUS_OK
+        self.message = ""
+        self._token = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+        return self
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.status = STATUS_ERROR
+            self.message = str(error)[:500]
+        if self._token is not None:
+            try:
+                _current.reset(self._token)
+            except ValueError:
+                _current.set(None)  # Ended from another context; just stop being current there
+        scope = _scope.get()
+        if scope is not None:
+            scope["spans"].append(self)
+        _exporter.enqueue(self)
+
+
+def start_span(name, kind=INTERNAL, stage=None, attributes=None, trace_id=None, parent_id=None):
+    """
+    Opens a span as a child of the current one (or a new trace) and makes it
+    current until ``end()``. ``stage`` names its Server-Timing entry.
+    """
+    parent = _current.get()
+    if trace_id is None:
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        parent_id = parent.span_id if parent else None
+    span = Span(name, kind, stage, attributes, trace_id, parent_id)
+    span._token = _current.set(span)
+    return span
+
+
+class span:
+    """``with tracing.span("geocode", stage="geocode"):`` — ends the span, marking errors."""
+
+    def __init__(self, name, kind=INTERNAL, stage=None, **attributes):
+        self._args = (name, kind, stage, attributes)
+
+    def __enter__(self):
+        name, kind, stage, attributes = self._args
+        self.span = start_span(name, kind, stage, attributes)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.end(error=exc)
+        return False
+
+
+class task(span):
+    """A span for work handed off the request thread: same trace, left out of the request's Server-Timing."""
+
+    def __enter__(self):
+        _scope.set(None)  # Runs in a copied context, so the request's own scope is untouched
+        return super().__enter__()
+
+
+def traced(name=None, stage=None):
+    """Decorator form of ``span``."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name or fn.__qualname__, stage=stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def current_trace_id():
+    current = _current.get()
+    return current.trace_id if current else None
+
+
+##Request scope: Server-Timing and database statements of one request
+def parse_traceparent(header):
+    """``(trace_id, parent_span_id)`` from a W3C traceparent header, or ``(None, None)``."""
+    match = _TRACEPARENT.match((header or "").strip().lower())
+    if not match or set(match.group(1)) == {"0"}:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def begin_request(name, traceparent=None, attributes=None):
+    trace_id, parent_id = parse_traceparent(traceparent)
+    _scope.set({"spans": [], "db_reads": 0, "db_read_ns": 0})
+    return start_span(name, SERVER, "total", attributes, trace_id=trace_id or secrets.token_hex(16), parent_id=parent_id)
+
+
+def end_request(root, status_code=None):
+    """Ends the request's root span and returns its Server-Timing header value."""
+    scope = _scope.get() or {"spans": [], "db_reads": 0, "db_read_ns": 0}
+    if status_code is not None:
+        root.set("http.status_code", status_code)
+    root.set("db.read_queries", scope["db_reads"])
+    root.end(error=f"HTTP {status_code}" if status_code and status_code >= 500 else None)
+    _scope.set(None)
+
+    stages = OrderedDict()
+    for finished in scope["spans"]:
+        if finished is root or not finished.stage:
+            continue
+        total, count = stages.get(finished.stage, (0.0, 0))
+        stages[finished.stage] = (total + finished.duration_ms, count + 1)
+    if scope["db_reads"]:
+        stages["db.read"] = (scope["db_read_ns"] / 1e6, scope["db_reads"])
+    entries = [f'{_NOT_TOKEN.sub("_", stage)};dur={total:.1f};desc="{count}x"' for stage, (total, count) in stages.items()]
+    entries.append(f"total;dur={root.duration_ms:.1f}")
+    return ", ".join(entries)
+
+
+def db_wrapper(execute, sql, params, many, context):
+    """connection.execute_wrapper hook: a span per write, reads only counted."""
+    verb = sql.lstrip()[:6].upper()
+    if verb in ("INSERT", "UPDATE", "DELETE"):
+        with span(f"db.{verb.lower()}", CLIENT, "db.write",
+                  **{"db.system": context["connection"].vendor, "db.statement": sql[:STATEMENT_LIMIT]}):
+            return execute(sql, params, many, context)
+    scope = _scope.get()
+    if scope is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        scope["db_reads"] += 1
+        scope["db_read_ns"] += time.perf_counter_ns() - started
+
+
+##Outgoing HTTP (geocoding, downloads, provider REST calls made with requests)
+def instrument_requests():
+    import requests
+
+    if getattr(requests.Session.send, "areax_traced", False):
+        return
+    original = requests.Session.send
+
+    @functools.wraps(original)
+    def send(self, request, **kwargs):
+        if _current.get() is None:
+            return original(self, request, **kwargs)
+        url = urlsplit(request.url)
+        # No query string: it often carries API keys
+        with span(f"HTTP {request.method} {url.hostname}", CLIENT, f"http.{url.hostname}", **{
+            "http.method": request.method,
+            "http.url": f"{url.scheme}://{url.netloc}{url.path}",
+        }) as current:
+            response = original(self, request, **kwargs)
+            current.set("http.status_code", response.status_code)
+            return response
+
+    send.areax_traced = True
+    requests.Session.send = send
+
+
+##Export
+def _value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp(spans):
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{
+            "scope": {"name": __name__},
+            "spans": [
+                {
+                    "traceId": s.trace_id,
+                    "spanId": s.span_id,
+                    **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                    "name": s.name,
+                    "kind": s.kind,
+                    "startTimeUnixNano": str(s.start_ns),
+                    "endTimeUnixNano": str(s.end_ns),
+                    "attributes": [{"key": k, "value": _value(v)} for k, v in s.attributes.items() if v is not None],
+                    "status": {"code": s.status, **({"message": s.message} if s.message else {})},
+                }
+                for s in spans
+            ],
+        }],
+    }]}
+
+
+class SpanExporter:
+    """Batches finished spans on a daemon thread; spans are dropped, never waited on, when it falls behind."""
+
+    def __init__(self, endpoint, path, maxsize=20000):
+        self.endpoint = endpoint
+        self.path = path
+        self.enabled = bool(endpoint or path)
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._dropped = 0
+
+    def enqueue(self, finished):
+        if not self.enabled:
+            return
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(finished)
+        except queue.Full:
+            self._dropped += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="areax-tracing", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=EXPORT_INTERVAL)]
+            except queue.Empty:
+                continue
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.export(batch)
+
+    def export(self, batch):
+        body = json.dumps(_otlp(batch), separators=(",", ":"))
+        if self._dropped:
+            logger.warning("Tracing queue full, dropped %d spans", self._dropped)
+            self._dropped = 0
+        if self.path:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(body + "\n")
+            except OSError as e:
+                logger.warning("Could not write spans to %s: %s", self.path, e)
+        if self.endpoint:
+            # urllib rather than requests, so exporting is never traced itself
+            request = urllib.request.Request(
+                self.endpoint, data=body.encode("utf-8"), headers={"Content-Type": "application/json"},
+            )
+            try:
+                urllib.request.urlopen(request, timeout=5).close()
+            except Exception as e:
+                logger.warning("Could not export %d spans to %s: %s", len(batch), self.endpoint, e)
+
+
+_exporter = SpanExporter(OTLP_ENDPOINT, TRACE_FILE)
+metrics.QUEUE_DEPTH.set_function(lambda: _exporter._queue.qsize(), "trace_spans")
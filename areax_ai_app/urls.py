@@ -10,6 +10,8 @@ urlpatterns = [
     path("caption_list",views.Caption_listAPI.as_view(),name="caption_list"),
     path('google_photos', views.GooglePhotosAPI.as_view(), name='google_photos'),
     path('photo_search_caption', views.SearchCaptionImageAPI.as_view(), name='photo_search_caption'),
+    path('photo_search', views.PhotoSearchAPI.as_view(), name='photo_search'),
+    path('search', views.SearchAPI.as_view(), name='search'),
     path('ai_agent_input', views.TextInputHandler.as_view(), name='text_input_handler'),
     path('image_generation', views.GenerateImageView.as_view(), name='image_generation'),
     path('image/<int:pk>/', views.RetrieveImageView.as_view(), name='retrieve_image'),
@@ -24,9 +26,10 @@ urlpatterns = [
 
     path('gemini_caption', views.GeminiCaptionAPIView.as_view(), name='gemini_caption'),
     path('gemini_cost', views.Gemini_OverallCostAPIView.as_view(), name='gemini_cost'),
-    path('gemini_daterange_cost', views.Gemini_daterangeCostAPI.as_view(), name='gemini_daterange_cost'),
-    path('openai_daterange_cost', views.OpenAI_daterangeCostAPI.as_view(), name='openai_daterange_cost'),
-    path('sd_daterange_cost', views.SD_daterangeCostAPI.as_view(), name='sd_daterange_cost'),
+    path('cost_daterange', views.CostDateRangeAPI.as_view(), name='cost_daterange'),
+    path('gemini_daterange_cost', views.CostDateRangeAPI.as_view(provider="gemini"), name='gemini_daterange_cost'),
+    path('openai_daterange_cost', views.CostDateRangeAPI.as_view(provider="openai"), name='openai_daterange_cost'),
+    path('sd_daterange_cost', views.CostDateRangeAPI.as_view(provider="stability"), name='sd_daterange_cost'),
 
     path('user_based_survey', views.UserBasedProfileAPI.as_view(), name='user_based_survey'), ##29oct
     path('broadcast_agent', views.Pw_BroadcastAgentAPI.as_view(), name='broadcast_agent'), ##11nov
@@ -34,10 +37,14 @@ urlpatterns = [
     path('llama_Status', views.LlamaStatusView.as_view(), name='llama_Status'), ##11nov
     path('llama_chat', views.HuggingFaceChatAPI.as_view(), name='llama_chat'), ##18nov
     path('runway_video', views.VideoGenerationAPIViewRun.as_view(), name='runway_video'), ##20nov runway
+    path('runway_video/<str:task_id>', views.RunwayTaskStatusAPI.as_view(), name='runway_video_status'),
     path('modellab_video', views.VideoGenerationAPIView.as_view(), name='runway_video'), ##20nov
     path('mimage_video', views.ImageToVideoGenerationAPIModel.as_view(), name='mimage_video'), ##20nov
     path('voice_video', views.VoiceCommandVideoModelLabAPI.as_view(), name='voice_video'), ##20nov
+    path('modellab_video/<int:video_id>', views.ModelsLabVideoStatusAPI.as_view(), name='modellab_video_status'),
+    path('modelslab_webhook', views.ModelsLabWebhookAPI.as_view(), name='modelslab_webhook'),
     path('notification', views.Notification_LocationAPI.as_view(), name='notification'), ##03nov
+    path('notification_thumbnail', views.NotificationThumbnailAPI.as_view(), name='notification_thumbnail'),
     path('data_clean', views.CleanDataPipelineAPI.as_view(), name='data_clean'), ##03nov
 
     path('chat_retrieve', views.ChatRetrieveAPIView.as_view(), name='chat_retrieve'), ##027nov
@@ -51,6 +58,7 @@ urlpatterns = [
     path("plm_voice", views.PLM_Voice_API.as_view() , name="plm_voice"),
 
     path('image_generation_gemini', views.ImageGenerationAPIGemini.as_view(), name='image_generation_gemini'),
+    path('image_generation_batch', views.BatchImageGenerationAPI.as_view(), name='image_generation_batch'),
     path('gemini_voice', views.Gemini_voiceChat.as_view(), name='gemini_voice'), ##06mar
     path('one_feed', views.GeminiSmartAPIView.as_view(), name='one_feed'), ##26mar
     path('chatsession_history', views.ChatHistoryAPI.as_view(), name='chat_session'), ##15april
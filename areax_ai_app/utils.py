@@ -3,6 +3,8 @@ from dotenv import load_dotenv
 import base64
 import os
 import openai
+from .metering import meter
+from .db_tuning import sqlite_connection
 
 load_dotenv()
 OPENAI_API_KEY=os.getenv("OPENAI_API_KEY")
@@ -17,18 +19,20 @@ def encode_image_to_base64(image_path):
 
 def describe_image(image_path, prompt):
     client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant"},
-            {"role": "user", "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": image_path}},
-            ]}
-        ],
-        max_tokens=256,
-        temperature=0.0,
-    )
+    with meter("openai", "gpt-4o") as usage:
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "You are a helpful assistant"},
+                {"role": "user", "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": image_path}},
+                ]}
+            ],
+            max_tokens=256,
+            temperature=0.0,
+        )
+        usage.from_openai(response)
 
     return response.choices[0].message.content
 
@@ -42,7 +46,9 @@ def generate_response(prompt, personality_traits):
         print(fine_tuned_prompt,"iiiiiprompt")
         # Generate response using Gemini
         model = genai.GenerativeModel("models/gemini-1.5-pro")
-        response = model.generate_content(fine_tuned_prompt)
+        with meter("gemini", "gemini-1.5-pro") as usage:
+            response = model.generate_content(fine_tuned_prompt)
+            usage.from_gemini(response)
 
         print(response,"---------------ajahdaj")
 
@@ -57,9 +63,11 @@ def generate_response(prompt, personality_traits):
         return f"Error generating response: {str(e)}"
 
 
+USER_DATA_DB = 'user_data.db'
+
 # Function to get or create a user profile
 def get_or_create_user_profile(user_id):
-    conn = sqlite3.connect('user_data.db')
+    conn = sqlite_connection(USER_DATA_DB)  # One tuned connection per thread
     cursor = conn.cursor()
 
     cursor.execute("SELECT preferences, personality_traits FROM users WHERE user_id = ?", (user_id,))
@@ -74,19 +82,17 @@ def get_or_create_user_profile(user_id):
                        (user_id, preferences, personality_traits))
         conn.commit()
 
-    conn.close()
     return preferences, personality_traits
 
 
 # Function to save chat history
 def save_chat_history(user_id, user_input, response):
-    conn = sqlite3.connect('user_data.db')
+    conn = sqlite_connection(USER_DATA_DB)
     cursor = conn.cursor()
 
     cursor.execute("INSERT INTO chat_history (user_id, message, response) VALUES (?, ?, ?)",
                    (user_id, user_input, response))
     conn.commit()
-    conn.close()
 
 
 
@@ -95,11 +101,10 @@ def save_chat_history(user_id, user_input, response):
 ##Creation of DB
 
 
-import sqlite3
 
 def init_db():
     """Initialize SQLite database and create tables if not exist."""
-    conn = sqlite3.connect('user_data.db')  # Ensure this matches your database path
+    conn = sqlite_connection(USER_DATA_DB)  # Ensure this matches your database path
     cursor = conn.cursor()
 
     # Drop existing tables if they exist (for debugging, remove in production)
@@ -129,4 +134,3 @@ def init_db():
     ''')
 
     conn.commit()
-    conn.close()
\ No newline at end of file
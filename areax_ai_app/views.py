@@ -1,12 +1,14 @@
 import io
+import hmac
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication,SessionAuthentication
-from django.contrib.auth import authenticate,login as django_login, logout as django_logout
+from rest_framework.authentication import SessionAuthentication
+from .authentication import CachedTokenAuthentication, revoke as revoke_token
+from django.contrib.auth import login as django_login, logout as django_logout
 from django.contrib.auth.models import User
 from .serializers import (UserSerializer,GooglePhotosCredentialsSerializer,ImageUploadSerializer,Edit_Caption_Serializer,UserInputSerializer,AIResponseSerializer,TextInputSerializer,FeedbackSerializer,GeneratedImageSerializer,OpenaAIUsageDBSerializer,VideoGenerated_Serializer,SmartResponseSerializer,ChatSessionSerializer,EnhancedSocialContentSerializer)
-from django.db.models import Q
+from django.db import IntegrityError, transaction
 from rest_framework.permissions import IsAuthenticated,AllowAny
 from rest_framework.authtoken.models import Token
 from .utils import encode_image_to_base64,describe_image
@@ -17,15 +19,14 @@ from django.conf import settings
 from django.http import JsonResponse
 from django.core.files.storage import default_storage
 
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 import logging
 from pydub import AudioSegment
-from .models import AIContentDb,AIResponse,UserInput,GeneratedImage,OpenaAI_UsageDB,ImageGenerationSD_DB,ImageCaptionGeminiDB,SmartResponse,ChatSession,EnhancedSocialContent,SchedulingAssistantLog,WellnessBotLog
+from .models import AIContentDb,AIResponse,UserInput,GeneratedImage,OpenaAI_UsageDB,ImageGenerationSD_DB,ImageCaptionGeminiDB,SmartResponse,ChatSession,EnhancedSocialContent,SchedulingAssistantLog,WellnessBotLog,GooglePhotoItem,PhotoEmbedding,UserEmailIndex
 from django.utils import timezone
-from django.db.models import Sum
 from dotenv import load_dotenv
 from transformers import pipeline
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 import speech_recognition as sr
 from PIL import Image
 import os
@@ -33,11 +34,12 @@ import torch
 from diffusers import CogVideoXPipeline
 from diffusers.utils import export_to_video
 
-from agno.agent import Agent
-from agno.models.google import Gemini
-from agno.tools.googlecalendar import GoogleCalendarTools
-from tzlocal import get_localzone_name
 from .models import SchedulingAssistantLog
+from . import metering
+from .metering import meter
+from . import media_store
+from . import accounts, content_pool, google_photos_index, image_cache, image_generation, metrics, photo_retrieval, provider_endpoints, scheduling_agent, search_index, session_cache, write_behind
+from .background_tasks import run_in_background
 import random
 from datetime import datetime
 load_dotenv()
@@ -59,13 +61,10 @@ def baseurl(request):
   return scheme + request.get_host()
 
 
-#Get User email
+#Get User email (normalised email or username, token preloaded)
 def get_user(email):
   try:
-    user = User.objects.filter(
-      Q(email=email.lower())
-      | Q(username=email)
-    ).first()
+    user = accounts.find_login_user(email)
     if user:
       return [True, user]
     else:
@@ -80,18 +79,20 @@ class UserRegistrationView(APIView):
     def post(self, request,format=None):
         serializer = UserSerializer(data=request.data)
         if serializer.is_valid():
-          email = serializer.validated_data.get('email')
-          user = User.objects.filter(email=email).first()
-          if user:
-            token, created = Token.objects.get_or_create(user=user)
-            return Response({"token": token.key},
-                            status=status.HTTP_200_OK)
-          else:
-            user = serializer.save()
-            token = Token.objects.create(user=user)
-            return Response({"token": token.key,
-                             "data": serializer.data},
-                            status=status.HTTP_201_CREATED)
+          # validate_email has already checked the email is free; a concurrent
+          # registration of the same email loses on the index's unique key
+          try:
+            with transaction.atomic():
+              user = serializer.save()
+              token = Token.objects.create(user=user)
+              if accounts.normalize_email(user.email) and not UserEmailIndex.objects.filter(user=user).exists():
+                raise IntegrityError("email already registered")
+          except IntegrityError:
+            return Response({"email": ["This email address is already in use."]},
+                            status=status.HTTP_400_BAD_REQUEST)
+          return Response({"token": token.key,
+                           "data": serializer.data},
+                          status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -108,10 +109,14 @@ class LoginView(APIView):
 
         if user[0]:
           if not not user[1].password:
-            user_data = authenticate(username=user[1], password=password)
+            # Same checks as ModelBackend.authenticate, on the user we already have
+            user_data = user[1] if user[1].check_password(password) and user[1].is_active else None
             if user_data:
               django_login(request, user[1])
-              token, created = Token.objects.get_or_create(user=user[1])
+              try:
+                token = user[1].auth_token
+              except Token.DoesNotExist:
+                token = Token.objects.create(user=user[1])
               return Response({
                 "status": status.HTTP_200_OK,
                 "message": "Successfully logged in",
@@ -153,7 +158,7 @@ class LoginView(APIView):
 
 ##Logout API
 class LogoutView(APIView):
-  authentication_classes = (TokenAuthentication,)
+  authentication_classes = (CachedTokenAuthentication,)
 
   def post(self, request, format=None):
     user_id = request.user.id
@@ -161,6 +166,9 @@ class LogoutView(APIView):
       logged_in_user_id = User.objects.filter(id=user_id).first()
       if logged_in_user_id:
         django_logout(request)
+      if request.auth is not None:
+        # The token stops working in every worker right away
+        revoke_token(request.auth)
       content = {"status": 200, "message": "LogOut Successfully"}
     else:
       content = {"status": 400, "message": "Invalid token"}
@@ -218,6 +226,8 @@ class Generate_ContentAPIView(APIView):
                     else:
                         logger.error(f"Error processing response for image: {local_image_path}")
 
+            # Make the new captioned images searchable by content
+            run_in_background(photo_retrieval.index_pending, email)
             return JsonResponse({"Caption": new_data,"image_url":image_url, 'status': status.HTTP_200_OK})
 
         except Exception as e:
@@ -233,9 +243,9 @@ class GooglePhotosAPI(APIView):
         if serializer.is_valid():
             email = serializer.validated_data.get('email')
 
-            credentials_info = GooglePhotosService.get_google_api_credentials(email)
-            if credentials_info:
-                service = GooglePhotosService.get_google_photos_service(credentials_info)
+            # Cached credentials and discovery document: one Library API call
+            service = GooglePhotosService.get_service_for(email)
+            if service:
                 photos = GooglePhotosService.get_photos(service)
                 return Response(photos, status=status.HTTP_200_OK)
             else:
@@ -254,27 +264,125 @@ class SearchCaptionImageAPI(APIView):
 
             uploaded_image = image.name
 
-            credentials_info = GooglePhotosService.get_google_api_credentials(email)
-            if credentials_info:
-                service = GooglePhotosService.get_google_photos_service(credentials_info)
+            def get_service():
+                return GooglePhotosService.get_service_for(email)
 
-                google_photos = GooglePhotosService.fetch_all_photos(service)
-                if google_photos:
-                    matched_photo = GooglePhotosService.match_image(uploaded_image, google_photos)
-                    if matched_photo:
-                        return Response(
-                            {"matched_image": matched_photo, "message": "Successfully fetched matching image"},
-                            status=status.HTTP_200_OK)
-                    else:
-                        return Response({"error": "No matching photo found"}, status=status.HTTP_404_NOT_FOUND)
-                else:
-                    return Response({"error": "No photos found in Google Photos"}, status=status.HTTP_404_NOT_FOUND)
+            # Search the user's local index; the library is only listed when the index is built or stale
+            try:
+                if not google_photos_index.ensure_index(email, get_service):
+                    return Response({"error": "Google Photos library is still being indexed, try again shortly"},
+                                    status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            except google_photos_index.GooglePhotosUnavailable as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            if not GooglePhotoItem.objects.filter(user_email=email).exists():
+                return Response({"error": "No photos found in Google Photos"}, status=status.HTTP_404_NOT_FOUND)
+
+            matched_item, match_type = google_photos_index.match(email, uploaded_image, image)
+            if matched_item is None and photo_retrieval.EMBEDDINGS_ENABLED:
+                # Same photo re-encoded or resized beyond what the dHash tolerates
+                image.seek(0)
+                hits = photo_retrieval.search(email, image_data=image.read(), k=1,
+                                              sources=(PhotoEmbedding.SOURCE_GOOGLE_PHOTOS,))
+                if hits and hits[0]["score"] >= photo_retrieval.MATCH_MIN_SCORE:
+                    matched_item = GooglePhotoItem.objects.get(user_email=email, media_item_id=hits[0]["id"])
+                    match_type = "embedding"
+            if matched_item:
+                return Response(
+                    {"matched_image": google_photos_index.fresh_metadata(matched_item, get_service),
+                     "match_type": match_type,
+                     "message": "Successfully fetched matching image"},
+                    status=status.HTTP_200_OK)
             else:
-                return Response({"error": "Failed to fetch Google API credentials"}, status=status.HTTP_400_BAD_REQUEST)
+                return Response({"error": "No matching photo found"}, status=status.HTTP_404_NOT_FOUND)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+## Photo search over the synced Google Photos library and captioned images
+class PhotoSearchAPI(APIView):
+    """
+    Top-k photos of the signed-in user similar to an uploaded ``image`` or
+    matching a ``text`` description. Optional ``sources``: google_photos,
+    caption (comma separated).
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+
+    def post(self, request, *args, **kwargs):
+        email = request.user.email
+        image = request.FILES.get("image")
+        text = (request.data.get("text") or "").strip()
+        sources = request.data.get("sources") or photo_retrieval.SOURCES
+        if isinstance(sources, str):
+            sources = [source.strip() for source in sources.split(",") if source.strip()]
+        if not image and not text:
+            return Response({"error": "Provide an image or a text query"}, status=status.HTTP_400_BAD_REQUEST)
+        if any(source not in photo_retrieval.SOURCES for source in sources):
+            return Response({"error": f"sources must be among {', '.join(photo_retrieval.SOURCES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top_k = min(max(int(request.data.get("top_k", 10)), 1), 100)
+        except (TypeError, ValueError):
+            return Response({"error": "top_k must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if not email:
+            # No email, no index of theirs; never search someone else's
+            return Response({"status": "success", "count": 0, "results": []}, status=status.HTTP_200_OK)
+
+        try:
+            results = photo_retrieval.search(
+                email, image_data=image.read() if image else None, text=text or None, k=top_k, sources=tuple(sources),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception("Photo search failed for %s", email)
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({"status": "success", "count": len(results), "results": results}, status=status.HTTP_200_OK)
+
+
+## Full-text search over captions, AI responses and chat history
+class SearchAPI(APIView):
+    """
+    GET ?q=&types=caption,chat_history&page=1&page_size=20
+    Searches the signed-in user's own records only. Results are ranked by
+    relevance with the matched words wrapped in <mark>.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        types = request.query_params.get("types")
+        sources = [source.strip() for source in types.split(",") if source.strip()] if types else None
+        try:
+            page = int(request.query_params.get("page", 1))
+            page_size = int(request.query_params.get("page_size", 20))
+            if request.user.email:
+                total, results = search_index.search(
+                    request.query_params.get("q"),
+                    user_email=request.user.email,
+                    sources=sources,
+                    page=page,
+                    page_size=page_size,
+                )
+            else:
+                # No email, nothing of theirs is indexed; never fall back to the unscoped search
+                total, results = 0, []
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.exception("Search failed")
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({
+            "status": "success",
+            "query": request.query_params.get("q"),
+            "page": max(page, 1),
+            "page_size": min(max(page_size, 1), search_index.MAX_PAGE_SIZE),
+            "total": total,
+            "results": results,
+        }, status=status.HTTP_200_OK)
+
 
 ###ALl generated content
 class Caption_listAPI(APIView):
@@ -328,7 +436,7 @@ class EditCaptionAPIView(APIView):
 # Load models Sentiment NLP Model
 sentiment_model = pipeline('sentiment-analysis', model='distilbert-base-uncased-finetuned-sst-2-english')
 import google.generativeai as genai
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+genai.configure(api_key=os.getenv('GEMINI_API_KEY'), **provider_endpoints.generativeai_options())
 # Configuration for the model generation
 generation_config = {
     "temperature": 1,
@@ -383,6 +491,7 @@ class TextInputHandler(APIView):
         text = request.data.get('text')
         user_reference_number = request.data.get('user_reference_number')
         user_email = request.data.get('user_email')
+        metering.bind(user_email=user_email, user_reference_number=user_reference_number)
 
         if not text:
             return Response({"error": "No text input provided"}, status=400)
@@ -417,7 +526,9 @@ class TextInputHandler(APIView):
 
         # Generate response using Gemini model
         try:
-            response = self.client.generate_content(messages)
+            with meter("gemini", "gemini-2.0-flash") as usage:
+                response = self.client.generate_content(messages)
+                usage.from_gemini(response)
             response_text = response.text.strip()
         except Exception as e:
             return Response({"error": f"AI response generation failed: {str(e)}"}, status=500)
@@ -453,9 +564,29 @@ class GenerateImageView(APIView):
         user_reference_number = request.data.get('user_reference_number', '')
         user_email = request.data.get('user_email', '')
         negative_prompt = request.data.get('negative_prompt', '')
+        use_cache = image_cache.wants_cache(request.data)
+        metering.bind(user_email=user_email, user_reference_number=user_reference_number)
         if not prompt:
             return Response({"status": "error", "message": "Prompt is required"}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Same prompt seen before: serve the stored image instead of generating again
+        cached = image_cache.lookup("huggingface", "FLUX.1-dev", prompt) if use_cache else None
+        if cached:
+            image_url = media_store.absolute_url(cached[0].url, baseurl(request))
+            write_behind.enqueue(GeneratedImage(
+                prompt=prompt,
+                user_reference_number=user_reference_number,
+                user_email=user_email,
+                negative_prompt=negative_prompt,
+                image=image_url,
+            ))
+            return Response({
+                "status": "success",
+                "image_url": image_url,
+                "renditions": {width: media_store.absolute_url(url, baseurl(request)) for width, url in cached[0].renditions.items()},
+                "cached": True,
+            }, status=status.HTTP_200_OK)
+
         # Hugging Face API details
         API_URL = "https://api-inference.huggingface.co/models/black-forest-labs/FLUX.1-dev"
 
@@ -465,38 +596,42 @@ class GenerateImageView(APIView):
 
         # Query the Hugging Face model
         try:
-            response = requests.post(API_URL, headers=headers, json={"inputs": prompt})
+            with meter("huggingface", "FLUX.1-dev") as usage:
+                response = requests.post(API_URL, headers=headers, json={"inputs": prompt})
+                if response.status_code == 200:
+                    usage.add(image_units=1)
+                else:
+                    usage.status = "error"
             if response.status_code == 200:
                 # Ensure response content is valid image data
                 if not response.content:
                     return Response({"status": "error", "message": "Empty response from model"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-                # Generate a unique file name using UUID
-                unique_id = uuid.uuid4()
-                output_format = response.headers.get("Content-Type", "image/png").split('/')[-1]
-                file_name = f"generated_image_{unique_id}.{output_format}"
-                file_path = os.path.join(settings.MEDIA_ROOT, file_name)
-
-                # Save the image to the media directory
-                with open(file_path, "wb") as img_file:
-                    img_file.write(response.content)
-
-                # Construct the accessible image URL
-                image_url = f"{settings.MEDIA_URL}{file_name}"
+                # Store in the media store (content-addressed, served by the CDN / web server)
+                stored = media_store.put_bytes(
+                    response.content,
+                    response.headers.get("Content-Type", "image/png"),
+                    prefix="generated_images",
+                    renditions=True,
+                )
+                if use_cache:
+                    image_cache.store("huggingface", "FLUX.1-dev", prompt, {}, [stored])
+                image_url = media_store.absolute_url(stored.url, baseurl(request))
 
-                print(baseurl(request)+image_url,"----------")
-                # Save the generated image to the database
-                generated_image = GeneratedImage.objects.create(
+                # Save the generated image to the database (batched, off the request path)
+                write_behind.enqueue(GeneratedImage(
                                     prompt=prompt,
                                     user_reference_number=user_reference_number,
                                     user_email=user_email,
                                     negative_prompt=negative_prompt,
-                                    image=baseurl(request)+image_url,  # Save binary content directly
-                )
+                                    image=image_url,
+                ))
                 # Return response with the image URL
                 return Response({
                     "status": "success",
-                    "image_url": baseurl(request)+image_url
+                    "image_url": image_url,
+                    "renditions": {width: media_store.absolute_url(url, baseurl(request)) for width, url in stored.renditions.items()},
+                    "cached": False,
                 }, status=status.HTTP_200_OK)
 
             elif response.status_code == 401:
@@ -579,11 +714,13 @@ from openai import OpenAI
 client_open=OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 def text_to_speech(text):
-    response = client_open.audio.speech.create(
-        model="tts-1",
-        voice="nova",
-        input=text,
-    )
+    with meter("openai", "tts-1") as usage:
+        response = client_open.audio.speech.create(
+            model="tts-1",
+            voice="nova",
+            input=text,
+        )
+        usage.add(characters=len(text))
     print(response,"-------++++++response++++++--- text to spechh--------")
     audio_data = io.BytesIO(response.content)
     return audio_data
@@ -598,50 +735,47 @@ class AudioTranscriptionView(APIView):
         audio_bytes = base64.b64decode(base64_audio)
         audio_stream = io.BytesIO(audio_bytes)
         audio_stream.name = "file.mp3"
+        metering.bind(user_email=user_email, user_reference_number=user_reference_number)
 
         try:
 
-            transcript_text = client_open.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_stream,
-                language="en",
-                response_format="text"
-            )
+            # verbose_json carries the audio duration, which is what Whisper bills
+            with meter("openai", "whisper-1") as usage:
+                transcription = client_open.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=audio_stream,
+                    language="en",
+                    response_format="verbose_json"
+                )
+                usage.add(audio_seconds=getattr(transcription, "duration", 0))
+            transcript_text = transcription.text
 
             print(transcript_text)
             if not transcript_text:
                 return Response({"error": "Could not transcribe audio"}, status=400)
 
             # Generate the AI response based on the transcription
-            response = client_open.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a highly skilled AI persona Agent, reply based on user sentiment in complete sentences."},
-                    {"role": "user", "content": transcript_text}
-                ],
-                max_tokens=256,
-                temperature=0.5
-            )
-            print(response,"--------------AUdio _____response ")
+            with meter("openai", "gpt-4") as usage:
+                response = client_open.chat.completions.create(
+                    model="gpt-4",
+                    messages=[
+                        {"role": "system", "content": "You are a highly skilled AI persona Agent, reply based on user sentiment in complete sentences."},
+                        {"role": "user", "content": transcript_text}
+                    ],
+                    max_tokens=256,
+                    temperature=0.5
+                )
+                usage.from_openai(response)
 
             # Access token usage from the response
-
             output_tokens = response.usage.completion_tokens
-
-            print(output_tokens, "--------output_tokens----")
             input_tokens = response.usage.prompt_tokens
-            print(input_tokens, "-------input_prompt")
             total_tokens = response.usage.total_tokens
-            print(total_tokens, "------------ALL use token")
 
-            # Cost calculation
-            cost_per_token = 0.0015 / 1000  # Example rate
-            input_cost = input_tokens * cost_per_token
-            print(input_cost, "---------------input cost")
-            output_cost = output_tokens * cost_per_token
-            print(output_cost, "-----------output cost")
-            total_cost = total_tokens * cost_per_token
-            print(total_cost, "-------total cost used per chat-----")
+            # Cost calculation from the metering price table
+            input_cost = usage.input_cost
+            output_cost = usage.output_cost
+            total_cost = usage.total_cost
 
             # # Save user input with detected tone
 
@@ -654,7 +788,7 @@ class AudioTranscriptionView(APIView):
                 audio_base64 = base64.b64encode(audio_data.read()).decode("utf-8")
 
                 # Save to OpenaAI_UsageDB
-                OpenaAI_UsageDB.objects.create(
+                write_behind.enqueue(OpenaAI_UsageDB(
                     user_reference_number=user_reference_number,
                     user_email=user_email,
                     prompt=base64_audio,
@@ -666,7 +800,7 @@ class AudioTranscriptionView(APIView):
                     input_cost=input_cost,
                     output_cost=output_cost,
                     total_cost=total_cost
-                )
+                ))
 
 
                 return Response({"status":status.HTTP_200_OK,"user_reference_number":user_reference_number,"user_email":user_email,"transcript": transcript_text, "ai_response": ai_response, "audio": audio_base64}, status=200)
@@ -680,23 +814,14 @@ class AudioTranscriptionView(APIView):
 #### All total cost getAPI
 
 ##MonthlyeiseAPi
+from .cost_ledger import SERVICE_NAMES, month_end, month_start, total_cost as ledger_total_cost
 class OverallCostAPIView(APIView):
     def get(self, request, *args, **kwargs):
         try:
-            # Get the current month and year
+            # Current month total, read from the monthly cost rollup
             now = timezone.now()
-            current_year = now.year
-            current_month = now.month
-
-            # Filter data for the current month and year and calculate the total cost
-            current_month_cost = (
-                AIResponse.objects
-                .filter(created_at__year=current_year, created_at__month=current_month)
-                .aggregate(total_cost=Sum('total_cost'))
-            )
-
-            # Extract the total cost, handling None case
-            total_cost = current_month_cost['total_cost'] or 0.0
+            today = timezone.localdate(now)
+            total_cost, _count = ledger_total_cost("openai", month_start(today), month_end(today))
 
             # Prepare the response data
             response_data = {
@@ -738,7 +863,12 @@ class ImageGenerationAPIView(APIView):
         }
 
         try:
-            response = requests.post(api_url, headers=headers, files={"none": ''}, data=data)
+            with meter("stability", "sd3-medium") as usage:
+                response = requests.post(api_url, headers=headers, files={"none": ''}, data=data)
+                if response.status_code == 200:
+                    usage.add(image_units=1)
+                else:
+                    usage.status = "error"
 
             # Check if the response is successful
             if response.status_code == 200:
@@ -747,11 +877,8 @@ class ImageGenerationAPIView(APIView):
                 with open(image_path, 'wb') as file:
                     file.write(response.content)
 
-                # Cost calculation
-                credits_per_image = 3.5  # Example value, adjust as needed
-                cost_per_credit = 0.01  # Example value, adjust as needed
-                used_credit_in_image_generation = credits_per_image * cost_per_credit
-                total_cost_in_dollar = used_credit_in_image_generation
+                # Cost calculation from the metering price table
+                total_cost_in_dollar = usage.total_cost
 
                 # Save to the database
                 image_generation = ImageGenerationSD_DB.objects.create(
@@ -780,20 +907,10 @@ class ImageGenerationAPIView(APIView):
 class TotalImageCostAPIView(APIView):
     def get(self, request):
         try:
-            # Get the current month and year
+            # Current month total, read from the monthly cost rollup
             now = timezone.now()
-            current_year = now.year
-            current_month = now.month
-
-            # Filter data for the current month and year and calculate the total cost
-            current_month_cost = (
-                ImageGenerationSD_DB.objects
-                .filter(created_at__year=current_year, created_at__month=current_month)
-                .aggregate(total_cost=Sum('total_cost_in_dollar'))
-            )
-
-            # Extract the total cost, handling None case
-            total_cost = current_month_cost['total_cost'] or 0.0
+            today = timezone.localdate(now)
+            total_cost, _count = ledger_total_cost("stability", month_start(today), month_end(today))
 
             # Prepare the response data
             response_data = {
@@ -815,7 +932,7 @@ class TotalImageCostAPIView(APIView):
 
 # Configure your Gemini API Key
 import google.generativeai as genai
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+genai.configure(api_key=os.getenv('GEMINI_API_KEY'), **provider_endpoints.generativeai_options())
 
 
 # Configuration for the model generation
@@ -829,7 +946,7 @@ generation_config = {
 ##New caption with gemini2 032025
 from google import genai
 import PIL.Image
-genai_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+genai_client = provider_endpoints.genai_client(api_key=os.getenv("GEMINI_API_KEY"))
 class GeminiCaptionAPIView(APIView):
     parser_classes = (MultiPartParser, FormParser)
 
@@ -876,11 +993,12 @@ class GeminiCaptionAPIView(APIView):
                 return Response({"error": "Invalid caption_type. Use 'custom' or 'predefined'."}, status=status.HTTP_400_BAD_REQUEST)
 
             # Generate caption using Gemini model
-            print(genai_client,"-----------gemai cliet")
-            response = genai_client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=[prompt_text, image]
-            )
+            with meter("gemini", "gemini-2.0-flash") as usage:
+                response = genai_client.models.generate_content(
+                    model="gemini-2.0-flash",
+                    contents=[prompt_text, image]
+                )
+                usage.from_gemini(response)
 
             generated_caption = response.text.strip()
             # Remove unwanted phrase
@@ -892,6 +1010,9 @@ class GeminiCaptionAPIView(APIView):
             image_caption = ImageCaptionGeminiDB.objects.create(
                 image=image_path,
                 caption=final_caption + "  " + "#projectW" + " " + "#project_w",
+                input_cost=usage.input_cost,
+                output_cost=usage.output_cost,
+                total_cost=usage.total_cost,
             )
 
             print(image_caption,"-----------TotalData")
@@ -915,26 +1036,17 @@ class Gemini_OverallCostAPIView(APIView):
 
     def get(self, request, *args, **kwargs):
         try:
-            # Get the current month and year
+            # Current month total, read from the monthly cost rollup
             now = timezone.now()
-            current_year = now.year
-            current_month = now.month
-
-            # Filter data for the current month and year
-            current_month_cost = (
-                ImageCaptionGeminiDB.objects
-                .filter(created_at__year=current_year, created_at__month=current_month)
-                .aggregate(total_cost=Sum('total_cost'))
-            )
-
-            # Extract the total cost, handling None case
-            total_cost = current_month_cost['total_cost'] or 0.0
+            today = timezone.localdate(now)
+            total_cost, _count = ledger_total_cost("gemini", month_start(today), month_end(today))
 
             # Prepare the response data
             response_data = {
                 "status": "success",
                 "month": now.strftime("%B %Y"),  # Format: "September 2024"
-                "total_cost": f"${round(total_cost,4)}"
+                "total_cost": f"${round(total_cost,4)}",
+                "image_cache": image_cache.stats("gemini", month_start(today), month_end(today)),
             }
 
             return Response(response_data, status=status.HTTP_200_OK)
@@ -945,188 +1057,36 @@ class Gemini_OverallCostAPIView(APIView):
 
 ####Specific date range04oct :
 from django.utils.dateparse import parse_date
-from django.utils.timezone import make_aware, get_current_timezone
-class Gemini_daterangeCostAPI(APIView):
+class CostDateRangeAPI(APIView):
     """
-    API to calculate the overall cost of generated captions within a given date range.
-    """
-    def get(self, request, *args, **kwargs):
-        try:
-            # Get query parameters for start_date and end_date
-            start_date_str = request.query_params.get('start_date')
-            end_date_str = request.query_params.get('end_date')
-
-            # Get the current date if no dates are provided
-            now = timezone.now()
-            current_year = now.year
-            current_month = now.month
-
-            # Parse the date strings into actual dates
-            if start_date_str:
-                start_date = parse_date(start_date_str)
-                # Convert to datetime and make timezone-aware
-                start_date = datetime.combine(start_date, datetime.min.time())  # Convert date to datetime (00:00:00)
-                start_date = make_aware(start_date, timezone=get_current_timezone())
-            else:
-                # Default to the first day of the current month if start_date is not provided
-                start_date = make_aware(
-                    datetime(current_year, current_month, 1),
-                    timezone=get_current_timezone()
-                )
-
-            if end_date_str:
-                end_date = parse_date(end_date_str)
-                # Convert to datetime and make timezone-aware
-                end_date = datetime.combine(end_date, datetime.max.time())  # Convert date to datetime (23:59:59)
-                end_date = make_aware(end_date, timezone=get_current_timezone())
-            else:
-                # Default to the current date if end_date is not provided
-                end_date = now
-
-            # Validate date order
-            if start_date > end_date:
-                return Response(
-                    {"error": "start_date cannot be greater than end_date."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # Filter data for the given date range
-            cost_data = (
-                ImageCaptionGeminiDB.objects
-                .filter(created_at__range=[start_date, end_date])
-                .aggregate(total_cost=Sum('total_cost'))
-            )
-
-            # Extract the total cost, handle the case where no data is found
-            total_cost = cost_data['total_cost'] or 0.0
-
-
-            # Prepare the response data
-            response_data = {
-                "status": "success",
-                "service_name": "Gemini_service",
-                "total_cost": f"${total_cost:.4f}"
-            }
+    API to calculate the cost of one provider within a given date range.
 
-            return Response(response_data, status=status.HTTP_200_OK)
-
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-##with months and years
-class OpenAI_daterangeCostAPI(APIView):
-    """
-    API to calculate the overall cost of generated captions within a given date range.
+    Query params: provider (openai, gemini, stability), start_date, end_date
+    (YYYY-MM-DD, inclusive) and optional user_email. The provider can also be
+    fixed per route through ``as_view(provider=...)``. Totals come from the
+    daily/monthly cost rollups, so the work done is O(days), not O(requests).
     """
+    provider = None
+
     def get(self, request, *args, **kwargs):
         try:
-            # Get query parameters for start_date and end_date
-            start_date_str = request.query_params.get('start_date')
-            end_date_str = request.query_params.get('end_date')
-
-            # Get the current date if no dates are provided
-            now = timezone.now()
-            current_year = now.year
-            current_month = now.month
-
-            # Parse the date strings into actual dates
-            if start_date_str:
-                start_date = parse_date(start_date_str)
-                # Convert to datetime and make timezone-aware
-                start_date = datetime.combine(start_date, datetime.min.time())  # Convert date to datetime (00:00:00)
-                start_date = make_aware(start_date, timezone=get_current_timezone())
-            else:
-                # Default to the first day of the current month if start_date is not provided
-                start_date = make_aware(
-                    datetime(current_year, current_month, 1),
-                    timezone=get_current_timezone()
-                )
-
-            if end_date_str:
-                end_date = parse_date(end_date_str)
-                # Convert to datetime and make timezone-aware
-                end_date = datetime.combine(end_date, datetime.max.time())  # Convert date to datetime (23:59:59)
-                end_date = make_aware(end_date, timezone=get_current_timezone())
-            else:
-                # Default to the current date if end_date is not provided
-                end_date = now
-
-            # Validate date order
-            if start_date > end_date:
+            provider = self.provider or request.query_params.get("provider")
+            if provider not in SERVICE_NAMES:
                 return Response(
-                    {"error": "start_date cannot be greater than end_date."},
+                    {"error": f"provider must be one of: {', '.join(sorted(SERVICE_NAMES))}."},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Filter data for the given date range
-            cost_data = (
-                AIResponse.objects
-                .filter(created_at__range=[start_date, end_date])
-                .aggregate(total_cost=Sum('total_cost'))
-            )
-
-            # Extract the total cost, handle the case where no data is found
-            total_cost = cost_data['total_cost'] or 0.0
-
-            # Extract the month and year from start_date and end_date
-            start_month = start_date.strftime('%B')  # Full month name, e.g., "January"
-            start_year = start_date.year
-            end_month = end_date.strftime('%B')
-            end_year = end_date.year
-
-            # Prepare the response data
-            response_data = {
-                "status": "success",
-                "service_name": "OpenAI_service",
-                "total_cost": f"${total_cost:.4f}",
-                "start_month": start_month,
-                "start_year": start_year,
-                "end_month": end_month,
-                "end_year": end_year
-            }
-
-            return Response(response_data, status=status.HTTP_200_OK)
-
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-###end
-class SD_daterangeCostAPI(APIView):
-    """
-    API to calculate the overall cost of generated captions within a given date range.
-    """
-    def get(self, request, *args, **kwargs):
-        try:
-            # Get query parameters for start_date and end_date
             start_date_str = request.query_params.get('start_date')
             end_date_str = request.query_params.get('end_date')
+            user_email = request.query_params.get('user_email')
 
-            # Get the current date if no dates are provided
-            now = timezone.now()
-            current_year = now.year
-            current_month = now.month
-
-            # Parse the date strings into actual dates
-            if start_date_str:
-                start_date = parse_date(start_date_str)
-                # Convert to datetime and make timezone-aware
-                start_date = datetime.combine(start_date, datetime.min.time())  # Convert date to datetime (00:00:00)
-                start_date = make_aware(start_date, timezone=get_current_timezone())
-            else:
-                # Default to the first day of the current month if start_date is not provided
-                start_date = make_aware(
-                    datetime(current_year, current_month, 1),
-                    timezone=get_current_timezone()
-                )
-
-            if end_date_str:
-                end_date = parse_date(end_date_str)
-                # Convert to datetime and make timezone-aware
-                end_date = datetime.combine(end_date, datetime.max.time())  # Convert date to datetime (23:59:59)
-                end_date = make_aware(end_date, timezone=get_current_timezone())
-            else:
-                # Default to the current date if end_date is not provided
-                end_date = now
+            # Default to the first day of the current month up to today
+            today = timezone.localdate()
+            start_date = parse_date(start_date_str) if start_date_str else month_start(today)
+            end_date = parse_date(end_date_str) if end_date_str else today
+            if not start_date or not end_date:
+                return Response({"error": "Dates must use the YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
 
             # Validate date order
             if start_date > end_date:
@@ -1135,23 +1095,19 @@ class SD_daterangeCostAPI(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Filter data for the given date range
-            cost_data = (
-                ImageGenerationSD_DB.objects
-                .filter(created_at__range=[start_date, end_date])
-                .aggregate(total_cost=Sum('total_cost_in_dollar'))
-            )
-
-            print(cost_data,"00000000000")
-            # Extract the total cost, handle the case where no data is found
-            total_cost = cost_data['total_cost'] or 0.0
+            total_cost, request_count = ledger_total_cost(provider, start_date, end_date, user_email=user_email)
 
-            print(total_cost,"-------------total cost")
-            # Prepare the response data
             response_data = {
                 "status": "success",
-                "service_name": "StabilityAI_service",
-                "total_cost": f"${total_cost:.4f}"
+                "service_name": SERVICE_NAMES[provider],
+                "provider": provider,
+                "total_cost": f"${total_cost:.4f}",
+                "request_count": request_count,
+                "start_month": start_date.strftime('%B'),  # Full month name, e.g., "January"
+                "start_year": start_date.year,
+                "end_month": end_date.strftime('%B'),
+                "end_year": end_date.year,
+                "image_cache": image_cache.stats(provider, start_date, end_date),
             }
 
             return Response(response_data, status=status.HTTP_200_OK)
@@ -1165,36 +1121,17 @@ class UserBasedProfileAPI(APIView):
     def post(self, request, *args, **kwargs):
         # Get user input data
         # name = request.data.get("name", "User")
-        age_group = request.data.get("age_group", "Gen Z")
-        favorite_topics = request.data.get("favorite_topics", "travel")
-        platform = request.data.get("platform", "Instagram")
+        # age_group / favorite_topics / platform, defaulting to Gen Z / travel / Instagram
+        params = content_pool.request_params("profile", request.data)
 
         # Prompt to send to OpenAI model
-
-        base_prompt = (
-
-            f"Create a personalized, engaging, and visually appealing social media post for a {age_group} "
-            f"user who is passionate about {favorite_topics}. The post should feel authentic and resonate "
-            f"with their personality, capturing attention on {platform}. Use a catchy caption, relevant emojis, "
-            f"and trending hashtags that fit their interests, and end with a call to action that sparks interaction."
-        )
+        base_prompt = content_pool.build_prompt("profile", params)
         try:
-            # Generate response using OpenAI
-            response = client_open.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system",
-                     "content": "You are a highly skilled AI persona Agent Called ProjectW Agent, reply based on user sentiment in complete sentences."},
-                    {"role": "user", "content": base_prompt}
-                ],
-                max_tokens=1024
-            )
-
-            # Get the content generated by OpenAI
-            generated_text = response.choices[0].message.content.strip()
+            # Served from the pre-generated pool; GPT-4 is only called inline when it's empty
+            generated_text, precomputed = content_pool.serve("profile", params)
 
             # Return the response with the generated text
-            return Response({"categorised_prompt":base_prompt,"categorised_generated_content": generated_text}, status=status.HTTP_200_OK)
+            return Response({"categorised_prompt":base_prompt,"categorised_generated_content": generated_text,"precomputed": precomputed}, status=status.HTTP_200_OK)
 
         except Exception as e:
             # Handle errors and return response
@@ -1209,33 +1146,16 @@ class Pw_BroadcastAgentAPI(APIView):
     def post(self, request, *args, **kwargs):
         # Get user input data
 
-        favorite_topics = request.data.get("favorite_topics", "travel")
+        params = content_pool.request_params("broadcast", request.data)  # favorite_topics, default travel
 
         # Prompt to send to OpenAI model
-        base_prompt = (
-
-            f"Create a personalized, engaging, and visually appealing social media post for a user who is passionate about {favorite_topics}. "
-            f"The post should feel authentic and resonate with their personality. Use a catchy caption, relevant emojis, and trending hashtags "
-            f"that fit their interests, and end with a call to action that sparks interaction."
-        )
+        base_prompt = content_pool.build_prompt("broadcast", params)
         try:
-            # Generate response using OpenAI
-            response = client_open.chat.completions.create(
-                model="gpt-4",
-
-                messages=[
-                    {"role": "system",
-                     "content": "You are a highly skilled AI persona Agent Called PW_Broadcast Agent, reply based on user sentiment in complete sentences."},
-                    {"role": "user", "content": base_prompt}
-                ],
-                max_tokens=1024
-            )
-
-            # Get the content generated by OpenAI
-            generated_text = response.choices[0].message.content.strip()
+            # Served from the pre-generated pool; GPT-4 is only called inline when it's empty
+            generated_text, precomputed = content_pool.serve("broadcast", params)
 
             # Return the response with the generated text
-            return Response({"categorised_prompt":base_prompt,"Broadcast_generated_content": generated_text}, status=status.HTTP_200_OK)
+            return Response({"categorised_prompt":base_prompt,"Broadcast_generated_content": generated_text,"precomputed": precomputed}, status=status.HTTP_200_OK)
 
         except Exception as e:
             # Handle errors and return response
@@ -1280,13 +1200,14 @@ class Swedish_AudioTranscriptionAPIView(APIView):
             audio_chunk.export(chunk_filename, format="mp3")
 
             # Transcribe the chunk
-            with open(chunk_filename, "rb") as audio_file:
+            with open(chunk_filename, "rb") as audio_file, meter("openai", "whisper-1") as usage:
                 response = client_open.audio.transcriptions.create(
                     model="whisper-1",
                     file=audio_file,
                     language="en",  # Adjust language as needed
                     response_format="text"
                 )
+                usage.add(audio_seconds=len(audio_chunk) / 1000)
                 transcription_text += response + " "  # Append the transcription of each chunk
 
             # Clean up the temporary file
@@ -1333,6 +1254,9 @@ class HuggingFaceChatAPI(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+from django.urls import reverse
+from .models import RunwayTask
+from . import runway_poller
 class VideoGenerationAPIViewRun(APIView):
     def post(self, request):
         # Extract inputs from the request
@@ -1355,7 +1279,7 @@ class VideoGenerationAPIViewRun(APIView):
                 recognizer = sr.Recognizer()
                 with sr.AudioFile(audio_file) as source:
                     audio_data = recognizer.record(source)
-                    prompt_text = recognizer.recognize_google(audio_data)
+                    prompt_text = provider_endpoints.recognize_google(recognizer, audio_data)
             except Exception as e:
                 return Response(
                     {"error": f"Failed to process base64 voice input: {str(e)}"},
@@ -1369,67 +1293,63 @@ class VideoGenerationAPIViewRun(APIView):
             )
 
         try:
-            # Initialize the RunwayML client
-            client = RunwayML(api_key=RUNWAYML_API_SECRET)
-            print(client,"===========client")
-            # Decide the task type based on inputs
-            if prompt_image:
-                task = client.image_to_video.create(
-                    model="gen3a_turbo",
-                    prompt_image=prompt_image,
-                    prompt_text=prompt_text,
-                    duration=5,
-                )
-            else:
-                task = client.image_to_video.create(
-                    model="gen3a_turbo",
-                    # model="gen3a",
-                    prompt_text=prompt_text,
-                    prompt_image=prompt_image,
-                    duration=5
-                )
+            # Runway generations take minutes: register the task with the shared
+            # poller and let the client follow it on runway_video/<task_id>.
+            task = runway_poller.submit_task(
+                prompt_text=prompt_text,
+                prompt_image=prompt_image,
+                user_email=request.data.get("user_email", ""),
+                user_reference_number=request.data.get("user_reference_number", ""),
+            )
+            return Response(
+                {
+                    "status": task.status,
+                    "task_id": task.task_id,
+                    "status_url": request.build_absolute_uri(reverse("runway_video_status", args=[task.task_id])),
+                },
+                status=status.HTTP_202_ACCEPTED,
+            )
 
-            # Poll the task until it's complete
-            time.sleep(10)  # Initial wait
-            task = client.tasks.retrieve(task.id)
-            while task.status not in ["SUCCEEDED", "FAILED"]:
-                time.sleep(10)  # Wait for ten seconds before polling
-                task = client.tasks.retrieve(task.id)
-                print(type(task),"------------data type")
-                task_str=str(task)
+        except Exception as e:
+            # Handle any errors from the RunwayML client
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-                print(task_str, type(task_str),"----------task id")
 
-            # # Check the final status of the task
-            if task.status == "SUCCEEDED":
-            #     task_data=client.tasks.retrieve(id=task_str)
-                return Response(
-                    {
-                        "status": "SUCCEEDED",
-                        "video_url" :task.output,
+class RunwayTaskStatusAPI(APIView):
+    """
+    Job status for a Runway generation submitted through runway_video.
+    """
 
-                    },
-                    status=status.HTTP_200_OK,
-                )
-            else:
-                return Response(
-                    {"status": "FAILED",
-                     "failure": "The provided image was flagged by content moderation.",
-                     "failureCode": "SAFETY.INPUT.IMAGE",
-                     },status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                )
+    def get(self, request, task_id):
+        task = RunwayTask.objects.filter(task_id=task_id).first()
+        if task is None:
+            return Response({"error": "Task not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        except Exception as e:
-            # Handle any errors from the RunwayML client
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if task.status in RunwayTask.ACTIVE_STATUSES:
+            # Picks the task up after a restart of the process that submitted it.
+            runway_poller.poller.start()
+            return Response({"status": task.status, "task_id": task.task_id, "progress": task.progress},
+                            status=status.HTTP_200_OK)
+
+        if task.status == RunwayTask.STATUS_SUCCEEDED:
+            return Response({"status": "SUCCEEDED", "task_id": task.task_id, "video_url": task.output},
+                            status=status.HTTP_200_OK)
+
+        return Response(
+            {"status": task.status,
+             "task_id": task.task_id,
+             "failure": task.failure,
+             "failureCode": task.failure_code,
+             }, status=status.HTTP_200_OK,
+        )
 
 
 ####ModelLAb platform 26 only txt to image
 
 import requests
-import json
 from.models import VideoDB
-modellab_key=os.getenv("MODELSLAB_API_KEY", "")
+from . import modelslab_video
+from .modelslab_video import ModelsLabError
 class VideoGenerationAPIView(APIView):
     """
     APIView for generating a video using a text prompt by calling an external API.
@@ -1462,9 +1382,8 @@ class VideoGenerationAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Prepare the API request payload
+        # Prepare the API request payload (key, webhook and track_id are set by modelslab_video)
         payload = {
-            "key": modellab_key,  # Ensure API key is set in the environment variables
             "model_id": "cogvideox",
             "prompt": prompt,
             "negative_prompt": negative_prompt,
@@ -1483,37 +1402,17 @@ class VideoGenerationAPIView(APIView):
             "track_id": track_id
         }
 
-        headers = {
-            'Content-Type': 'application/json'
-        }
-
         try:
-            # Call the external video generation API
-            url = "https://modelslab.com/api/v6/video/text2video"
-            response = requests.post(url, headers=headers, data=json.dumps(payload))
-
-            # Handle the API response
-            if response.status_code == 200:
-                response_data = response.json()
-                video_url = response_data.get("future_links")  # Assume the API returns a video URL
-
-
-                # Save prompt and video URL to the database
-                VideoDB.objects.create(
-                    user_reference_number=user_reference_number,
-                    user_email=user_email,
-                    prompt=prompt,
-                    video_url=video_url[0]
-                )
+            # Start the job; the webhook / resolver fill in the final video later
+            response_data, video = modelslab_video.submit_video(
+                "text2video", payload, request,
+                user_email=user_email, user_reference_number=user_reference_number, prompt=prompt,
+            )
+            response_data["status_url"] = request.build_absolute_uri(reverse("modellab_video_status", args=[video.id]))
+            return Response(response_data, status=status.HTTP_200_OK)
 
-                return Response(response_data, status=status.HTTP_200_OK)
-
-                # return Response(response.json(), status=status.HTTP_200_OK)
-            else:
-                return Response(
-                    {"error": "Failed to generate video", "details": response.json()},
-                    status=response.status_code
-                )
+        except ModelsLabError as e:
+            return Response({"error": "Failed to generate video", "details": e.details}, status=e.status_code)
 
         except Exception as e:
             # Handle any unexpected errors
@@ -1567,8 +1466,6 @@ class ImageToVideoGenerationAPIModel(APIView):
 
             # Prepare payload for API call
             payload = {
-                # "key": os.getenv("MODELLAB_API_KEY"),
-                "key": modellab_key,
                 "model_id": "cogvideox",
                 "init_image": image_full_path,
                 "prompt": image_prompt,
@@ -1585,35 +1482,15 @@ class ImageToVideoGenerationAPIModel(APIView):
                 "track_id": track_id,
             }
 
-            headers = {"Content-Type": "application/json"}
-            url = "https://modelslab.com/api/v6/video/img2video"
-            response = requests.post(url, headers=headers, data=json.dumps(payload))
+            response_data, video = modelslab_video.submit_video(
+                "img2video", payload, request,
+                user_email=user_email, user_reference_number=user_reference_number, prompt=image_full_path,
+            )
+            response_data["status_url"] = request.build_absolute_uri(reverse("modellab_video_status", args=[video.id]))
+            return Response(response_data, status=status.HTTP_200_OK)
 
-            print(response,"==========response============")
-            if response.status_code == 200:
-                response_data = response.json()
-                print(response_data,"=============response data")
-                video_url = response_data.get("future_links")  # Assume the API returns a video URL
-                print(video_url,"==========video url==========")
-                # Save prompt and video URL to the database
-                VideoDB.objects.create(
-                    user_reference_number = user_reference_number,
-                    user_email = user_email,
-                    prompt=image_full_path,
-                    video_url=video_url[0]
-                )
-
-                return Response(response_data, status=status.HTTP_200_OK)
-                # return Response(response.json(), status=status.HTTP_200_OK)
-            else:
-                try:
-                    error_details = response.json()
-                except ValueError:
-                    error_details = response.text
-                return Response(
-                    {"error": "Failed to generate video", "details": error_details},
-                    status=response.status_code
-                )
+        except ModelsLabError as e:
+            return Response({"error": "Failed to generate video", "details": e.details}, status=e.status_code)
 
         except Exception as e:
             logger.error(f"Unexpected error: {str(e)}")
@@ -1654,23 +1531,25 @@ class VoiceCommandVideoModelLabAPI(APIView):
         track_id = request.data.get("track_id", None)
 
         # Validate required fields
+        metering.bind(user_email=user_email, user_reference_number=user_reference_number)
         try:
 
-            transcript_text = client_open.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_stream,
-                language="en",
-                response_format="text"
-            )
+            with meter("openai", "whisper-1") as usage:
+                transcription = client_open.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=audio_stream,
+                    language="en",
+                    response_format="verbose_json"
+                )
+                usage.add(audio_seconds=getattr(transcription, "duration", 0))
+            transcript_text = transcription.text
 
-            print(transcript_text,"-------------transcript")
             if not transcript_text:
                 return Response({"error": "Could not transcribe audio"}, status=400)
 
                 # Prepare the payload for the API request
                 # Prepare the API request payload
             payload = {
-                    "key": modellab_key,  # Ensure API key is set in the environment variables
                     "model_id": "cogvideox",
                     "prompt": transcript_text,
                     "negative_prompt": negative_prompt,
@@ -1689,37 +1568,16 @@ class VoiceCommandVideoModelLabAPI(APIView):
                     "track_id": track_id
                 }
 
-            headers = {
-                    'Content-Type': 'application/json'
-                }
-
             try:
-                # Call the external video generation API
-                url = "https://modelslab.com/api/v6/video/text2video"
-                response = requests.post(url, headers=headers, data=json.dumps(payload))
+                response_data, video = modelslab_video.submit_video(
+                    "text2video", payload, request,
+                    user_email=user_email, user_reference_number=user_reference_number, prompt=base64_audio,
+                )
+                response_data["status_url"] = request.build_absolute_uri(reverse("modellab_video_status", args=[video.id]))
+                return Response(response_data, status=status.HTTP_200_OK)
 
-                print(response,"---response")
-                # Handle the API response
-                if response.status_code == 200:
-                    response_data = response.json()
-                    video_url = response_data.get("future_links")  # Assume the API returns a video URL
-
-                    print(video_url,"---------video url")
-                    # Save prompt and video URL to the database
-                    VideoDB.objects.create(
-                        user_reference_number = user_reference_number,
-                        user_email = user_email,
-                        prompt=base64_audio,
-                        video_url=video_url[0]
-                    )
-
-                    return Response(response_data, status=status.HTTP_200_OK)
-                    # return Response(response.json(), status=status.HTTP_200_OK)
-                else:
-                    return Response(
-                        {"error": "Failed to generate video", "details": response.json()},
-                        status=response.status_code
-                    )
+            except ModelsLabError as e:
+                return Response({"error": "Failed to generate video", "details": e.details}, status=e.status_code)
 
             except Exception as e:
                 # Handle any unexpected errors
@@ -1733,22 +1591,90 @@ class VoiceCommandVideoModelLabAPI(APIView):
             pass
 
 
+class ModelsLabWebhookAPI(APIView):
+    """
+    Receives ModelsLab's completion callback for the jobs started above.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        # The token is an HMAC of our own track id, so it can't be guessed from a job number
+        track_id = request.query_params.get("track_id")
+        if not modelslab_video.verify_webhook(track_id, request.query_params.get("token")):
+            return Response({"error": "Invalid webhook token"}, status=status.HTTP_403_FORBIDDEN)
+
+        video = VideoDB.objects.filter(track_id=track_id).first()
+        if video is None:
+            return Response({"error": "Unknown job"}, status=status.HTTP_404_NOT_FOUND)
+
+        if video.status == modelslab_video.STATUS_PROCESSING:
+            modelslab_video.resolve(video, request.data)
+        return Response({"status": "received"}, status=status.HTTP_200_OK)
+
+
+class ModelsLabVideoStatusAPI(APIView):
+    """
+    Job status for a ModelsLab video; playback_url prefers our mirrored copy.
+    """
+
+    def get(self, request, video_id):
+        video = VideoDB.objects.filter(pk=video_id).first()
+        if video is None:
+            return Response({"error": "Video not found"}, status=status.HTTP_404_NOT_FOUND)
+        if video.status == modelslab_video.STATUS_PROCESSING:
+            modelslab_video.resolver.start()  # Resumes tracking after a restart
+        return Response(modelslab_video.client_payload(video, request), status=status.HTTP_200_OK)
+
+
 ####new for image thumbnail
 
 from .models import UserLocation
 import uuid
 # Image generation by user prompt using DALL-E
 def dall_e_image_generate(prompt):
-    response = client_open.images.generate(
-        model="dall-e-3",
-        prompt=prompt,
-        size="1024x1024",
-        quality="standard",
-        # quality="hd",
-        n=1,
-    )
+    with meter("openai", "dall-e-3") as usage:
+        response = client_open.images.generate(
+            model="dall-e-3",
+            prompt=prompt,
+            size="1024x1024",
+            quality="standard",
+            # quality="hd",
+            n=1,
+        )
+        usage.add(image_units=len(response.data))
     # print(response.data[0].url,"-----##############--------response.data[0].url")
     return response.data[0].url
+def generate_notification_thumbnail(reference_number, address, base_url):
+    """
+    Second phase of the notification pipeline: generate the DALL-E image,
+    store it with a thumbnail-sized rendition in the media store and attach
+    the thumbnail to the UserLocation row. Runs on the background pool so the
+    text notification is never held up.
+    """
+    try:
+        thumbnail_prompt = f"Create a visually appealing thumbnail image based on the location {address}. Highlight nearby attractions, activities, or notable places in a design that is engaging, compact, and suitable for a thumbnail format."
+        image_url = dall_e_image_generate(thumbnail_prompt)
+        with requests.get(image_url, stream=True, timeout=60) as image_response:
+            image_response.raise_for_status()
+            image_response.raw.decode_content = True
+            stored = media_store.put_stream(
+                image_response.raw,
+                image_response.headers.get("Content-Type", "image/png"),
+                prefix="ImageUpload",
+            )
+        # Already off the request thread, so render the thumbnail before marking it ready.
+        media_store.make_renditions(stored.key)
+        thumbnail = media_store.get_backend().url(media_store.rendition_key(stored.key, media_store.RENDITION_WIDTHS[0]))
+        UserLocation.objects.filter(reference_number=reference_number).update(
+            thumbnail_url=media_store.absolute_url(thumbnail, base_url),
+            thumbnail_status="ready",
+        )
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", reference_number)
+        UserLocation.objects.filter(reference_number=reference_number).update(thumbnail_status="failed")
+
+
 class Notification_LocationAPI(APIView):
     def post(self, request):
         try:
@@ -1767,7 +1693,7 @@ class Notification_LocationAPI(APIView):
 
             # Step 2: Reverse geocoding to get address
             geocode_url = (
-                f"https://maps.googleapis.com/maps/api/geocode/json?latlng={lat},{lng}&key={api_key}"
+                f"{provider_endpoints.GOOGLE_MAPS_BASE_URL}/maps/api/geocode/json?latlng={lat},{lng}&key={api_key}"
             )
             geocode_response = requests.get(geocode_url)
             geocode_data = geocode_response.json()
@@ -1782,45 +1708,23 @@ class Notification_LocationAPI(APIView):
                 f"A user is currently at '{address}'. Create an engaging notification suggesting nearby places "
                 f"or activities based on the location."
             )
-            ###new for image url
-            thumbnail_prompt = f"Create a visually appealing thumbnail image based on the location {address}. Highlight nearby attractions, activities, or notable places in a design that is engaging, compact, and suitable for a thumbnail format."
-            image_url=dall_e_image_generate(thumbnail_prompt)
-            # print(image_url,"------------noti final image ")
-            # running good before
-            response = client_open.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": "You are a creative notification generator for a travel app."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1020,
-                temperature=0.5,
-            )
+            with meter("openai", "gpt-4") as usage:
+                response = client_open.chat.completions.create(
+                    model="gpt-4",
+                    messages=[
+                        {"role": "system", "content": "You are a creative notification generator for a travel app."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=1020,
+                    temperature=0.5,
+                )
+                usage.from_openai(response)
 
             notification_content = response.choices[0].message.content.strip()
-            print(notification_content,"-----------TTTTTTTT")
-            ####end
-            image_data = requests.get(image_url).content
-
-            # print(image_data,"-------data image++++++++++++")
-
-            file_uuid = str(uuid.uuid4()) + ".jpg"
-            folder_path = os.path.join(settings.MEDIA_ROOT, 'ImageUpload')
-            print(folder_path, "---folderpath")
-            if not os.path.exists(folder_path):
-                os.makedirs(folder_path)
 
-            file_path = os.path.join(folder_path, file_uuid)
-            with open(file_path, "wb") as buffer:
-                buffer.write(image_data)
-
-            final_path = os.path.normpath(f"{file_path.replace(settings.MEDIA_ROOT, settings.MEDIA_URL)}")
-            new_imageLink = f"{baseurl(request)}{final_path}"
-            # print(new_imageLink, "----------sadsssssssimageeeeeeee")
             # Step 4: Save data to database
             UserLocation.objects.get_or_create(
                 reference_number=reference_number,  # Match unique reference_number
-                # print(reference_number,"-----------------"),
                 defaults={
                     "lat": lat,
                     "lng": lng,
@@ -1828,61 +1732,99 @@ class Notification_LocationAPI(APIView):
                     "updated_at": request.data.get("updated_at", None),  # Optional timestamp
                 }
             )
+            UserLocation.objects.filter(reference_number=reference_number).update(
+                thumbnail_url=None,
+                thumbnail_status="pending",
+            )
+
+            # Step 5: Thumbnail is generated in the background and attached to
+            # UserLocation once ready; clients poll notification_thumbnail for it.
+            run_in_background(generate_notification_thumbnail, reference_number, address, baseurl(request))
 
-            # Step 5: Return the generated content
             return Response(
-                {"reference_number": reference_number,"title": address, "message": notification_content,"image_url":new_imageLink},
+                {"reference_number": reference_number,"title": address, "message": notification_content,
+                 "image_url": None, "image_status": "pending"},
                 status=status.HTTP_200_OK
             )
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+
+class NotificationThumbnailAPI(APIView):
+    """
+    Poll endpoint for the thumbnail generated by Notification_LocationAPI.
+    """
+    def get(self, request):
+        reference_number = request.query_params.get("reference_number")
+        if not reference_number:
+            return Response({"error": "reference_number is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        location = UserLocation.objects.filter(reference_number=reference_number).only(
+            "reference_number", "thumbnail_url", "thumbnail_status"
+        ).first()
+        if not location:
+            return Response({"error": "Notification not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            "reference_number": reference_number,
+            "image_status": location.thumbnail_status,
+            "image_url": location.thumbnail_url,
+        }, status=status.HTTP_200_OK)
+
 ##############end####
 #
-import re
 ####05022025 donwload jsonl
+from django.db.models import Max
+from .data_pipeline import CleaningPipeline, build_rules, iter_cleaned_rows, iter_jsonl, EXPORT_CHUNK_SIZE
 class CleanDataPipelineAPI(APIView):
+    """
+    Streams cleaned AIResponse texts as a JSONL download.
+
+    Query params:
+      since      - only export rows with id greater than this watermark
+      gzip       - "true" to gzip the stream
+      chunk_size - rows fetched per DB round trip
+      rules      - comma separated extra cleaning rules: pii, lang, length
+      near_dedup - "true" to drop near-duplicates (MinHash)
+      workers    - number of cleaning processes
+    The response carries X-Export-Watermark, the highest id included, which
+    the caller passes back as ``since`` for the next incremental export.
+    """
     def get(self, request, *args, **kwargs):
-        # Step 1: Extract data from the model
-        data = AIResponse.objects.values_list('response_text', flat=True)
-        cleaned_data = self.clean_data(list(data))
-
-        # Ensure directory exists
-        file_directory = os.path.join(settings.MEDIA_ROOT, "cleaned_files")
-        os.makedirs(file_directory, exist_ok=True)  # Create the directory if it doesn't exist
-
-        # Define file path
-        file_path = os.path.join(file_directory, "cleaned_data.jsonl")
-
-        # Step 2: Save to JSONL file
-        with open(file_path, "w", encoding="utf-8") as f:
-            for item in cleaned_data:
-                f.write(json.dumps({"cleaned_text": item}) + "\n")
-
-        # Step 3: Return the JSONL file as a downloadable response
-        with open(file_path, "rb") as f:
-            response = HttpResponse(f.read(), content_type="application/jsonl")
-            response["Content-Disposition"] = 'attachment; filename="cleaned_data.jsonl"'
-            return response
-###gs://areax-plm-bucket
-    def clean_data(self, data_list):
-        """
-        Cleans a list of strings by removing special characters and redundant data.
-        """
-        cleaned_list = []
-        seen = set()  # To keep track of redundant entries
-
-        for item in data_list:
-            cleaned_item = re.sub(r'[^\w\s]', '', item)  # Remove special characters
-            cleaned_item = " ".join(cleaned_item.split())  # Remove extra spaces
-
-            # Check for redundancy
-            if cleaned_item not in seen:
-                seen.add(cleaned_item)
-                cleaned_list.append(cleaned_item)
-
-        return cleaned_list
+        try:
+            since = int(request.query_params.get("since", 0))
+            chunk_size = int(request.query_params.get("chunk_size", EXPORT_CHUNK_SIZE))
+            workers = int(request.query_params.get("workers", 1))
+            if chunk_size < 1 or workers < 1:
+                raise ValueError
+        except ValueError:
+            return Response({"error": "'since', 'chunk_size' and 'workers' must be integers, 'chunk_size' and 'workers' at least 1."},
+                            status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get("gzip", "").lower() in ("1", "true", "yes")
+        rule_names = [name.strip() for name in request.query_params.get("rules", "").split(",") if name.strip()]
+        try:
+            pipeline = CleaningPipeline(
+                rules=build_rules(rule_names),
+                near_dedup=request.query_params.get("near_dedup", "").lower() in ("1", "true", "yes"),
+                workers=min(workers, os.cpu_count() or 1),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Pin the upper bound up front so the watermark matches what is streamed
+        # even while new rows keep arriving.
+        watermark = AIResponse.objects.filter(id__gt=since).aggregate(max_id=Max("id"))["max_id"] or since
+        queryset = AIResponse.objects.filter(id__gt=since, id__lte=watermark).order_by("id")
+
+        filename = "cleaned_data.jsonl.gz" if compress else "cleaned_data.jsonl"
+        response = StreamingHttpResponse(
+            iter_jsonl(iter_cleaned_rows(queryset, pipeline, chunk_size=chunk_size), compress=compress),
+            content_type="application/gzip" if compress else "application/jsonl",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        response["X-Export-Watermark"] = str(watermark)
+        return response
 
 
 class ChatRetrieveAPIView(APIView):
@@ -2073,16 +2015,19 @@ class Mob_LocationAPI(APIView):
                 "The notification should sound enthusiastic, inspiring, and informative, as if you're inviting them to explore further."
             )
             # Assuming `client` is an instance of OpenAI's API client, make sure it's initialized
+            metering.bind(user_email=user_email, user_reference_number=reference_number)
             try:
-                response = client_open.chat.completions.create(
-                    model="gpt-4",
-                    messages=[
-                        {"role": "system", "content": "You are a creative notification generator for a travel app."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=1020,
-                    temperature=0.5,
-                )
+                with meter("openai", "gpt-4") as usage:
+                    response = client_open.chat.completions.create(
+                        model="gpt-4",
+                        messages=[
+                            {"role": "system", "content": "You are a creative notification generator for a travel app."},
+                            {"role": "user", "content": prompt}
+                        ],
+                        max_tokens=1020,
+                        temperature=0.5,
+                    )
+                    usage.from_openai(response)
                 notification_content = response.choices[0].message.content.strip()
             except Exception as e:
                 logger.error(f"Error generating content with OpenAI: {e}")
@@ -2118,7 +2063,6 @@ class Mob_LocationAPI(APIView):
             return Response({"error": "An unexpected error occurred."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 from together import Together
-from django.http import StreamingHttpResponse
 TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 
 class TogetherChatAPIView(APIView):
@@ -2134,14 +2078,16 @@ class TogetherChatAPIView(APIView):
 
         user_message = request.data.get("prompt")
 
-        response = client.chat.completions.create(
-            # model="mistralai/Mixtral-8x7B-Instruct-v0.1",
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
-            # messages=[{"role": "user","content": user_message}],
-            # messages=[{"role": "system", "content": "You are a highly skilled AI persona Agent named is PLM , reply based on user sentiment in complete sentences. And look like replica of userself"},
-            messages=[{"role": "system", "content": "You are PLM, an advanced AI persona agent designed to mirror the user's tone, style, and sentiment. Engage in natural, complete sentences, responding as if you were their digital reflection, ensuring conversations feel seamless and personalized."},
-                    {"role": "user", "content": user_message}],
-        )
+        with meter("together", "meta-llama/Llama-3.3-70B-Instruct-Turbo") as usage:
+            response = client.chat.completions.create(
+                # model="mistralai/Mixtral-8x7B-Instruct-v0.1",
+                model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
+                # messages=[{"role": "user","content": user_message}],
+                # messages=[{"role": "system", "content": "You are a highly skilled AI persona Agent named is PLM , reply based on user sentiment in complete sentences. And look like replica of userself"},
+                messages=[{"role": "system", "content": "You are PLM, an advanced AI persona agent designed to mirror the user's tone, style, and sentiment. Engage in natural, complete sentences, responding as if you were their digital reflection, ensuring conversations feel seamless and personalized."},
+                        {"role": "user", "content": user_message}],
+            )
+            usage.from_openai(response)
 
         print(response.choices[0].message.content,"----------rrrrrrr--------")
         ai_response = response.choices[0].message.content if response.choices else "No response"
@@ -2159,12 +2105,11 @@ class PLM_API(APIView):
         user_reference_number = request.data.get("user_reference_number")
         user_email = request.data.get("user_email")
         message = request.data.get("plm_prompt")
+        metering.bind(user_email=user_email, user_reference_number=user_reference_number)
 
         # If user_id is not provided, create a new user
         if not user_id:
-            user = User.objects.create(username=f"user_{User.objects.count()+1}")
-            user.set_unusable_password()  # Optional: User cannot log in with a password
-            user.save()
+            user = accounts.create_anonymous_user()  # User cannot log in with a password
 
             # Generate a new authentication token for the user
             token, _ = Token.objects.get_or_create(user=user)
@@ -2184,8 +2129,9 @@ class PLM_API(APIView):
         # Get or create the UserPLMProfile object
         user_profile, _ = UserPLMProfile.objects.get_or_create(user=user)
 
-        # Load chat history
-        chat_history = ChatHistory.objects.filter(user=user_profile).order_by('-timestamp')
+        # Load chat history (newest first, including replies still in the write-behind queue)
+        chat_history = write_behind.pending(ChatHistory, user=user_profile)[::-1] + \
+            list(ChatHistory.objects.filter(user=user_profile).order_by('-timestamp'))
 
         # Prepare chat history messages and responses
         previous_messages = [{"role": "user", "content": chat.message} for chat in chat_history]
@@ -2195,7 +2141,8 @@ class PLM_API(APIView):
         conversation_history = previous_messages + previous_responses
 
         # Check if the message exists in the chat history
-        existing_response = ChatHistory.objects.filter(user=user_profile, message=message).first()
+        existing_response = ChatHistory.objects.filter(user=user_profile, message=message).first() or \
+            next(iter(write_behind.pending(ChatHistory, user=user_profile, message=message)), None)
 
         if existing_response:
             return Response({"user_reference_number":user_reference_number,"user_email":user_email,"message": message,"message_response": existing_response.response})
@@ -2204,13 +2151,13 @@ class PLM_API(APIView):
         response = generate_response(message, user_profile.personality_traits)
 
         # Save chat history with additional fields
-        ChatHistory.objects.create(
+        write_behind.enqueue(ChatHistory(
             user=user_profile,
             user_reference_number=user_reference_number,
             user_email=user_email,
             message=message,
             response=response
-        )
+        ))
 
         return Response({"user_reference_number":user_reference_number,"user_email":user_email,"message":message,"message_response": response})
 
@@ -2226,6 +2173,7 @@ class PLM_Voice_API(APIView):
         user_reference_number = request.data.get("user_reference_number", "")
         user_email = request.data.get("user_email", "")
         audio_base64 = request.data.get("audio_base64")
+        metering.bind(user_email=user_email, user_reference_number=user_reference_number)
 
         if not audio_base64:
             return Response({"error": "No audio data provided"}, status=400)
@@ -2256,9 +2204,7 @@ class PLM_Voice_API(APIView):
             ###end
             # Authenticate User (Create if not exists)
             if not user_id:
-                user = User.objects.create(username=f"user_{User.objects.count()+1}")
-                user.set_unusable_password()
-                user.save()
+                user = accounts.create_anonymous_user()
                 token, _ = Token.objects.get_or_create(user=user)
                 return Response({
                     "message": "New user created",
@@ -2277,18 +2223,19 @@ class PLM_Voice_API(APIView):
             user_profile, _ = UserPLMProfile.objects.get_or_create(user=user)
 
             # Check Chat History
-            existing_response = ChatHistory.objects.filter(user=user_profile, message=message).first()
+            existing_response = ChatHistory.objects.filter(user=user_profile, message=message).first() or \
+                next(iter(write_behind.pending(ChatHistory, user=user_profile, message=message)), None)
             if existing_response:
                 response_audio_base64 = text_to_speech(existing_response.response)
 
                 # Save to OpenaAI_UsageDB
-                OpenaAI_UsageDB.objects.create(
+                write_behind.enqueue(OpenaAI_UsageDB(
                     user_reference_number=user_reference_number,
                     user_email=user_email,
                     prompt=audio_base64,
                     response=existing_response.response,
                     audio_base64=response_audio_base64,
-                )
+                ))
 
                 return Response({
                     "user_reference_number": user_reference_number,
@@ -2303,7 +2250,7 @@ class PLM_Voice_API(APIView):
             response_text = generate_response(message, user_profile.personality_traits)
 
             # Save Chat History
-            ChatHistory.objects.create(user=user_profile, message=message, response=response_text)
+            write_behind.enqueue(ChatHistory(user=user_profile, message=message, response=response_text))
 
             # Convert AI Response to Speech
             response_audio_base64 = text_to_speech(response_text)
@@ -2353,70 +2300,81 @@ class ImageGenerationAPIGemini(APIView):
         user_reference_number = request.data.get("user_reference_number")
         user_email = request.data.get("user_email")
         negative_prompt = request.data.get("negative_prompt", "")  # Optional
+        metering.bind(user_email=user_email, user_reference_number=user_reference_number)
 
         if not prompt:
             return Response({"error": "No prompt provided"}, status=400)
 
         try:
-            # Generate images using Gemini API
-            response = genai_client.models.generate_images(
-                model="imagen-3.0-generate-002",
-                prompt=prompt,
-                config=types.GenerateImagesConfig(number_of_images=num_images),
-            )
-
-            # Extract base64 images correctly
-            base64_images = [img.image.image_bytes for img in response.generated_images]
-
-            if not base64_images:
-                return Response({"error": "No valid image data"}, status=500)
-
-            saved_images = []
-
-            for base64_data in base64_images:
-                # Decode base64 to binary
-                image_data = base64.b64decode(base64_data)
-
-                # Generate a unique file name using UUID
-                unique_id = uuid.uuid4()
-                file_name = f"generated_image_{unique_id}.png"  # Save as PNG
+            # Imagen calls (4 images max each) and uploads run in parallel, one bulk insert
+            result = image_generation.generate_batch(
+                [prompt],
+                num_images=int(num_images),
+                negative_prompt=negative_prompt,
+                user_email=user_email,
+                user_reference_number=user_reference_number,
+                base_url=baseurl(request),
+                use_cache=image_cache.wants_cache(request.data),
+            )[0]
 
-                # Define full path for saving
-                file_path = os.path.join(settings.MEDIA_ROOT, file_name)
+            if not result["generated_images"]:
+                return Response({"error": result.get("error", "No valid image data")}, status=500)
 
-                # Save the image to the media directory
-                with open(file_path, "wb") as img_file:
-                    img_file.write(image_data)
+            return Response({
+                "prompt": prompt,
+                "generated_images": result["generated_images"]
+            })
 
-                # Construct the accessible image URL
-                image_url = f"{settings.MEDIA_URL}{file_name}"
-                full_image_url = baseurl(request) + image_url  # Add base URL
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        except Exception as e:
+            return Response({"error": str(e)}, status=500)
 
-                # Save the image entry in the database with the full URL
-                generated_image = GeneratedImage.objects.create(
-                    prompt=prompt,
-                    user_reference_number=user_reference_number,
-                    user_email=user_email,
-                    negative_prompt=negative_prompt,
-                    image=full_image_url,  # Store full URL in the database
-                )
 
-                saved_images.append({
-                    "generated_image_id": generated_image.id,
-                    "user_reference_number": user_reference_number,
-                    "user_email": user_email,
-                    "image": full_image_url, # Return full URL
-                    # "image": base64_images  # Return full URL
-                })
+class BatchImageGenerationAPI(APIView):
+    """
+    Gallery generation: several prompts, each with num_images, from Imagen or
+    FLUX in one round trip. Failures are reported per prompt.
+    """
+    permission_classes = [AllowAny]
 
-            return Response({
-                "prompt": prompt,
-                "generated_images": saved_images
-            })
+    def post(self, request):
+        prompts = request.data.get("prompts") or []
+        provider = request.data.get("provider", "imagen")
+        num_images = request.data.get("num_images", 1)
+        user_reference_number = request.data.get("user_reference_number")
+        user_email = request.data.get("user_email")
+        negative_prompt = request.data.get("negative_prompt", "")
+        metering.bind(user_email=user_email, user_reference_number=user_reference_number)
+
+        if isinstance(prompts, str):
+            prompts = [prompts]
+        if not isinstance(prompts, list) or not all(isinstance(prompt, str) for prompt in prompts):
+            return Response({"error": "'prompts' must be a string or a list of strings."}, status=status.HTTP_400_BAD_REQUEST)
+        prompts = [prompt.strip() for prompt in prompts if prompt.strip()]
+        try:
+            num_images = int(num_images)
+        except (TypeError, ValueError):
+            return Response({"error": "'num_images' must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            results = image_generation.generate_batch(
+                prompts,
+                provider=provider,
+                num_images=num_images,
+                negative_prompt=negative_prompt,
+                user_email=user_email,
+                user_reference_number=user_reference_number,
+                base_url=baseurl(request),
+                use_cache=image_cache.wants_cache(request.data),
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
         except Exception as e:
             return Response({"error": str(e)}, status=500)
 
+        return Response({"provider": provider, "results": results}, status=status.HTTP_200_OK)
+
 
 
 ##############GEMINI VOICECHAT 06march025
@@ -2430,6 +2388,7 @@ class Gemini_voiceChat(APIView):
         user_reference_number = request.data.get("user_reference_number", "")
         user_email = request.data.get("user_email", "")
         base64_audio = request.data.get("audio")
+        metering.bind(user_email=user_email, user_reference_number=user_reference_number)
 
         if not base64_audio:
             return Response({"error": "No audio data provided"}, status=400)
@@ -2465,7 +2424,9 @@ class Gemini_voiceChat(APIView):
             # response = client.generate_content()
             # model = genai.GenerativeModel(model_name="gemini-2.0-flash", generation_config=generation_config)
 
-            response = client.generate_content(chat_prompt)
+            with meter("gemini", "gemini-2.0-flash") as usage:
+                response = client.generate_content(chat_prompt)
+                usage.from_gemini(response)
 
             print(response, "--------------Audio Response from Gemini")
 
@@ -2487,13 +2448,13 @@ class Gemini_voiceChat(APIView):
                 audio_base64 = base64.b64encode(audio_file.read()).decode("utf-8")
 
             # Save API usage in the database
-            OpenaAI_UsageDB.objects.create(
+            write_behind.enqueue(OpenaAI_UsageDB(
                 user_reference_number=user_reference_number,
                 user_email=user_email,
                 prompt=base64_audio,
                 response=ai_response,
                 audio_base64=audio_base64
-            )
+            ))
 
             # Clean up temporary files
             os.remove(audio_path)
@@ -2514,15 +2475,8 @@ class Gemini_voiceChat(APIView):
 
 ####140425
 from google.cloud.speech import RecognitionAudio,RecognitionConfig
-import boto3
-from google.cloud import speech,texttospeech
+from google.cloud import texttospeech
 from rest_framework.parsers import JSONParser
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-    region_name=os.getenv("AWS_S3_REGION_NAME")
-)
 
 
 ####This is running perfect170425
@@ -2543,6 +2497,7 @@ class GeminiSmartAPIView(APIView):
         image_prompt = request.data.get("image_prompt")
         video_prompt = request.data.get("video_prompt")  # <--- NEW
         aspect_ratio = request.data.get("aspect_ratio", "16:9")  # optional
+        metering.bind(user_email=user_email, user_reference_number=user_reference_number)
 
         try:
             text_response = None
@@ -2553,10 +2508,7 @@ class GeminiSmartAPIView(APIView):
 
             # Check if chat_session_id is a valid UUID
             if chat_session_id:
-                try:
-                    chat_session = ChatSession.objects.get(session_id=UUID(chat_session_id))
-                except ChatSession.DoesNotExist:
-                    chat_session = None
+                chat_session, _turns = session_cache.get_transcript(UUID(chat_session_id))
             else:
                 chat_session = None
 
@@ -2597,6 +2549,8 @@ class GeminiSmartAPIView(APIView):
                 video_prompt=video_prompt,
                 video_response=video_response,
             )
+            if chat_session:
+                session_cache.append(chat_session, smart_response)
 
             return Response({
                 "id": smart_response.id,
@@ -2624,7 +2578,7 @@ class GeminiSmartAPIView(APIView):
 
     def transcribe_audio(self, base64_audio):
         audio_bytes = base64.b64decode(base64_audio)
-        client = speech.SpeechClient()
+        client = provider_endpoints.speech_client()
 
         audio = RecognitionAudio(content=audio_bytes)
         config = RecognitionConfig(
@@ -2633,7 +2587,9 @@ class GeminiSmartAPIView(APIView):
             language_code="en-US"
         )
 
-        response = client.recognize(config=config, audio=audio)
+        with meter("google", "speech-to-text") as usage:
+            response = client.recognize(config=config, audio=audio)
+            usage.add(audio_seconds=response.total_billed_time.total_seconds() if response.total_billed_time else 0)
 
         transcript = ""
         for result in response.results:
@@ -2642,7 +2598,7 @@ class GeminiSmartAPIView(APIView):
         return transcript.strip()
 
     def synthesize_speech_to_base64(self, text):
-        client = texttospeech.TextToSpeechClient()
+        client = provider_endpoints.text_to_speech_client()
 
         synthesis_input = texttospeech.SynthesisInput(text=text)
         voice = texttospeech.VoiceSelectionParams(
@@ -2653,58 +2609,53 @@ class GeminiSmartAPIView(APIView):
             audio_encoding=texttospeech.AudioEncoding.MP3
         )
 
-        response = client.synthesize_speech(
-            input=synthesis_input, voice=voice, audio_config=audio_config
-        )
+        with meter("google", "text-to-speech") as usage:
+            response = client.synthesize_speech(
+                input=synthesis_input, voice=voice, audio_config=audio_config
+            )
+            usage.add(characters=len(text))
 
         audio_base64 = base64.b64encode(response.audio_content).decode("utf-8")
         return audio_base64
 
     def generate_text(self, prompt):
         # Assume `client` is properly initialized and set up
-        response = genai_client.models.generate_content(
-            model='gemini-2.0-flash-001',
-            contents=[prompt]
-        )
+        with meter("gemini", "gemini-2.0-flash-001") as usage:
+            response = genai_client.models.generate_content(
+                model='gemini-2.0-flash-001',
+                contents=[prompt]
+            )
+            usage.from_gemini(response)
         return response.text.strip()
 
     def generate_image(self, prompt):
-        response = genai_client.models.generate_images(
-            model='imagen-3.0-generate-002',
-            prompt=prompt,
-            config=types.GenerateImagesConfig(
-                number_of_images=1,
-                include_rai_reason=True,
-                output_mime_type='image/jpeg',
-            ),
-        )
+        use_cache = image_cache.wants_cache(self.request.data)
+        cache_params = {"output_mime_type": "image/jpeg"}
+        cached = image_cache.lookup("gemini", "imagen-3.0-generate-002", prompt, cache_params) if use_cache else None
+        if cached:
+            return media_store.absolute_url(cached[0].url, baseurl(self.request))
+
+        with meter("gemini", "imagen-3.0-generate-002") as usage:
+            response = genai_client.models.generate_images(
+                model='imagen-3.0-generate-002',
+                prompt=prompt,
+                config=types.GenerateImagesConfig(
+                    number_of_images=1,
+                    include_rai_reason=True,
+                    output_mime_type='image/jpeg',
+                ),
+            )
+            usage.add(image_units=len(response.generated_images or []))
 
         if not response.generated_images:
             raise Exception("No image was generated by Gemini.")
-        #Extract the image bytes
-        image_base64 = response.generated_images[0].image.image_bytes
-        image_bytes = base64.b64decode(image_base64)
-        image = Image.open(BytesIO(image_bytes))
-        #Convert image to file like oobject
-        image_io = BytesIO()
-        image.save(image_io, format="JPEG")
-        image_io.seek(0)
-
-        filename = f"generated_images/{uuid.uuid4()}.jpg"
-
-        bucket = os.getenv("AWS_STORAGE_BUCKET_NAME")
-        region = os.getenv("AWS_S3_REGION_NAME")
-
-        s3.upload_fileobj(
-            image_io,
-            bucket,
-            filename,
-            ExtraArgs={'ContentType': 'image/jpeg'}
+        # Imagen already returns JPEG (output_mime_type), so the bytes are stored as they are
+        stored = media_store.put_image(
+            response.generated_images[0].image.image_bytes, "image/jpeg", prefix="generated_images", renditions=True,
         )
-
-        image_url = f"https://{bucket}.s3-{region}.amazonaws.com/{filename}"
-
-        return image_url
+        if use_cache:
+            image_cache.store("gemini", "imagen-3.0-generate-002", prompt, cache_params, [stored])
+        return media_store.absolute_url(stored.url, baseurl(self.request))
 
 
 class ChatHistoryAPI(APIView):
@@ -2719,31 +2670,30 @@ class ChatHistoryAPI(APIView):
         except ValueError:
             return Response({"error": "Invalid session_id format. Must be a valid UUID."}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            chat_session = ChatSession.objects.get(session_id=session_uuid)
-            responses = SmartResponse.objects.filter(chat_session=chat_session).order_by("created_at")
+        # One cache read; the transcript is loaded from the database only on a miss
+        chat_session, turns = session_cache.get_transcript(session_uuid)
+        if chat_session is None:
+            return Response({"error": "Chat session not found."}, status=status.HTTP_404_NOT_FOUND)
 
-            data = [
-                {
-                    "id" :resp.id,
-                    "user_reference_number" : resp.user_reference_number,
-                    "user_email" : resp.user_email,
-                    "text_prompt": resp.text,
-                    "text_response": resp.text_response,
-                    "audio": resp.audio,
-                    "audio_response": resp.audio_response,
-                    "image_prompt": resp.image_prompt,
-                    "image_response": resp.image_response,
-                    "video_prompt" : resp.video_prompt,
-                    "video_response" : resp.video_response,
-                    "created_at": resp.created_at,
-                }
-                for resp in responses
-            ]
+        data = [
+            {
+                "id" :resp["id"],
+                "user_reference_number" : resp["user_reference_number"],
+                "user_email" : resp["user_email"],
+                "text_prompt": resp["text"],
+                "text_response": resp["text_response"],
+                "audio": resp["audio"],
+                "audio_response": resp["audio_response"],
+                "image_prompt": resp["image_prompt"],
+                "image_response": resp["image_response"],
+                "video_prompt" : resp["video_prompt"],
+                "video_response" : resp["video_response"],
+                "created_at": resp["created_at"],
+            }
+            for resp in turns
+        ]
 
-            return Response({"session_id": session_id, "history": data})
-        except ChatSession.DoesNotExist:
-            return Response({"error": "Chat session not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"session_id": session_id, "history": data})
 
 
 #####Video generation # Replace the `GOOGLE_CLOUD_PROJECT` and `GOOGLE_CLOUD_LOCATION` values
@@ -2760,7 +2710,6 @@ from rest_framework import status
 from dotenv import load_dotenv
 from google import genai
 from google.genai.types import GenerateVideosConfig
-from google.cloud import storage
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -2772,8 +2721,9 @@ GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
 if not PROJECT_ID or not GCS_BUCKET_NAME:
     raise EnvironmentError("Environment variables missing (GOOGLE_CLOUD_PROJECT or GCS_BUCKET_NAME)")
 
-genai_veo_client = genai.Client(vertexai=True, project=PROJECT_ID, location=LOCATION)
-storage_client = storage.Client(project=PROJECT_ID)
+genai_veo_client = provider_endpoints.genai_client(vertexai=True, project=PROJECT_ID, location=LOCATION)
+VEO_POLL_INTERVAL = float(os.getenv("VEO_POLL_INTERVAL", "21"))
+storage_client = provider_endpoints.storage_client(project=PROJECT_ID)
 
 def parse_gcs_uri(uri):
     parsed = urlparse(uri)
@@ -2808,39 +2758,41 @@ class GenerateVideoAPI(APIView):
             output_prefix = f"gs://{GCS_BUCKET_NAME}/generated_videos/{int(time.time())}"
             logger.info(f"Starting video generation with prompt: {prompt}")
 
-            operation = genai_veo_client.models.generate_videos(
-                model="veo-2.0-generate-001",
-                prompt=prompt,
-                config=GenerateVideosConfig(
-                    aspect_ratio=aspect_ratio,
-                    output_gcs_uri=output_prefix,
-                    number_of_videos=1,
-                    duration_seconds=5,
-                ),
-            )
+            with meter("gemini", "veo-2.0-generate-001") as usage:
+                operation = genai_veo_client.models.generate_videos(
+                    model="veo-2.0-generate-001",
+                    prompt=prompt,
+                    config=GenerateVideosConfig(
+                        aspect_ratio=aspect_ratio,
+                        output_gcs_uri=output_prefix,
+                        number_of_videos=1,
+                        duration_seconds=5,
+                    ),
+                )
 
-            # Wait for the operation to complete
-            timeout = 900  # 15 mins
-            poll_interval = 21
-            start_time = time.time()
+                # Wait for the operation to complete
+                timeout = 900  # 15 mins
+                poll_interval = VEO_POLL_INTERVAL
+                start_time = time.time()
 
-            while True:
-                elapsed = time.time() - start_time
-                if elapsed > timeout:
-                    raise TimeoutError("Video generation timed out.")
+                while True:
+                    elapsed = time.time() - start_time
+                    if elapsed > timeout:
+                        raise TimeoutError("Video generation timed out.")
 
-                operation = genai_veo_client.operations.get(operation)
-                if operation.done:
-                    break
-                logger.info("Waiting for video generation to complete...")
-                time.sleep(poll_interval)
+                    operation = genai_veo_client.operations.get(operation)
+                    if operation.done:
+                        break
+                    logger.info("Waiting for video generation to complete...")
+                    time.sleep(poll_interval)
 
-            if operation.error:
-                raise RuntimeError(f"Generation failed: {operation.error}")
+                if operation.error:
+                    raise RuntimeError(f"Generation failed: {operation.error}")
 
-            videos = operation.result.generated_videos
-            if not videos:
-                raise RuntimeError("No videos returned in the result.")
+                videos = operation.result.generated_videos
+                if not videos:
+                    raise RuntimeError("No videos returned in the result.")
+                usage.add(video_seconds=5 * len(videos))
 
             video_uri = videos[0].video.uri
             logger.info(f"Generated video GCS URI: {video_uri}")
@@ -2897,14 +2849,25 @@ class AllSessionTitleAPI(APIView):
                 except ValueError:
                     return Response({"error": "Invalid session_id format. Must be a valid UUID."}, status=status.HTTP_400_BAD_REQUEST)
 
-                chat_session = ChatSession.objects.get(session_id=session_uuid)
-                query = SmartResponse.objects.filter(chat_session=chat_session).exclude(text__exact="", audio_transcript__exact="")
-                if user_reference_number:
-                    query = query.filter(user_reference_number=user_reference_number)
-                if user_email:
-                    query = query.filter(user_email=user_email)
-
-                title_data = get_title(query)
+                chat_session, turns = session_cache.get_transcript(session_uuid)
+                if chat_session is None:
+                    raise ChatSession.DoesNotExist
+                # Latest matching turn of the cached transcript, same filters as get_title's queryset
+                latest = next((
+                    turn for turn in reversed(turns)
+                    if not (turn["text"] == "" and turn["audio_transcript"] == "")
+                    and (not user_reference_number or turn["user_reference_number"] == user_reference_number)
+                    and (not user_email or turn["user_email"] == user_email)
+                ), None)
+                title_data = None
+                if latest:
+                    title = latest["text"] if latest["text"] else latest["audio_transcript"]
+                    title_data = {
+                        "session_id": str(chat_session.session_id),
+                        "user_reference_number": latest["user_reference_number"],
+                        "user_email": latest["user_email"],
+                        "title": title[:50] if title else "No title available."
+                    }
                 if not title_data:
                     return Response({"session_id": session_id, "title": "No matching prompt found."})
                 return Response(title_data)
@@ -2941,13 +2904,11 @@ class GenerateSmartContentAPI(APIView):
         user_email = request.data.get('user_email')
         user_reference_number = request.data.get('user_reference_number')
         aspect_ratio = request.data.get('aspect_ratio', '16:9')
+        metering.bind(user_email=user_email, user_reference_number=user_reference_number)
 
         # Generate or retrieve chat session
         session_id = request.data.get('chat_session_id')
-        if session_id:
-            chat_session, _ = ChatSession.objects.get_or_create(session_id=session_id)
-        else:
-            chat_session = ChatSession.objects.create(session_id=str(uuid.uuid4()))
+        chat_session = session_cache.get_or_create_session(session_id)
         try:
             # Initialize response holders
             text_response = None
@@ -3023,6 +2984,8 @@ class GenerateSmartContentAPI(APIView):
                 video_response=video_response,
                 user_image_url=user_image_url_input
             )
+            if chat_session:
+                session_cache.append(chat_session, smart_response)
 
             # Return response
             return Response({
@@ -3050,7 +3013,7 @@ class GenerateSmartContentAPI(APIView):
             return False
     def transcribe_audio(self, base64_audio):
         audio_bytes = base64.b64decode(base64_audio)
-        client = speech.SpeechClient()
+        client = provider_endpoints.speech_client()
         audio = RecognitionAudio(content=audio_bytes)
         config = RecognitionConfig(
             encoding=RecognitionConfig.AudioEncoding.MP3,
@@ -3058,7 +3021,9 @@ class GenerateSmartContentAPI(APIView):
             language_code="en-US"
         )
 
-        response = client.recognize(config=config, audio=audio)
+        with meter("google", "speech-to-text") as usage:
+            response = client.recognize(config=config, audio=audio)
+            usage.add(audio_seconds=response.total_billed_time.total_seconds() if response.total_billed_time else 0)
         transcript = ""
         for result in response.results:
             transcript += result.alternatives[0].transcript + " "
@@ -3066,7 +3031,7 @@ class GenerateSmartContentAPI(APIView):
         return transcript.strip()
 
     def synthesize_speech_to_base64(self, text):
-        client = texttospeech.TextToSpeechClient()
+        client = provider_endpoints.text_to_speech_client()
 
         synthesis_input = texttospeech.SynthesisInput(text=text)
         voice = texttospeech.VoiceSelectionParams(
@@ -3077,90 +3042,72 @@ class GenerateSmartContentAPI(APIView):
             audio_encoding=texttospeech.AudioEncoding.MP3
         )
 
-        response = client.synthesize_speech(
-            input=synthesis_input, voice=voice, audio_config=audio_config
-        )
+        with meter("google", "text-to-speech") as usage:
+            response = client.synthesize_speech(
+                input=synthesis_input, voice=voice, audio_config=audio_config
+            )
+            usage.add(characters=len(text))
 
         audio_base64 = base64.b64encode(response.audio_content).decode("utf-8")
         return audio_base64
 
     def generate_text(self, prompt):
-        response = genai_client.models.generate_content(
-            model='gemini-2.0-flash-001',
-            contents=[prompt]
-        )
+        with meter("gemini", "gemini-2.0-flash-001") as usage:
+            response = genai_client.models.generate_content(
+                model='gemini-2.0-flash-001',
+                contents=[prompt]
+            )
+            usage.from_gemini(response)
         return response.text.strip()
 
     def generate_image(self, prompt):
         print(prompt,"----++++++++++Image prompt")
-        response = genai_client.models.generate_images(
-            model='imagen-3.0-generate-002',
-            prompt=prompt,
-            config=types.GenerateImagesConfig(
-                number_of_images=1,
-                include_rai_reason=True,
-                output_mime_type='image/jpeg',
-            ),
-        )
+        use_cache = image_cache.wants_cache(self.request.data)
+        cache_params = {"output_mime_type": "image/jpeg"}
+        cached = image_cache.lookup("gemini", "imagen-3.0-generate-002", prompt, cache_params) if use_cache else None
+        if cached:
+            return media_store.absolute_url(cached[0].url, baseurl(self.request))
+
+        with meter("gemini", "imagen-3.0-generate-002") as usage:
+            response = genai_client.models.generate_images(
+                model='imagen-3.0-generate-002',
+                prompt=prompt,
+                config=types.GenerateImagesConfig(
+                    number_of_images=1,
+                    include_rai_reason=True,
+                    output_mime_type='image/jpeg',
+                ),
+            )
+            usage.add(image_units=len(response.generated_images or []))
         print(response,"-------------data response image ")
         if not response.generated_images:
             raise Exception("No image was generated by Gemini.")
-        # Extract the image bytes
-        image_base64 = response.generated_images[0].image.image_bytes
-        image_bytes = base64.b64decode(image_base64)
-        image = Image.open(BytesIO(image_bytes))
-        # Convert image to file like oobject
-        image_io = BytesIO()
-        image.save(image_io, format="JPEG")
-        image_io.seek(0)
-
-        filename = f"generated_images/{uuid.uuid4()}.jpg"
-
-        bucket = os.getenv("AWS_STORAGE_BUCKET_NAME")
-        region = os.getenv("AWS_S3_REGION_NAME")
-
-        s3.upload_fileobj(
-            image_io,
-            bucket,
-            filename,
-            ExtraArgs={'ContentType': 'image/jpeg'}
+        # Imagen already returns JPEG (output_mime_type), so the bytes are stored as they are
+        stored = media_store.put_image(
+            response.generated_images[0].image.image_bytes, "image/jpeg", prefix="generated_images", renditions=True,
         )
-
-        image_url = f"https://{bucket}.s3-{region}.amazonaws.com/{filename}"
-
-        return image_url
+        if use_cache:
+            image_cache.store("gemini", "imagen-3.0-generate-002", prompt, cache_params, [stored])
+        return media_store.absolute_url(stored.url, baseurl(self.request))
     def edit_image_with_gemini(self, image_file, edit_prompt, email, reference_number):
 
         image = Image.open(image_file)
         print(image,"=======within image fn")
-        response = genai_client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=[image, edit_prompt],
-            config=GenerateContentConfig(response_modalities=[Modality.TEXT, Modality.IMAGE]),
-        )
+        with meter("gemini", "gemini-2.0-flash-exp", user_email=email, user_reference_number=reference_number) as usage:
+            response = genai_client.models.generate_content(
+                model="gemini-2.0-flash-exp",
+                contents=[image, edit_prompt],
+                config=GenerateContentConfig(response_modalities=[Modality.TEXT, Modality.IMAGE]),
+            )
+            usage.from_gemini(response)
         # print(response,"---------response+++++++++++++WWWWWWWWWWWRRRRRRRRRRRRR")
         edited_image_url = None
         print(response.candidates[0],"-------------PARTTSTS")
         for part in response.candidates[0].content.parts:
             if part.inline_data:
-                edited_bytes = part.inline_data.data
-
-                image_bytes = base64.b64decode(edited_bytes)
-                image = Image.open(BytesIO(image_bytes))
-                # Convert image to file like oobject
-                image_io = BytesIO()
-                image.save(image_io, format="JPEG")
-                image_io.seek(0)
-
-                filename = f"edited_images/{uuid.uuid4()}.jpg"
-                print(filename,"---------finanalemm")
-                bucket = os.getenv("AWS_STORAGE_BUCKET_NAME")
-                print(bucket,"----BUCKET")
-                region = os.getenv("AWS_S3_REGION_NAME")
-                print(region,"-------region")
-
-                s3.upload_fileobj(image_io, bucket, filename, ExtraArgs={'ContentType': 'image/jpeg'})
-                edited_image_url = f"https://{bucket}.s3-{region}.amazonaws.com/{filename}"
+                # Transcoded only if Gemini returned something other than JPEG
+                stored = media_store.put_image(part.inline_data.data, "image/jpeg", prefix="edited_images", renditions=True)
+                edited_image_url = media_store.absolute_url(stored.url, baseurl(self.request))
 
         return edited_image_url
 
@@ -3181,6 +3128,7 @@ class DeleteChatHistoryAPI(APIView):
             chat_session = ChatSession.objects.get(session_id=session_uuid)
             deleted_count, _ = SmartResponse.objects.filter(chat_session=chat_session).delete()
             chat_session.delete()  # Optionally remove the session record too
+            session_cache.invalidate(session_uuid)
 
             return Response({
                 "message": f"Successfully deleted chat session and {deleted_count} associated messages.",
@@ -3209,51 +3157,22 @@ class SchedulingAgentAPIView(APIView):
             )
         
         try:
-            current_datetime = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            timezone = get_localzone_name()
-            
-            # Initialize the Gemini model
-            model = Gemini(id="gemini-2.0-flash")
-            
-            # Initialize GoogleCalendarTools
-            calendar_tools = GoogleCalendarTools()
-            
-            instructions = f"""
-            You are a helpful Google Calendar assistant. 
-            Current datetime: {current_datetime}
-            User's timezone: {timezone}
-            
-            You can help users with:
-            1. Creating calendar events with specific start/end times
-            2. Retrieving scheduled events
-            3. Answering questions about their calendar
-            
-            Always confirm the details before creating events and provide clear responses.
-            """
+            # Generate response using a warm agent of this user (model, calendar
+            # client and recent event listings are reused between requests)
+            response, metadata = scheduling_agent.run(user_email, message)
             
-            # Initialize the Agent with model, tools, and instructions
-            agent = Agent(
-                model=model,
-                tools=[calendar_tools],
-                instructions=instructions,
-                show_tool_calls=True
-            )
-            
-            # Generate response using the agent
-            response = agent.run(message)
-            
-            log_entry = SchedulingAssistantLog(
+            write_behind.enqueue(SchedulingAssistantLog(
                 message=message,
                 response=response
-            )
-            log_entry.save()
+            ))
             
             # Return the response
             return Response({
                 "status": status.HTTP_200_OK,
                 "user_reference_number": user_reference_number,
                 "user_email": user_email,
-                "response": response
+                "response": response,
+                "metadata": metadata
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
@@ -3261,3 +3180,12 @@ class SchedulingAgentAPIView(APIView):
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint (plain Django view: the text format isn't a DRF renderer)."""
+    if metrics.METRICS_TOKEN:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(supplied.encode("utf-8"), metrics.METRICS_TOKEN.encode("utf-8")):
+            return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
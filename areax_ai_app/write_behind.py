@@ -0,0 +1,301 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import serializers
+from django.db import DatabaseError, DataError, IntegrityError, models, router, transaction
+from django.db.models.signals import post_save
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from . import metrics
+from .background_tasks import PeriodicWorker
+from .db_tuning import sqlite_connection
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+##Write-behind for log rows the request doesn't hand back (chat history, usage
+##and scheduling logs, generated image records). enqueue() appends the row to
+##a local SQLite spool and returns; a flusher thread bulk_creates the spool in
+##batches. Spooled rows survive a crash and are replayed once their process
+##stops heartbeating (at least once: a crash between the insert and the spool
+##delete replays that batch). Until its row is flushed, the process that
+##enqueued it sees it through pending(). A row the database rejects (a
+##deleted parent, an over-long value) is moved to the spool's dead_letter
+##table, so it can't hold up the rows behind it.
+SPOOL_PATH = os.getenv("LOG_SPOOL_PATH", os.path.join(settings.BASE_DIR, "log_spool.sqlite3"))
+FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1"))
+FLUSH_BATCH_SIZE = int(os.getenv("LOG_FLUSH_BATCH_SIZE", "500"))
+MAX_PENDING = int(os.getenv("LOG_SPOOL_MAX_PENDING", "20000"))  # Past this, enqueue() saves inline
+OWNER_TTL = 60  # A flusher silent for this long is dead; its rows are anybody's
+LATE_SECONDS = 5  # Rows flushed later than this get their enqueue-time timestamps back
+
+_overlay = {}  # spool id -> unsaved instance this process enqueued and hasn't flushed yet
+_lock = threading.Lock()
+_process = {"pid": None, "owner": None, "ready": False}
+
+
+def _owner():
+    # Regenerated after a fork, so worker processes never share rows
+    if _process["pid"] != os.getpid():
+        _process.update(pid=os.getpid(), owner=f"{os.getpid()}-{uuid.uuid4().hex[:12]}", ready=False)
+    return _process["owner"]
+
+
+def _spool():
+    conn = sqlite_connection(SPOOL_PATH)
+    _owner()
+    if not _process["ready"]:
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, owner TEXT NOT NULL, payload TEXT NOT NULL,"
+            " claim TEXT, claimed_at REAL);"
+            "CREATE TABLE IF NOT EXISTS flushers (owner TEXT PRIMARY KEY, seen_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, spool_id INTEGER NOT NULL, payload TEXT NOT NULL,"
+            " error TEXT NOT NULL, failed_at REAL NOT NULL);"
+        )
+        # Announce this process before it spools anything, so nobody takes its rows
+        _heartbeat(conn, time.time())
+        _process["ready"] = True
+    return conn
+
+
+def _heartbeat(conn, now):
+    conn.execute(
+        "INSERT INTO flushers (owner, seen_at) VALUES (?, ?) "
+        "ON CONFLICT(owner) DO UPDATE SET seen_at = excluded.seen_at",
+        (_owner(), now),
+    )
+    conn.execute("DELETE FROM flushers WHERE seen_at < ?", (now - 10 * OWNER_TTL,))
+    conn.commit()
+
+
+def _stamp(instance):
+    # auto_now(_add) fields get the request's time, not the flush's
+    now = timezone.now()
+    for field in instance._meta.concrete_fields:
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False):
+            if getattr(instance, field.attname) is None:
+                setattr(instance, field.attname, now)
+
+
+def enqueue(instance):
+    """
+    Queues ``instance`` (an unsaved model instance) for a batched insert and
+    returns it, still without a pk. When the flusher is behind by MAX_PENDING
+    rows, or the spool can't be written, the row is saved right away instead.
+    """
+    _stamp(instance)
+    if len(_overlay) >= MAX_PENDING:
+        instance.save()
+        return instance
+    try:
+        conn = _spool()
+        cursor = conn.execute(
+            "INSERT INTO spool (owner, payload) VALUES (?, ?)",
+            (_owner(), serializers.serialize("json", [instance])),
+        )
+        conn.commit()
+    except sqlite3.Error:
+        logger.exception("Could not spool a %s row, saving it directly", instance._meta.label)
+        instance.save()
+        return instance
+    with _lock:
+        _overlay[cursor.lastrowid] = instance
+        backlog = len(_overlay)
+    if backlog >= FLUSH_BATCH_SIZE:
+        flusher.wake()
+    else:
+        flusher.start()
+    return instance
+
+
+def pending(model, **filters):
+    """
+    ``model`` rows this process enqueued that aren't in the database yet,
+    oldest first, matching ``filters`` (exact field values; a relation may
+    be given as an instance).
+    """
+    with _lock:
+        instances = [instance for instance in _overlay.values() if isinstance(instance, model)]
+    return [instance for instance in instances if all(
+        _matches(instance, name, value) for name, value in filters.items()
+    )]
+
+
+def _matches(instance, name, value):
+    field = instance._meta.get_field(name)
+    if field.is_relation and isinstance(value, models.Model):
+        value = value.pk
+    return getattr(instance, field.attname) == value
+
+
+def _claim(conn, now):
+    token = uuid.uuid4().hex
+    conn.execute(
+        "UPDATE spool SET claim = ?, claimed_at = ? WHERE id IN ("
+        " SELECT id FROM spool WHERE (claim IS NULL OR claimed_at < ?)"
+        " AND (owner = ? OR owner NOT IN (SELECT owner FROM flushers WHERE seen_at >= ?))"
+        " ORDER BY id LIMIT ?)",
+        (token, now, now - OWNER_TTL, _owner(), now - OWNER_TTL, FLUSH_BATCH_SIZE),
+    )
+    conn.commit()
+    return token, conn.execute("SELECT id, payload FROM spool WHERE claim = ? ORDER BY id", (token,)).fetchall()
+
+
+def _insert(model, instances):
+    late = time.time() - LATE_SECONDS
+    stamped = [
+        field for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    enqueued_at = [{field.attname: getattr(instance, field.attname) for field in stamped} for instance in instances]
+    model.objects.bulk_create(instances)  # pre_save re-stamps auto_now(_add) fields with the flush time
+    restore = []
+    for instance, values in zip(instances, enqueued_at):
+        if instance.pk is not None and any(value and value.timestamp() < late for value in values.values()):
+            for attname, value in values.items():
+                setattr(instance, attname, value)
+            restore.append(instance)
+    if restore:
+        # bulk_update doesn't call pre_save, so replayed rows keep their own time
+        model.objects.bulk_update(restore, [field.attname for field in stamped])
+
+
+def _announce(model, instances):
+    # bulk_create skips post_save; receivers such as the search index still need it
+    if not post_save.has_listeners(model):
+        return
+    using = router.db_for_write(model)
+    for instance in instances:
+        if instance.pk is None:
+            continue
+        try:
+            post_save.send(sender=model, instance=instance, created=True, update_fields=None, raw=False, using=using)
+        except Exception:
+            logger.exception("post_save receiver failed for flushed %s %s", model._meta.label, instance.pk)
+
+
+def _deserialize(payload):
+    return [deserialized.object for deserialized in serializers.deserialize("json", payload)]
+
+
+def _insert_all(instances):
+    by_model = defaultdict(list)
+    for instance in instances:
+        by_model[type(instance)].append(instance)
+    with transaction.atomic():
+        for model, group in by_model.items():
+            _insert(model, group)
+    return by_model
+
+
+def _done(conn, spool_ids):
+    conn.executemany("DELETE FROM spool WHERE id = ?", [(spool_id,) for spool_id in spool_ids])
+    conn.commit()
+    with _lock:
+        for spool_id in spool_ids:
+            _overlay.pop(spool_id, None)
+
+
+def _dead_letter(conn, spool_id, payload, error):
+    logger.error("Moving spooled row %s to the dead letter table: %s", spool_id, error)
+    conn.execute(
+        "INSERT INTO dead_letter (spool_id, payload, error, failed_at) VALUES (?, ?, ?, ?)",
+        (spool_id, payload, f"{type(error).__name__}: {error}"[:2000], time.time()),
+    )
+    _done(conn, [spool_id])
+
+
+def _flush_rows(conn, token, rows):
+    """Row by row fallback for a batch the database rejected: bad rows are dead-lettered, the rest inserted."""
+    for spool_id, payload in rows:
+        try:
+            # Fresh instances: the failed batch may have left rolled-back pks on the old ones
+            by_model = _insert_all(_deserialize(payload))
+        except (IntegrityError, DataError) as e:
+            _dead_letter(conn, spool_id, payload, e)
+            continue
+        except DatabaseError:
+            conn.execute("UPDATE spool SET claim = NULL, claimed_at = NULL WHERE claim = ?", (token,))
+            conn.commit()
+            raise
+        _done(conn, [spool_id])
+        for model, instances in by_model.items():
+            _announce(model, instances)
+
+
+def flush_batch():
+    """Inserts up to FLUSH_BATCH_SIZE spooled rows; returns how many were taken from the spool."""
+    conn = _spool()
+    now = time.time()
+    _heartbeat(conn, now)
+    token, rows = _claim(conn, now)
+    if not rows:
+        return 0
+
+    readable, instances = [], []
+    for spool_id, payload in rows:
+        try:
+            instances.extend(_deserialize(payload))
+        except serializers.base.DeserializationError as e:
+            _dead_letter(conn, spool_id, payload, e)
+            continue
+        readable.append((spool_id, payload))
+    try:
+        by_model = _insert_all(instances)
+    except (IntegrityError, DataError):
+        logger.warning("Batch of %d spooled rows was rejected, retrying row by row", len(readable))
+        _flush_rows(conn, token, readable)
+        return len(rows)
+    except DatabaseError:
+        # Transient (connection lost, locked): the whole batch stays spooled
+        conn.execute("UPDATE spool SET claim = NULL, claimed_at = NULL WHERE claim = ?", (token,))
+        conn.commit()
+        raise
+    _done(conn, [spool_id for spool_id, _payload in readable])
+    for model, group in by_model.items():
+        _announce(model, group)
+    return len(rows)
+
+
+def _tick():
+    try:
+        flushed = flush_batch()
+    except DatabaseError:
+        logger.exception("Flushing the log spool failed, retrying")
+        return FLUSH_INTERVAL * 5
+    return 0 if flushed >= FLUSH_BATCH_SIZE else FLUSH_INTERVAL
+
+
+def flush():
+    """Writes everything spooled so far on the calling thread; returns the number of rows."""
+    total = 0
+    while True:
+        flushed = flush_batch()
+        if not flushed:
+            return total
+        total += flushed
+
+
+def _flush_at_exit():
+    if not _overlay:
+        return
+    try:
+        flush()
+    except Exception:
+        # Still in the spool; replayed by the next process
+        logger.exception("Could not flush the log spool at exit")
+
+
+flusher = PeriodicWorker("areax-log-flusher", _tick, idle_interval=FLUSH_INTERVAL)
+atexit.register(_flush_at_exit)
+metrics.QUEUE_DEPTH.set_function(lambda: len(_overlay), "log_spool")
@@ -50,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'areax_ai_app.middleware.TracingMiddleware',  # First, so its total covers every other middleware
+    'areax_ai_app.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -58,6 +60,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware', #CorHeader Handle
+    'areax_ai_app.middleware.MeteringContextMiddleware',
 ]
 
 #CorHeader Handle
@@ -110,13 +113,72 @@ WSGI_APPLICATION = 'areax_ai_project.wsgi.application'
 #     }
 # }
 
-##23 sep
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+##Database backend: DB_ENGINE=sqlite (single node, WAL-tuned in
+##areax_ai_app.db_tuning), postgresql or mysql. Connections are kept open for
+##DB_CONN_MAX_AGE seconds and health-checked before reuse. Behind PgBouncer in
+##transaction pooling mode set DB_POOLER=pgbouncer (and DB_CONN_MAX_AGE=0 if
+##the pooler closes idle server connections).
+DB_ENGINE = config('DB_ENGINE', default='sqlite')
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=60, cast=int)
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME'),
+            'USER': config('DB_USER'),
+            'PASSWORD': config('DB_PASSWORD'),
+            'HOST': config('DB_HOST'),
+            'PORT': config('DB_PORT', default='5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # Server-side cursors don't survive transaction pooling
+            'DISABLE_SERVER_SIDE_CURSORS': config('DB_POOLER', default='') == 'pgbouncer',
+            'OPTIONS': {'connect_timeout': 5},
+        }
     }
-}
+elif DB_ENGINE == 'mysql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql',
+            'NAME': config('DB_NAME'),
+            'USER': config('DB_USER'),
+            'PASSWORD': config('DB_PASSWORD'),
+            'HOST': config('DB_HOST'),
+            'PORT': config('DB_PORT', default='3306'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'charset': 'utf8mb4',
+                'connect_timeout': 5,
+                'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                # Seconds a writer waits for the lock before "database is locked"
+                'timeout': config('SQLITE_BUSY_TIMEOUT_MS', default=5000, cast=int) / 1000,
+            },
+        }
+    }
+
+##Django's cache, shared by the worker processes: revoked logins are
+##published through it (areax_ai_app.authentication). A file cache covers
+##one host; with several hosts set CACHE_URL=redis://...
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': CACHE_URL}}
+else:
+    CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_DIR', default=str(BASE_DIR / 'django_cache')),
+    }}
 
 
 # Password validation
@@ -139,9 +201,11 @@ AUTH_PASSWORD_VALIDATORS = [
 
 
 REST_FRAMEWORK = {
+    # Same as DRF's Basic/Token authentication, with successful lookups cached
+    # for AUTH_CACHE_TTL seconds (see areax_ai_app.authentication)
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        'areax_ai_app.authentication.CachedBasicAuthentication',
+        'areax_ai_app.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
@@ -2,7 +2,14 @@ from django.contrib import admin
 from django.urls import path,include
 from django.conf import settings
 from django.conf.urls.static import static
+from areax_ai_app.views import metrics_view
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('ai/api/', include("areax_ai_app.urls")),
-]+static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('metrics', metrics_view, name="metrics"),
+]
+
+# Media is served by the web server / CDN (see areax_ai_app.media_store); the
+# Django file handler is only for local development.
+if settings.DEBUG:
+    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)